@@ -0,0 +1,79 @@
+"""Benchmark contour image rendering
+
+Compares rendering contour images event by event (with
+`scipy.ndimage.binary_erosion`, as done in DCTag <= 0.8.0) to
+rendering them in blocks with `dctag.gui.widget_vis.get_contour_images`.
+
+Usage::
+
+    python bench_contour_images.py [path/to/data.rtdc]
+"""
+import pathlib
+import sys
+import timeit
+
+import dclab
+import numpy as np
+from scipy.ndimage import binary_erosion
+
+from dctag.gui.widget_vis import get_contour_images
+
+
+def get_contour_image_erosion(image, mask):
+    """Reference implementation (one event at a time)"""
+    cellimg = np.copy(image)
+    cellimg = cellimg.reshape(cellimg.shape[0], cellimg.shape[1], 1)
+    cellimg = np.repeat(cellimg, 3, axis=2)
+    cellimg = np.clip(cellimg, 0, 255)
+    cellimg = np.require(cellimg, np.uint8, 'C')
+    cont = mask ^ binary_erosion(mask)
+    cellimg[cont, 0] = int(255 * .7)
+    cellimg[cont, 1] = 0
+    cellimg[cont, 2] = 0
+    return cellimg
+
+
+def main():
+    if len(sys.argv) > 1:
+        path = pathlib.Path(sys.argv[1])
+    else:
+        path = (pathlib.Path(__file__).parent.parent / "tests" / "data"
+                / "blood_rbc_leukocytes.rtdc")
+    with dclab.new_dataset(path) as ds:
+        images = ds["image"][:]
+        masks = ds["mask"][:]
+    # use at least 512 events
+    reps = int(np.ceil(512 / len(images)))
+    images = np.concatenate([images] * reps)
+    masks = np.concatenate([masks] * reps)
+    size = len(images)
+    print(f"Rendering {size} events of shape {images.shape[1:]}")
+
+    for ii in range(size):
+        assert np.all(get_contour_image_erosion(images[ii], masks[ii])
+                      == get_contour_images(images[ii:ii+1],
+                                            masks[ii:ii+1])[0])
+
+    def per_event():
+        for ii in range(size):
+            get_contour_image_erosion(images[ii], masks[ii])
+
+    results = {"per event (binary_erosion)": per_event}
+    for block_size in [1, 8, 32]:
+        out = np.empty((block_size,) + images.shape[1:] + (3,),
+                       dtype=np.uint8)
+
+        def blocks(block_size=block_size, out=out):
+            for ii in range(0, size, block_size):
+                get_contour_images(images[ii:ii+block_size],
+                                   masks[ii:ii+block_size],
+                                   out=out[:len(images[ii:ii+block_size])])
+        results[f"blocks of {block_size}"] = blocks
+
+    for name, func in results.items():
+        duration = min(timeit.repeat(func, number=1, repeat=5))
+        print(f"{name:30s} {duration / size * 1e6:8.1f} µs per event")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Benchmark displaying event images
+
+Compares displaying the channel image, the contour image and the
+cropped image with `pg.ImageView.setImage` (as done in DCTag <= 0.8.0)
+to `dctag.gui.widget_img.SimpleImageView.set_image_data`.
+
+Usage::
+
+    python bench_image_display.py
+"""
+import time
+
+import numpy as np
+import pyqtgraph as pg
+from PyQt5 import QtWidgets
+
+from dctag.gui.widget_img import SimpleImageView
+from dctag.gui.widget_vis import get_contour_images, get_cropped_image
+
+
+class OldImageView(pg.ImageView):
+    """SimpleImageView of DCTag <= 0.8.0"""
+
+    def __init__(self, *args, **kwargs):
+        super(OldImageView, self).__init__(*args, **kwargs)
+        self.ui.histogram.hide()
+        self.ui.roiBtn.hide()
+        self.ui.menuBtn.hide()
+
+
+def main():
+    app = QtWidgets.QApplication([])
+    pg.setConfigOption("imageAxisOrder", "row-major")
+    rng = np.random.default_rng(42)
+    size = 100
+
+    for shape in [(80, 250), (160, 500), (320, 1000)]:
+        images = rng.integers(0, 255, (size,) + shape, dtype=np.uint8)
+        masks = np.zeros((size,) + shape, dtype=bool)
+        masks[:, shape[0] // 4:shape[0] // 2, shape[1] // 5:shape[1] // 3] = 1
+        contours = get_contour_images(images, masks)
+        events = []
+        for ii in range(size):
+            cropped = get_cropped_image({"image": images[ii],
+                                         "pos_x_px": shape[1] // 2})
+            events.append((images[ii], contours[ii], cropped))
+
+        views_old = [OldImageView() for _ in range(3)]
+        views_new = [SimpleImageView() for _ in range(3)]
+        for view in views_old + views_new:
+            view.resize(400, 200)
+            view.show()
+
+        def show_old(image, contour, cropped):
+            views_old[0].setImage(image)
+            views_old[1].setImage(contour)
+            levels = (cropped.min(), cropped.max())
+            views_old[2].setImage(cropped, autoLevels=False, levels=levels)
+            # auto-contrast (`update_image_cropped`)
+            views_old[2].setImage(views_old[2].image, autoLevels=False,
+                                  levels=levels)
+
+        def show_new(image, contour, cropped):
+            # levels are computed in the prefetching threads
+            views_new[0].set_image_data(image, (image.min(), image.max()))
+            views_new[1].set_image_data(
+                contour, (contour[..., 0].min(), contour[..., 0].max()))
+            views_new[2].set_image_data(cropped,
+                                        (cropped.min(), cropped.max()))
+
+        for name, func in [("ImageView.setImage", show_old),
+                           ("set_image_data", show_new)]:
+            func(*events[0])
+            app.processEvents()
+            t0 = time.perf_counter()
+            for event in events:
+                func(*event)
+                # render the images
+                app.processEvents()
+            duration = (time.perf_counter() - t0) / size
+            print(f"{str(shape):12s} {name:20s} {duration * 1e3:6.2f} ms "
+                  + "per event")
+
+        for view in views_old + views_new:
+            view.close()
+            view.deleteLater()
+        app.processEvents()
+
+
+if __name__ == "__main__":
+    main()
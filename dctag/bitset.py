@@ -0,0 +1,125 @@
+"""Bitsets for fast lookup of events
+
+The bitsets are used by DCTag sessions to quickly find the next or
+previous unlabeled event, even if most of the events in a large
+dataset have already been labeled.
+"""
+import numpy as np
+
+
+class EventBitset:
+    def __init__(self, mask):
+        """Bitset with one bit per event
+
+        Parameters
+        ----------
+        mask: 1d boolean ndarray
+            Initial state of the bits (one item per event)
+
+        Notes
+        -----
+        The bits are stored in 64-bit words. Finding the next or
+        previous set bit involves checking only the current word
+        and then scanning the following words (in blocks of increasing
+        size) for a nonzero word, which is 64 times less work than
+        checking every event.
+        """
+        #: Number of events
+        self.size = len(mask)
+        #: Words (little-endian uint64) holding the bits
+        self.words = pack_bits(mask)
+
+    def __getitem__(self, index):
+        index = int(index)
+        return bool((int(self.words[index >> 6]) >> (index & 63)) & 1)
+
+    def count(self):
+        """Return the number of set bits"""
+        return int(np.sum(np.unpackbits(self.words.view(np.uint8))))
+
+    def find_next(self, start):
+        """Return the index of the first set bit at or after `start`
+
+        Returns -1 if there is no such bit.
+        """
+        start = max(int(start), 0)
+        if start >= self.size:
+            return -1
+        wi = start >> 6
+        word = int(self.words[wi]) >> (start & 63)
+        if word:
+            return start + _lowest_bit(word)
+        # scan the following words in blocks of increasing size
+        lo = wi + 1
+        block = 64
+        while lo < self.words.size:
+            nz = np.flatnonzero(self.words[lo:lo + block])
+            if nz.size:
+                wi = lo + nz[0]
+                return wi * 64 + _lowest_bit(int(self.words[wi]))
+            lo += block
+            block *= 8
+        return -1
+
+    def find_prev(self, start):
+        """Return the index of the last set bit at or before `start`
+
+        Returns -1 if there is no such bit.
+        """
+        start = min(int(start), self.size - 1)
+        if start < 0:
+            return -1
+        wi = start >> 6
+        word = int(self.words[wi]) & ((1 << ((start & 63) + 1)) - 1)
+        if word:
+            return wi * 64 + word.bit_length() - 1
+        # scan the preceding words in blocks of increasing size
+        hi = wi
+        block = 64
+        while hi > 0:
+            lo = max(0, hi - block)
+            nz = np.flatnonzero(self.words[lo:hi])
+            if nz.size:
+                wi = lo + nz[-1]
+                return wi * 64 + int(self.words[wi]).bit_length() - 1
+            hi = lo
+            block *= 8
+        return -1
+
+    def update(self, indices, values):
+        """Set the bits at `indices` to `values`
+
+        Parameters
+        ----------
+        indices: 1d ndarray of int
+            Event indices
+        values: bool or 1d boolean ndarray
+            New values of the bits (must be identical for
+            duplicate indices)
+        """
+        indices = np.atleast_1d(np.asarray(indices, dtype=np.int64))
+        if indices.size == 0:
+            return
+        values = np.broadcast_to(values, indices.shape)
+        # only unpack the affected words
+        wids = np.unique(indices >> 6)
+        bits = np.unpackbits(self.words[wids].view(np.uint8),
+                             bitorder="little").reshape(-1, 64)
+        rows = np.searchsorted(wids, indices >> 6)
+        bits[rows, indices & 63] = values
+        self.words[wids] = np.packbits(
+            bits, axis=1, bitorder="little").view("<u8").ravel()
+
+
+def pack_bits(mask):
+    """Pack a boolean array into little-endian uint64 words"""
+    mask = np.asarray(mask, dtype=bool)
+    nwords = (mask.size + 63) // 64
+    padded = np.zeros(nwords * 64, dtype=bool)
+    padded[:mask.size] = mask
+    return np.packbits(padded, bitorder="little").view("<u8").copy()
+
+
+def _lowest_bit(word):
+    """Return the position of the lowest set bit of a positive int"""
+    return (word & -word).bit_length() - 1
@@ -0,0 +1,179 @@
+"""Memory-bounded caches for event data
+
+The event data (images, contours, features) that DCTag displays are
+kept in a least-recently-used cache whose size is limited in bytes
+(not in number of entries), so that DCTag can make use of the memory
+that is actually available on a machine.
+"""
+import collections
+import os
+import sys
+import threading
+import weakref
+
+import numpy as np
+
+
+class SessionCache:
+    def __init__(self, max_bytes=None):
+        """Least-recently-used cache with a memory budget
+
+        Parameters
+        ----------
+        max_bytes: int
+            Memory budget of the cache in bytes; defaults to
+            the value returned by `get_default_cache_size`
+
+        Notes
+        -----
+        Entries are stored per session (see `get`, `put`). The
+        sessions themselves are not referenced by the cache and all
+        entries of a session are removed when it is garbage-collected.
+
+        This class is thread-safe.
+        """
+        #: Memory budget of the cache in bytes
+        self.max_bytes = max_bytes or get_default_cache_size()
+        #: Number of bytes currently used by the cache
+        self.nbytes = 0
+        #: Number of successful lookups
+        self.hits = 0
+        #: Number of failed lookups
+        self.misses = 0
+        self.lock = threading.Lock()
+        # ordered dictionary {key: (value, nbytes)}
+        self._data = collections.OrderedDict()
+        # identifiers of sessions we track with weakref.finalize
+        self._sessions = set()
+
+    def __contains__(self, key):
+        session, key = key
+        return (id(session), key) in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self, session=None):
+        """Remove all entries (of a `session`) from the cache"""
+        with self.lock:
+            if session is None:
+                self._data.clear()
+                self.nbytes = 0
+            else:
+                self._remove_session(id(session))
+
+    def get(self, key, default=None):
+        """Return the cached value for `key`
+
+        Parameters
+        ----------
+        key: tuple
+            Tuple of session and a hashable key that identifies
+            the entry within that session, e.g.
+            `(session, ("event", 10))`.
+        default:
+            Value returned if `key` is not in the cache
+        """
+        session, key = key
+        ikey = (id(session), key)
+        with self.lock:
+            if ikey in self._data:
+                self.hits += 1
+                self._data.move_to_end(ikey)
+                return self._data[ikey][0]
+            else:
+                self.misses += 1
+                return default
+
+    def info(self):
+        """Return a dictionary with cache statistics"""
+        with self.lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "entries": len(self._data),
+                    "nbytes": self.nbytes,
+                    "max_bytes": self.max_bytes,
+                    }
+
+    def put(self, key, value):
+        """Add `value` to the cache (see `get` for `key`)
+
+        Least-recently-used entries are evicted until the memory
+        budget is met. Values larger than the budget are not cached.
+        """
+        session, key = key
+        sid = id(session)
+        ikey = (sid, key)
+        size = get_nbytes(value)
+        with self.lock:
+            if ikey in self._data:
+                self.nbytes -= self._data.pop(ikey)[1]
+            if size > self.max_bytes:
+                return
+            if sid not in self._sessions:
+                self._sessions.add(sid)
+                weakref.finalize(session, self._remove_session_locked, sid)
+            self._data[ikey] = (value, size)
+            self.nbytes += size
+            self._evict()
+
+    def resize(self, max_bytes):
+        """Change the memory budget, evicting entries if necessary"""
+        with self.lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        """Remove least-recently-used entries until within budget"""
+        while self.nbytes > self.max_bytes:
+            _, (_, esize) = self._data.popitem(last=False)
+            self.nbytes -= esize
+
+    def _remove_session(self, sid):
+        for ikey in [ik for ik in self._data if ik[0] == sid]:
+            self.nbytes -= self._data.pop(ikey)[1]
+
+    def _remove_session_locked(self, sid):
+        with self.lock:
+            self._remove_session(sid)
+            self._sessions.discard(sid)
+
+
+def get_default_cache_size():
+    """Return the default memory budget for caches in bytes
+
+    This is 1/8 of the physical memory, but at least 256 MiB and at
+    most 8 GiB. If the physical memory cannot be determined, 512 MiB
+    are used.
+    """
+    try:
+        total = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        # e.g. Windows
+        return 512 * 1024**2
+    return int(np.clip(total // 8, 256 * 1024**2, 8 * 1024**3))
+
+
+def get_nbytes(value, _seen=None):
+    """Estimate the memory used by `value` in bytes
+
+    Arrays that are views are charged with the size of the array
+    that owns the memory. That array is only counted once in `value`
+    (e.g. an image and a cropped view of it).
+    """
+    if _seen is None:
+        _seen = set()
+    if isinstance(value, np.ndarray):
+        base = value
+        while isinstance(base.base, np.ndarray):
+            base = base.base
+        if id(base) in _seen:
+            return 0
+        _seen.add(id(base))
+        return base.nbytes
+    elif isinstance(value, dict):
+        return sum(get_nbytes(v, _seen) for v in value.values())
+    elif isinstance(value, (list, tuple)):
+        return sum(get_nbytes(v, _seen) for v in value)
+    else:
+        return sys.getsizeof(value)
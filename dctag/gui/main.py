@@ -25,6 +25,10 @@ pg.setConfigOption("imageAxisOrder", "row-major")
 
 
 class DCTag(QtWidgets.QMainWindow):
+    #: Emitted (from the session writer thread) after a session flush
+    #: with the exception that occurred (None on success)
+    session_flushed = QtCore.pyqtSignal(object)
+
     def __init__(self):
         super(DCTag, self).__init__()
 
@@ -99,13 +103,10 @@ class DCTag(QtWidgets.QMainWindow):
         self.raise_()
         self.activateWindow()
 
-        # flush session regularly
-        if bool(int(self.settings.value("debug/without timers", "0"))):
-            self.timer = None
-        else:
-            self.timer = QtCore.QTimer()
-            self.timer.timeout.connect(self.session_flush_statusbar)
-            self.timer.start(60000)
+        # flush session regularly in the background
+        self.autoflush = not bool(
+            int(self.settings.value("debug/without timers", "0")))
+        self.session_flushed.connect(self.on_session_flushed)
 
     def closeEvent(self, event):
         if self.session_close():
@@ -181,8 +182,17 @@ class DCTag(QtWidgets.QMainWindow):
 
     @QtCore.pyqtSlot()
     def on_action_flush(self):
+        """Flush the session, writing all changes to the file
+
+        The result is shown in the status bar.
+        """
         if self.session:
-            self.session.flush()
+            try:
+                self.session.flush()
+            except BaseException as e:
+                self.on_session_flushed(e)
+            else:
+                self.on_session_flushed(None)
 
     @QtCore.pyqtSlot()
     def on_action_open(self, path=None):
@@ -242,6 +252,19 @@ class DCTag(QtWidgets.QMainWindow):
                                           "Software",
                                           sw_text)
 
+    @QtCore.pyqtSlot(object)
+    def on_session_flushed(self, error=None):
+        """Show the result of a session flush in the status bar"""
+        date = time.strftime("%Y-%m-%d %H:%M:%S")
+        if error is not None:
+            self.statusBar().showMessage(
+                f"{date} Saving failed with {error.__class__.__name__}: "
+                + f"{error}")
+            self.statusBar().setStyleSheet("color: red")
+        else:
+            self.statusBar().showMessage(f"{date} Session flushed.", 3000)
+            self.statusBar().setStyleSheet("")
+
     @QtCore.pyqtSlot()
     def on_tab_changed(self):
         curtab = self.tabWidget.currentWidget()
@@ -269,24 +292,6 @@ class DCTag(QtWidgets.QMainWindow):
                 success = True
         return success
 
-    @QtCore.pyqtSlot()
-    def session_flush_statusbar(self):
-        """Flush the session, writing all changes to the file
-
-        If any errors occur, this is written to the status bar.
-        """
-        if self.session:
-            date = time.strftime("%Y-%m-%d %H:%M:%S")
-            try:
-                self.session.flush()
-            except BaseException as e:
-                self.statusBar().showMessage(
-                    f"{date} Saving failed with {e.__class__.__name__}: {e}")
-                self.statusBar().setStyleSheet("color: red")
-            else:
-                self.statusBar().showMessage(f"{date} Session flushed.", 3000)
-                self.statusBar().setStyleSheet("")
-
     def session_open(self, path_rtdc):
         """Load an .rtdc file into the user interface"""
         if self.session_close():
@@ -308,25 +313,44 @@ class DCTag(QtWidgets.QMainWindow):
                 )
                 cont = reply == QtWidgets.QMessageBox.Yes
             if cont:
-                try:
-                    self.session = session.DCTagSession(path=path_rtdc,
-                                                        user=user,
-                                                        linked_features=[])
-                except session.DCTagSessionWrongUserError as e:
-                    reply_claim = QtWidgets.QMessageBox.question(
-                        self,
-                        f"Claim this file from {e.olduser}?",
-                        f"This session is already claimed by {e.olduser}. "
-                        f"Do you wish to force-claim this session anyway?"
-                    )
-                    if reply_claim == QtWidgets.QMessageBox.Yes:
+                kwargs = {}
+                while self.session is None:
+                    try:
                         self.session = session.DCTagSession(path=path_rtdc,
                                                             user=user,
                                                             linked_features=[],
-                                                            override_user=True)
-                    else:
-                        # Don't do anything further here.
-                        return
+                                                            **kwargs)
+                    except session.DCTagSessionWrongUserError as e:
+                        reply_claim = QtWidgets.QMessageBox.question(
+                            self,
+                            f"Claim this file from {e.olduser}?",
+                            f"This session is already claimed by {e.olduser}. "
+                            f"Do you wish to force-claim this session anyway?"
+                        )
+                        if reply_claim == QtWidgets.QMessageBox.Yes:
+                            kwargs["override_user"] = True
+                        else:
+                            # Don't do anything further here.
+                            return
+                    except session.DCTagSessionLockedError:
+                        reply_recover = QtWidgets.QMessageBox.question(
+                            self,
+                            "Recover this session?",
+                            f"The file '{path_rtdc}' is locked. Either "
+                            + "somebody else is currently working on it or "
+                            + "DCTag exited unexpectedly in a previous run. "
+                            + "Do you wish to recover the previous session? "
+                            + "Only do this if you are sure that nobody else "
+                            + "is working on this file!"
+                        )
+                        if reply_recover == QtWidgets.QMessageBox.Yes:
+                            kwargs["recover"] = True
+                        else:
+                            # Don't do anything further here.
+                            return
+                if self.autoflush:
+                    self.session.start_writer(
+                        callback=self.session_flushed.emit)
                 # Go to session tab and update info
                 self.tabWidget.setCurrentIndex(0)
                 self.on_tab_changed()
@@ -32,6 +32,8 @@ class TabBinaryLabel(QtWidgets.QWidget):
             self.comboBox_score.addItem(flabel, feat)
 
         # signals
+        self.comboBox_score.currentIndexChanged.connect(
+            self.on_feature_changed)
         self.pushButton_start.clicked.connect(self.on_start)
         self.pushButton_next.clicked.connect(self.on_event_button)
         self.pushButton_prev.clicked.connect(self.on_event_button)
@@ -41,6 +43,11 @@ class TabBinaryLabel(QtWidgets.QWidget):
         self.pushButton_fast_prev.clicked.connect(self.on_event_button)
         self.toolButton_reset.clicked.connect(self.on_event_button)
         self.spinBox_jump_to.valueChanged.connect(self.on_jump_to)
+        self.widget_playback.advance.connect(self.on_playback_advance)
+        self.widget_playback.state_changed.connect(
+            self.on_playback_state_changed)
+        self.widget_vis.event_shown.connect(
+            self.widget_playback.on_event_shown)
 
         self.toolButton_reset.setIcon(self.style().standardIcon(
             QtWidgets.QStyle.SP_TrashIcon))
@@ -55,6 +62,7 @@ class TabBinaryLabel(QtWidgets.QWidget):
             [self.pushButton_prev, ["Left"]],
             [self.pushButton_fast_prev, ["Shift+Left"]],
             [self.pushButton_fast_next, ["Shift+Right"]],
+            [self.widget_playback.toolButton_play, ["Space"]],
         ]:
             for seq in shortcuts:
                 sc = QShortcut(QKeySequence(seq), self)
@@ -79,6 +87,7 @@ class TabBinaryLabel(QtWidgets.QWidget):
             self.event_index = 0
         if self.session:
             self.setEnabled(True)
+            self.on_feature_changed()
             self.spinBox_jump_to.setMaximum(self.session.event_count)
             self.goto_event(self.event_index)
         else:
@@ -136,13 +145,14 @@ class TabBinaryLabel(QtWidgets.QWidget):
 
         # update progress bar
         if self.feature:
-            fscores = self.session.scores_cache.get(self.feature, [])
-            num_rated = np.sum(~np.isnan(fscores))
+            counts = self.session.get_label_counts(self.feature)
+            num_rated = counts["labeled"]
             perc = int(np.floor(num_rated / self.session.event_count * 100))
             self.progressBar.setValue(perc)
 
         # visualization
-        self.widget_vis.set_event(self.session, index)
+        self.widget_vis.request_event(self.session, index,
+                                      label_features=self.feature)
 
     def lock_in(self):
         """Begin labeling"""
@@ -155,8 +165,34 @@ class TabBinaryLabel(QtWidgets.QWidget):
         label = scores.get_feature_label(self.feature)
         main.set_title(f"{self.feature[-3:].upper()}: {label}")
 
+    def label_event(self, value):
+        """Label the current event and go to the next event
+
+        The event currently shown is labeled, even if another event
+        has been requested but not rendered yet (e.g. fast key
+        presses). During playback, playback continues.
+
+        Parameters
+        ----------
+        value: bool or None
+            Label; None resets the label
+        """
+        if ((self.widget_playback.is_playing
+             or self.widget_vis.is_render_pending)
+                and self.widget_vis.event_index is not None):
+            index = self.widget_vis.event_index
+        else:
+            index = self.event_index
+        if value is None:
+            self.session.reset_score(self.feature, index)
+        else:
+            self.session.set_score(self.feature, index, value)
+        if not self.widget_playback.is_playing:
+            self.goto_event(index + 1)
+
     def lock_out(self):
         """Stop labeling"""
+        self.widget_playback.stop()
         self.pushButton_start.setVisible(True)
         self.comboBox_score.setEnabled(True)
         self.progressBar.setVisible(False)
@@ -170,31 +206,48 @@ class TabBinaryLabel(QtWidgets.QWidget):
         elif btn is self.pushButton_prev:
             self.goto_event(self.event_index - 1)
         elif btn is self.pushButton_no:
-            self.session.set_score(self.feature, self.event_index, False)
-            self.goto_event(self.event_index + 1)
+            self.label_event(False)
         elif btn is self.pushButton_yes:
-            self.session.set_score(self.feature, self.event_index, True)
-            self.goto_event(self.event_index + 1)
+            self.label_event(True)
         elif btn is self.pushButton_fast_prev:
-            for ii in range(1, self.event_index):
-                new_index = self.event_index - ii
-                if np.isnan(self.session.get_score(self.feature, new_index)):
-                    break
-            else:
-                new_index = 0
-            self.goto_event(new_index)
+            # previous unlabeled event (excluding the first)
+            new_index = self.session.find_unlabeled(
+                self.feature, self.event_index - 1, direction=-1)
+            self.goto_event(max(new_index, 0))
         elif btn is self.pushButton_fast_next:
             start = min(self.event_index + 1, self.session.event_count - 1)
-            for new_index in range(start, self.session.event_count):
-                if np.isnan(self.session.get_score(self.feature, new_index)):
-                    break
-            else:
+            new_index = self.session.find_unlabeled(self.feature, start)
+            if new_index < 0:
                 new_index = self.session.event_count - 1
             self.goto_event(new_index)
         elif btn is self.toolButton_reset:
-            self.session.reset_score(self.feature, self.event_index)
+            self.label_event(None)
+
+    @QtCore.pyqtSlot()
+    def on_feature_changed(self):
+        """Load the scores of the selected feature into the session cache"""
+        if self.session and self.feature:
+            self.session.load_scores([self.feature])
+
+    @QtCore.pyqtSlot()
+    def on_playback_advance(self):
+        if self.widget_vis.is_render_pending:
+            # Do not skip events the visualization could not show in
+            # time; the achieved frame rate drops instead.
+            return
+        elif self.event_index >= self.session.event_count - 1:
+            self.widget_playback.stop()
+        else:
             self.goto_event(self.event_index + 1)
 
+    @QtCore.pyqtSlot()
+    def on_playback_state_changed(self):
+        if self.widget_playback.is_playing:
+            self.widget_vis.frame_budget = \
+                self.widget_playback.get_frame_budget()
+        else:
+            self.widget_vis.frame_budget = None
+
     @QtCore.pyqtSlot(int)
     def on_jump_to(self, event_index):
         self.goto_event(event_index - 1)
@@ -127,6 +127,11 @@ class TabMultiClassLabel(QtWidgets.QWidget):
         self.pushButton_fast_prev.clicked.connect(self.on_event_button)
         self.toolButton_reset.clicked.connect(self.on_event_button)
         self.spinBox_jump_to.valueChanged.connect(self.on_jump_to)
+        self.widget_playback.advance.connect(self.on_playback_advance)
+        self.widget_playback.state_changed.connect(
+            self.on_playback_state_changed)
+        self.widget_vis.event_shown.connect(
+            self.widget_playback.on_event_shown)
 
         self.toolButton_reset.setIcon(self.style().standardIcon(
             QtWidgets.QStyle.SP_TrashIcon))
@@ -138,6 +143,7 @@ class TabMultiClassLabel(QtWidgets.QWidget):
             [self.pushButton_prev, ["Left"]],
             [self.pushButton_fast_prev, ["Shift+Left"]],
             [self.pushButton_fast_next, ["Shift+Right"]],
+            [self.widget_playback.toolButton_play, ["Space"]],
         ]:
             for seq in shortcuts:
                 sc = QShortcut(QKeySequence(seq), self)
@@ -188,16 +194,16 @@ class TabMultiClassLabel(QtWidgets.QWidget):
 
         # handle previous and next score labels
         if index != 0 and self.features:
-            candidates = self.session.get_scores_true(index - 1)
-            scs = [f for f in candidates if f in self.session.linked_features]
+            scs = self.session.get_scores_true(
+                index - 1, features=self.session.linked_features)
             label = " ".join([s[-3:] for s in scs]).upper() or "nan"
             self.label_score_prev.setText(label)
         else:
             self.label_score_prev.setText("")
 
         if index != self.session.event_count - 1 and self.features:
-            candidates = self.session.get_scores_true(index + 1)
-            scs = [f for f in candidates if f in self.session.linked_features]
+            scs = self.session.get_scores_true(
+                index + 1, features=self.session.linked_features)
             label = " ".join([s[-3:] for s in scs]).upper() or "nan"
             self.label_score_next.setText(label)
         else:
@@ -216,13 +222,14 @@ class TabMultiClassLabel(QtWidgets.QWidget):
 
         # update progress bar
         if self.features:
-            fscores = self.session.scores_cache.get(self.features[0], [])
-            num_rated = np.sum(~np.isnan(fscores))
+            counts = self.session.get_label_counts(self.features[0])
+            num_rated = counts["labeled"]
             perc = int(np.floor(num_rated / self.session.event_count * 100))
             self.progressBar.setValue(perc)
 
         # visualization
-        self.widget_vis.set_event(self.session, index)
+        self.widget_vis.request_event(self.session, index,
+                                      label_features=self.features)
 
     def lock_in(self):
         """Begin labeling"""
@@ -245,8 +252,36 @@ class TabMultiClassLabel(QtWidgets.QWidget):
             self.layout_label_buttons.addWidget(fbutton)
             self.label_buttons.append(fbutton)
 
+    def label_event(self, feature):
+        """Label the current event True for `feature` and go to the next
+
+        The event currently shown is labeled, even if another event
+        has been requested but not rendered yet (e.g. fast key
+        presses). During playback, playback continues.
+
+        Parameters
+        ----------
+        feature: str or None
+            Score feature; None resets the labels (of all
+            linked features)
+        """
+        if ((self.widget_playback.is_playing
+             or self.widget_vis.is_render_pending)
+                and self.widget_vis.event_index is not None):
+            index = self.widget_vis.event_index
+        else:
+            index = self.event_index
+        if feature is None:
+            # linked features will also be reset
+            self.session.reset_score(self.features[0], index)
+        else:
+            self.session.set_score(feature, index, True)
+        if not self.widget_playback.is_playing:
+            self.goto_event(index + 1)
+
     def lock_out(self):
         """Stop labeling"""
+        self.widget_playback.stop()
         self.pushButton_start.setVisible(True)
         self.comboBox_score.setEnabled(True)
         self.progressBar.setVisible(False)
@@ -260,32 +295,42 @@ class TabMultiClassLabel(QtWidgets.QWidget):
         elif btn is self.pushButton_prev:
             self.goto_event(self.event_index - 1)
         elif btn is self.pushButton_fast_prev:
-            for ii in range(1, self.event_index):
-                new_index = self.event_index - ii
-                curscores = self.session.get_scores_true(new_index)
-                if set(self.features).isdisjoint(set(curscores)):
-                    break
-            else:
-                new_index = 0
-            self.goto_event(new_index)
+            # previous event (excluding the first) without True label
+            new_index = self.session.find_unlabeled(
+                self.features, self.event_index - 1, direction=-1)
+            self.goto_event(max(new_index, 0))
         elif btn is self.pushButton_fast_next:
+            # next event without True label
             start = min(self.event_index + 1, self.session.event_count - 1)
-            for new_index in range(start, self.session.event_count):
-                curscores = self.session.get_scores_true(new_index)
-                if set(self.features).isdisjoint(set(curscores)):
-                    break
-            else:
+            new_index = self.session.find_unlabeled(self.features, start)
+            if new_index < 0:
                 new_index = self.session.event_count - 1
             self.goto_event(new_index)
         elif btn is self.toolButton_reset:
-            # linked features will also be reset
-            self.session.reset_score(self.features[0], self.event_index)
-            self.goto_event(self.event_index + 1)
+            self.label_event(None)
 
     @QtCore.pyqtSlot(str)
     def on_event_button_feature(self, feature):
-        self.session.set_score(feature, self.event_index, True)
-        self.goto_event(self.event_index + 1)
+        self.label_event(feature)
+
+    @QtCore.pyqtSlot()
+    def on_playback_advance(self):
+        if self.widget_vis.is_render_pending:
+            # Do not skip events the visualization could not show in
+            # time; the achieved frame rate drops instead.
+            return
+        elif self.event_index >= self.session.event_count - 1:
+            self.widget_playback.stop()
+        else:
+            self.goto_event(self.event_index + 1)
+
+    @QtCore.pyqtSlot()
+    def on_playback_state_changed(self):
+        if self.widget_playback.is_playing:
+            self.widget_vis.frame_budget = \
+                self.widget_playback.get_frame_budget()
+        else:
+            self.widget_vis.frame_budget = None
 
     @QtCore.pyqtSlot(int)
     def on_jump_to(self, event_index):
@@ -2,7 +2,7 @@ import importlib.resources
 
 from PyQt5 import QtWidgets, uic
 
-import dclab
+from .. import scores
 
 
 class TabSessionInfo(QtWidgets.QWidget):
@@ -20,14 +20,29 @@ class TabSessionInfo(QtWidgets.QWidget):
         if not session:
             user = ""
             logs = "No session."
+            counts = ""
         else:
             user = session.user
-            with session.score_lock:
-                try:
-                    with dclab.new_dataset(session.path) as ds:
-                        logs = "\n".join(ds.logs["dctag-history"])
-                except BaseException:
-                    logs = f"Cannot get logs from '{session.path}'!"
+            try:
+                with session.get_dataset() as ds:
+                    logs = "\n".join(ds.logs["dctag-history"])
+            except BaseException:
+                logs = f"Cannot get logs from '{session.path}'!"
+                counts = ""
+            else:
+                counts = self.get_label_counts_text(session)
         self.plainTextEdit_logs.setPlainText(logs)
         self.label_username.setText(user)
         self.label_num_sessions.setText(f"{logs.count('new session')}")
+        self.label_label_counts.setText(counts)
+
+    @staticmethod
+    def get_label_counts_text(session):
+        """Return one line of True/False/unset counts per score feature"""
+        lines = []
+        for feat in session.get_score_features():
+            counts = session.get_label_counts(feat)
+            lines.append(f"{scores.get_feature_label(feat)}: "
+                         f"{counts['true']} yes, {counts['false']} no, "
+                         f"{counts['unset']} unset")
+        return "\n".join(lines)
@@ -11,9 +11,37 @@ class SimpleImageView(pg.ImageView):
         self.ui.histogram.hide()
         self.ui.roiBtn.hide()
         self.ui.menuBtn.hide()
+        # The histogram is hidden, so there is no need to compute it
+        # whenever the image changes.
+        self.imageItem.sigImageChanged.disconnect(
+            self.ui.histogram.imageChanged)
         # disable keyboard shortcuts
         self.keyPressEvent = lambda _: None
         self.keyReleaseEvent = lambda _: None
 
     def getViewBox(self):
         return self.getPlotItem().getViewBox()
+
+    def set_image_data(self, image, levels):
+        """Display `image` with the given `levels`
+
+        This is a fast alternative to `setImage` for frequently changing
+        images. The image is passed directly to the ImageItem (no
+        normalization, no level or histogram computation). The view
+        range is only reset if the image shape changed.
+
+        Parameters
+        ----------
+        image: 2d or 3d (RGB) ndarray
+            Image data
+        levels: tuple of (min, max) or 2d ndarray
+            Black and white levels; for RGB images, this may also
+            be an array of shape (3, 2) with levels for each channel
+        """
+        if self.image is None or self.image.shape != image.shape:
+            # let pyqtgraph set up the axes and the view range
+            self.setImage(image, autoLevels=False)
+        else:
+            self.image = image
+            self.imageDisp = image
+        self.imageItem.setImage(image, autoLevels=False, levels=levels)
@@ -0,0 +1,102 @@
+import collections
+import time
+
+from PyQt5 import QtCore, QtWidgets
+
+
+class WidgetPlayback(QtWidgets.QWidget):
+    """Controls for automatically advancing through events (playback)
+
+    While playing, `advance` is emitted at the rate (events per
+    second) set in the spin box. The achieved frame rate is shown
+    next to the controls; it is computed from the events actually
+    shown (see `on_event_shown`), which may be fewer than requested
+    if the visualization cannot keep up.
+    """
+    #: Emitted when the next event should be shown
+    advance = QtCore.pyqtSignal()
+    #: Emitted when playback is started or stopped or the rate changed
+    state_changed = QtCore.pyqtSignal()
+
+    def __init__(self, *args, **kwargs):
+        super(WidgetPlayback, self).__init__(*args, **kwargs)
+
+        layout = QtWidgets.QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.toolButton_play = QtWidgets.QToolButton(self)
+        self.toolButton_play.setCheckable(True)
+        self.toolButton_play.setToolTip("Play/pause events")
+        layout.addWidget(self.toolButton_play)
+        self.spinBox_rate = QtWidgets.QSpinBox(self)
+        self.spinBox_rate.setRange(1, 60)
+        self.spinBox_rate.setValue(20)
+        self.spinBox_rate.setSuffix(" ev/s")
+        self.spinBox_rate.setToolTip("Playback rate (events per second)")
+        layout.addWidget(self.spinBox_rate)
+        self.label_fps = QtWidgets.QLabel(self)
+        self.label_fps.setToolTip("Events shown per second")
+        layout.addWidget(self.label_fps)
+
+        #: achieved frame rate (events shown per second) or None
+        self.fps = None
+        # times at which the last events were shown
+        self._shown_times = collections.deque(maxlen=30)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setTimerType(QtCore.Qt.TimerType.PreciseTimer)
+        self.timer.timeout.connect(self.advance)
+
+        self.toolButton_play.toggled.connect(self.on_play_toggled)
+        self.spinBox_rate.valueChanged.connect(self.on_rate_changed)
+        self.update_play_icon()
+
+    @property
+    def is_playing(self):
+        return self.timer.isActive()
+
+    def get_frame_budget(self):
+        """Return the time available for showing one event [s]"""
+        return 1 / self.spinBox_rate.value()
+
+    @QtCore.pyqtSlot(int)
+    def on_event_shown(self, event_index):
+        """Keep track of the achieved frame rate"""
+        if not self.is_playing:
+            return
+        self._shown_times.append(time.perf_counter())
+        if len(self._shown_times) > 1:
+            duration = self._shown_times[-1] - self._shown_times[0]
+            if duration > 0:
+                self.fps = (len(self._shown_times) - 1) / duration
+                self.label_fps.setText(f"{self.fps:.0f} fps")
+
+    @QtCore.pyqtSlot(bool)
+    def on_play_toggled(self, playing):
+        self._shown_times.clear()
+        self.fps = None
+        self.label_fps.setText("")
+        if playing:
+            self.timer.start(int(round(1000 * self.get_frame_budget())))
+        else:
+            self.timer.stop()
+        self.update_play_icon()
+        self.state_changed.emit()
+
+    @QtCore.pyqtSlot()
+    def on_rate_changed(self):
+        self._shown_times.clear()
+        self.timer.setInterval(int(round(1000 * self.get_frame_budget())))
+        self.state_changed.emit()
+
+    def stop(self):
+        """Stop playback"""
+        self.toolButton_play.setChecked(False)
+
+    def toggle(self):
+        """Start or stop playback"""
+        self.toolButton_play.toggle()
+
+    def update_play_icon(self):
+        icon = (QtWidgets.QStyle.SP_MediaPause if self.is_playing
+                else QtWidgets.QStyle.SP_MediaPlay)
+        self.toolButton_play.setIcon(self.style().standardIcon(icon))
@@ -1,3 +1,7 @@
+import functools
+
+import numpy as np
+from PyQt5 import QtCore
 import pyqtgraph as pg
 
 
@@ -33,25 +37,128 @@ class SimplePlotItem(pg.PlotItem):
         self.hideButtons()
 
 
+class BrushViewBox(pg.ViewBox):
+    """ViewBox that supports selecting a region with the mouse (brushing)
+
+    A rectangular region is selected by dragging with the left mouse
+    button while holding the Shift key. The region is emitted in data
+    coordinates via `sigBrushed`.
+    """
+    sigBrushed = QtCore.pyqtSignal(object)
+
+    def mouseDragEvent(self, ev, axis=None):
+        if (ev.button() == QtCore.Qt.MouseButton.LeftButton
+                and ev.modifiers() & QtCore.Qt.KeyboardModifier.ShiftModifier):
+            ev.accept()
+            if ev.isFinish():
+                self.rbScaleBox.hide()
+                rect = QtCore.QRectF(pg.Point(ev.buttonDownPos(ev.button())),
+                                     pg.Point(ev.pos()))
+                rect = self.childGroup.mapRectFromParent(rect)
+                self.sigBrushed.emit(rect.normalized())
+            else:
+                self.updateScaleBox(ev.buttonDownPos(), ev.pos())
+        else:
+            super(BrushViewBox, self).mouseDragEvent(ev, axis=axis)
+
+
 class ScatterPlotWidget(pg.PlotWidget):
     """Custom class for data visualization in DCTag
     """
+    #: Emitted with a boolean array identifying the scatter points
+    #: in the region selected by the user (see `BrushViewBox`)
+    brushed = QtCore.pyqtSignal(object)
 
     def __init__(self, parent=None, background='w', **kargs):
-        plot_item = SimplePlotItem(**kargs)
+        plot_item = SimplePlotItem(viewBox=BrushViewBox(), **kargs)
         super(ScatterPlotWidget, self).__init__(parent,
                                                 background=background,
                                                 plotItem=plot_item)
 
+        #: density image of all events (see `set_density`)
+        self.density = pg.ImageItem()
+        self.density.hide()
+        self.addItem(self.density)
         self.scatter = RTDCScatterPlot()
         self.addItem(self.scatter)
+        #: highlighted scatter points (see `set_highlight`); these are
+        #: drawn as outlines, because the points are colored by label
+        self.highlight = pg.ScatterPlotItem(size=6, symbol="s",
+                                            pen=pg.mkPen("#FFB300"),
+                                            brush=None)
+        self.addItem(self.highlight)
         self.select = pg.PlotDataItem(x=[1], y=[2], symbol="o",
                                       symbolBrush="red")
         self.select.hide()
         self.addItem(self.select)
+        #: x and y data of the scatter plot
+        self.scatter_data = (np.arange(10), np.arange(10))
+
+        self.getViewBox().sigBrushed.connect(self.on_brushed)
+
+    @QtCore.pyqtSlot(object)
+    def on_brushed(self, rect):
+        """Emit `brushed` for the scatter points within `rect`"""
+        x, y = self.scatter_data
+        mask = ((x >= rect.left()) & (x <= rect.right())
+                & (y >= rect.top()) & (y <= rect.bottom()))
+        self.brushed.emit(mask)
+
+    def set_density(self, image, rect):
+        """Set the density image
+
+        Parameters
+        ----------
+        image: 2d ndarray
+            Log-scaled event density (rows are y bins, columns are
+            x bins); zero values are transparent
+        rect: tuple
+            Data region (x, y, width, height) covered by `image`
+        """
+        levels = (0, max(float(image.max()), 1e-6))
+        self.density.setImage(image, autoLevels=False, levels=levels,
+                              lut=get_density_lut())
+        self.density.setRect(QtCore.QRectF(*rect))
+
+    def set_density_mode(self, enabled):
+        """Show the density image instead of the scatter points"""
+        self.density.setVisible(enabled)
+        self.scatter.setVisible(not enabled)
+
+    def set_highlight(self, mask=None):
+        """Highlight the scatter points where `mask` is True"""
+        if mask is None or not np.any(mask):
+            self.highlight.clear()
+        else:
+            x, y = self.scatter_data
+            self.highlight.setData(x[mask], y[mask])
+
+    def set_scatter_brushes(self, brushes, positions=None):
+        """Set the brushes of the scatter points
+
+        Parameters
+        ----------
+        brushes: list or 1d object ndarray of QtGui.QBrush
+            Brushes of all scatter points or, if `positions` is
+            given, only of the points at `positions`
+        positions: 1d ndarray of int
+            Indices of the scatter points to update; only the style
+            of these points is recomputed by pyqtgraph, which is
+            much faster than setting the brushes of all points.
+        """
+        if positions is None:
+            self.scatter.setBrush(list(brushes))
+        else:
+            data = self.scatter.data
+            data["brush"][positions] = brushes
+            # invalidate the cached symbols of these points
+            data["sourceRect"][positions] = 0
+            self.scatter.updateSpots()
 
     def set_scatter(self, x, y):
+        self.scatter_data = (np.asarray(x), np.asarray(y))
         self.scatter.setData(x, y)
+        self.highlight.clear()
 
     def set_event(self, x, y):
         self.select.show()
@@ -71,3 +178,14 @@ class RTDCScatterPlot(pg.ScatterPlotItem):
                                               *args,
                                               **kwargs)
         self.setData(x=range(10), y=range(10), brush=brush)
+
+
+@functools.lru_cache(maxsize=1)
+def get_density_lut():
+    """Return the lookup table for density images (viridis)
+
+    The first entry is transparent, so that empty bins are not drawn.
+    """
+    lut = pg.colormap.get("viridis").getLookupTable(nPts=256, alpha=True)
+    lut[0] = 0
+    return lut
@@ -1,11 +1,15 @@
+import concurrent.futures
 import functools
 import importlib.resources
+import math
+import time
 
 import dclab
 import numpy as np
 from PyQt5 import QtCore, QtWidgets, uic
 import pyqtgraph as pg
-from scipy.ndimage import binary_erosion
+
+from ..cache import SessionCache
 
 
 #: dictionary with default axes limits for these features
@@ -26,8 +30,56 @@ SCATTER_FEAT = [
 ]
 
 
+#: number of events shown in the scatter plots (see `get_scatter_indices`)
+SCATTER_SAMPLES = 10000
+
+#: number of x and y bins of the density images (see `get_density_image`)
+DENSITY_BINS = (200, 200)
+
+#: number of events processed at once when computing density images
+DENSITY_CHUNK_SIZE = 1_000_000
+
+#: scatter plot point colors for unset, False, and True labels
+SCATTER_COLORS_BINARY = ["#000000", "#D62728", "#2CA02C"]
+
+#: scatter plot point colors for events without a True label and for
+#: the classes (features) in multi-label mode (repeated if necessary)
+SCATTER_COLORS_CLASSES = ["#000000", "#1F77B4", "#FF7F0E", "#2CA02C",
+                          "#D62728", "#9467BD", "#8C564B", "#E377C2",
+                          "#7F7F7F", "#BCBD22", "#17BECF"]
+
+#: minimum and maximum number of events prefetched in navigation direction
+PREFETCH_DEPTH = [2, 16]
+
+#: maximum number of consecutive events loaded in one prefetch job
+PREFETCH_BLOCK_SIZE = 8
+
+#: thread pool for prefetching events (see `WidgetVisualize.prefetch_events`)
+PREFETCH_POOL = concurrent.futures.ThreadPoolExecutor(
+    max_workers=2, thread_name_prefix="DCTagPrefetch")
+
+#: memory-bounded cache for event data shared by all visualization widgets
+EVENT_CACHE = SessionCache()
+
+#: minimum number of events read at once for scalar features (the
+#: actual block size is a multiple of the HDF5 chunk size)
+FEATURE_BLOCK_SIZE = 65536
+
+#: default memory budget of `FEATURE_CACHE` in bytes (can be changed
+#: with the "cache/feature data size" setting)
+FEATURE_CACHE_SIZE = 256 * 1024**2
+
+#: memory-bounded cache for blocks of scalar feature data
+FEATURE_CACHE = SessionCache(max_bytes=FEATURE_CACHE_SIZE)
+
+
 class WidgetVisualize(QtWidgets.QWidget):
     """Widget for visualizing data"""
+    #: Emitted (from a worker thread) with the index of an event
+    #: requested via `request_event` once its data are loaded
+    event_loaded = QtCore.pyqtSignal(int)
+    #: Emitted with the event index after an event has been shown
+    event_shown = QtCore.pyqtSignal(int)
 
     def __init__(self, *args, **kwargs):
         super(WidgetVisualize, self).__init__(*args, **kwargs)
@@ -36,7 +88,40 @@ class WidgetVisualize(QtWidgets.QWidget):
         with importlib.resources.as_file(ref) as path_ui:
             uic.loadUi(path_ui, self)
 
+        feature_cache_size = QtCore.QSettings().value(
+            "cache/feature data size", None)
+        if feature_cache_size:
+            FEATURE_CACHE.resize(int(feature_cache_size))
+
         self.session = None
+        #: index of the event currently shown
+        self.event_index = None
+        #: dictionary of prefetch futures (keys are event indices)
+        self.prefetch_futures = {}
+        #: average time it takes to load an event [s]
+        self.load_time = None
+        #: average time between the user navigating to events [s]
+        self.navigation_interval = None
+        # time when `set_event` was last called
+        self._navigation_time = None
+        #: time available for showing one event (e.g. during playback)
+        #: [s]; if rendering takes longer, the fluorescence traces are
+        #: not shown
+        self.frame_budget = None
+        #: average time it takes to show an event without traces [s]
+        self.render_time = None
+        #: average time it takes to show the fluorescence traces [s]
+        self.trace_render_time = None
+        # minimum and maximum of the cropped image (auto-contrast)
+        self._image_cropped_auto_levels = None
+        # latest event requested with `request_event` that has not been
+        # shown yet (tuple of session, event index, label features)
+        self._requested_event = None
+        self._render_timer = QtCore.QTimer(self)
+        self._render_timer.setSingleShot(True)
+        self._render_timer.setInterval(0)
+        self._render_timer.timeout.connect(self.render_requested_event)
+        self.event_loaded.connect(self.on_event_loaded)
 
         self.scatter_plots = [self.scatter_1, self.scatter_2, self.scatter_3,
                               self.scatter_4]
@@ -54,12 +139,27 @@ class WidgetVisualize(QtWidgets.QWidget):
         self.legend_trace = self.widget_trace.addLegend(
             offset=(+.001, -.001), labelTextSize='7pt', colCount=1)
 
-        self.trace_plot_legends = {}
+        # trace keys currently shown (see `set_fluorescence_traces`)
+        self._trace_keys_shown = None
 
         for key in self.trace_plots:
             self.widget_trace.addItem(self.trace_plots[key])
+            # only draw as many points as there are pixels
+            self.trace_plots[key].setDownsampling(auto=True, method="peak")
+            self.trace_plots[key].setClipToView(True)
             self.trace_plots[key].hide()
 
+        #: boolean array identifying the events in `scatter_indices`
+        #: selected by the user in one of the scatter plots
+        self.scatter_selection = None
+        #: label states of the events in `scatter_indices` (see
+        #: `update_scatter_labels`)
+        self.scatter_states = None
+        # features used for computing `self.scatter_states`
+        self._scatter_label_features = None
+        for plot in self.scatter_plots:
+            plot.brushed.connect(self.on_scatter_brushed)
+
         # linked axes
         for ii, plota in enumerate(self.scatter_plots):
             vba = plota.getViewBox()
@@ -72,6 +172,7 @@ class WidgetVisualize(QtWidgets.QWidget):
                         vba.linkView(vba.YAxis, vbb)
 
         # signals
+        self.checkBox_density.toggled.connect(self.update_density_mode)
         self.checkBox_auto_contrast.stateChanged.connect(
             self.update_image_cropped)
         self.spinBox_contrast_max.valueChanged.connect(
@@ -81,9 +182,22 @@ class WidgetVisualize(QtWidgets.QWidget):
 
     def reset(self, reset_plots=False):
         """Clear current visualization"""
-        # clear the event image cache
-        self.get_event_data.cache_clear()
-        self.get_feature_data.cache_clear()
+        # drop requested events
+        self._requested_event = None
+        self._render_timer.stop()
+        # cancel prefetching and wait for running jobs
+        self.prefetch_cancel()
+        self.event_index = None
+        self._navigation_time = None
+        # The event cache is shared with other widgets; only remove
+        # the data of sessions that have been closed.
+        if self.session is not None and not self.session:
+            EVENT_CACHE.clear(self.session)
+            FEATURE_CACHE.clear(self.session)
+        self.scatter_selection = None
+        self.scatter_states = None
+        self._scatter_label_features = None
+        self._trace_keys_shown = None
         # UI
         self.setEnabled(False)
         self.groupBox_event.setTitle("Event")
@@ -98,26 +212,411 @@ class WidgetVisualize(QtWidgets.QWidget):
                 self.widget_trace.update()
             for plot in self.scatter_plots:
                 plot.set_scatter(np.arange(10), np.arange(10))
+                plot.density.clear()
+
+    def get_feature_block(self, session, feature, block_index):
+        """Return one block of scalar feature data (cached)
+
+        The block covers the events starting at `block_index` times
+        the block size (see `get_feature_block_size`).
+        """
+        key = (session, ("feature", feature, block_index))
+        block = FEATURE_CACHE.get(key)
+        if block is None:
+            size = self.get_feature_block_size(session, feature)
+            start = block_index * size
+            with session.get_dataset() as ds:
+                block = np.asarray(ds[feature][start:start + size])
+            FEATURE_CACHE.put(key, block)
+        return block
+
+    def get_feature_block_size(self, session, feature):
+        """Return the number of events in one block of feature data
+
+        This is the smallest multiple of the HDF5 chunk size of the
+        feature that is at least `FEATURE_BLOCK_SIZE`, so that reading
+        a block does not decompress chunks partially.
+        """
+        key = (session, ("feature block size", feature))
+        size = EVENT_CACHE.get(key)
+        if size is None:
+            with session.get_dataset() as ds:
+                h5ds = getattr(ds[feature], "h5ds", None)
+                chunks = getattr(h5ds, "chunks", None)
+            chunk = chunks[0] if chunks else 1
+            size = chunk * math.ceil(FEATURE_BLOCK_SIZE / chunk)
+            EVENT_CACHE.put(key, size)
+        return size
+
+    def get_feature_data(self, session, feature, indices=None):
+        """Return the data of a scalar feature
+
+        Parameters
+        ----------
+        session: dctag.session.DCTagSession
+            Labeling session
+        feature: str
+            Scalar feature name
+        indices: int, slice, or 1d ndarray of int
+            Event indices; defaults to all events
+
+        Notes
+        -----
+        The feature data are read in blocks (see `get_feature_block`)
+        which are kept in `FEATURE_CACHE`, so only the blocks covering
+        `indices` are read and the memory used is bounded.
+        """
+        if indices is None:
+            indices = slice(None)
+        if isinstance(indices, slice):
+            idx = np.arange(*indices.indices(session.event_count))
+        else:
+            idx = np.asarray(indices)
+            if idx.ndim == 0:
+                return self.get_feature_data(session, feature, idx[None])[0]
+            idx = np.where(idx < 0, idx + session.event_count, idx)
+        size = self.get_feature_block_size(session, feature)
+        # process the indices block by block in ascending order
+        order = None
+        if np.any(idx[1:] < idx[:-1]):
+            order = np.argsort(idx, kind="stable")
+            idx = idx[order]
+        bids = idx // size
+        parts = []
+        for part in np.split(idx, np.flatnonzero(np.diff(bids)) + 1):
+            if part.size:
+                bid = int(part[0] // size)
+                block = self.get_feature_block(session, feature, bid)
+                parts.append(block[part - bid * size])
+        if not parts:
+            return np.zeros(0)
+        data = np.concatenate(parts)
+        if order is not None:
+            data[order] = data.copy()
+        return data
+
+    def get_density_image(self, session, featx, featy):
+        """Return the density image of all events for two features
+
+        The image is computed from all events in the session (see
+        `compute_density_image`) and cached per session and feature
+        pair.
 
-    @functools.lru_cache(maxsize=900)
-    def get_feature_data(self, feature):
-        with dclab.new_dataset(self.session.path) as ds:
-            return ds[feature][:]
+        Returns
+        -------
+        image: 2d float32 ndarray
+            Log-scaled event density
+        rect: tuple
+            Data region (x, y, width, height) covered by `image`
+        """
+        key = (session, ("density", featx, featy))
+        density = EVENT_CACHE.get(key)
+        if density is None:
+            density = compute_density_image(
+                session, featx, featy,
+                xrange=LIMITS_FEAT.get(featx),
+                yrange=LIMITS_FEAT.get(featy))
+            EVENT_CACHE.put(key, density)
+        return density
+
+    def get_event_block(self, session, start, stop):
+        """Load events `start` to `stop` into the cache
+
+        Returns a dictionary with the event indices as keys and the
+        event data (see `get_event_data`) as values. This method is
+        used by the prefetching threads.
+        """
+        block = {}
+        for index, data in zip(range(start, stop),
+                               self.load_event_block(session, start, stop)):
+            EVENT_CACHE.put((session, ("event", index)), data)
+            block[index] = data
+        return block
+
+    def get_event_data(self, session, index):
+        """Return the image data and scalar features of an event (cached)
+
+        This method is thread-safe. The contour image and the cropped
+        image are computed here as well.
+        """
+        key = (session, ("event", index))
+        data = EVENT_CACHE.get(key)
+        if data is None:
+            data = self.load_event_block(session, index, index + 1)[0]
+            EVENT_CACHE.put(key, data)
+        return data
 
-    @functools.lru_cache(maxsize=50)
-    def get_event_data(self, index):
-        # is this too slow?
-        with dclab.new_dataset(self.session.path) as ds:
+    def load_event_block(self, session, start, stop):
+        """Load the data for `get_event_data` for a block of events
+
+        Reading consecutive events at once and rendering all contour
+        images into one array is considerably faster than doing
+        this for each event individually.
+        """
+        t0 = time.perf_counter()
+        trace_keys = self.get_trace_config(session)["keys"]
+        with session.get_dataset() as ds:
             pxs = ds.config["imaging"]["pixel size"]
-            data = {"image": ds["image"][index],
-                    "mask": ds["mask"][index],
-                    "pos_x_px": self.get_feature_data("pos_x")[index] / pxs,
+            images = ds["image"][start:stop]
+            masks = ds["mask"][start:stop]
+            traces = {key: ds["trace"][key][start:stop] for key in trace_keys}
+        contours = get_contour_images(images, masks)
+        features = {}
+        for feat in ["pos_x"] + list(LIMITS_FEAT):
+            features[feat] = self.get_feature_data(session, feat,
+                                                   slice(start, stop))
+        # display levels (computed here, so the GUI thread does not
+        # have to, see `SimpleImageView.set_image_data`)
+        image_levels = np.stack([images.min(axis=(1, 2)),
+                                 images.max(axis=(1, 2))], axis=1)
+        # (pyqtgraph uses the levels of the red channel for RGB images)
+        contour_levels = np.stack([contours[..., 0].min(axis=(1, 2)),
+                                   contours[..., 0].max(axis=(1, 2))], axis=1)
+        if traces:
+            trace_min = np.min([tr.min(axis=1) for tr in traces.values()],
+                               axis=0)
+            trace_max = np.max([tr.max(axis=1) for tr in traces.values()],
+                               axis=0)
+        block = []
+        for ii in range(stop - start):
+            # Copy the event data out of the block arrays, so that the
+            # memory of an event is freed when it is evicted from the
+            # cache (and not only when all events of the block are).
+            data = {"image": images[ii].copy(),
+                    "image_levels": tuple(image_levels[ii]),
+                    "mask": masks[ii].copy(),
+                    "pos_x_px": features["pos_x"][ii] / pxs,
+                    "image_contour": contours[ii].copy(),
+                    "image_contour_levels": tuple(contour_levels[ii]),
+                    "traces": {key: traces[key][ii].copy()
+                               for key in traces},
                     }
+            if traces:
+                data["trace_range"] = (min(trace_min[ii], 0),
+                                       max(trace_max[ii], 0))
             for feat in LIMITS_FEAT:
-                data[feat] = self.get_feature_data(feat)[index]
-        return data
+                data[feat] = features[feat][ii]
+            # the cropped image is a view of the image
+            cropped = get_cropped_image(data)
+            data["image_cropped"] = cropped
+            data["image_cropped_levels"] = (cropped.min(), cropped.max())
+            block.append(data)
+        # keep track of the average load time for the prefetch depth
+        load_time = (time.perf_counter() - t0) / (stop - start)
+        self.load_time = ema(self.load_time, load_time)
+        return block
+
+    def get_scatter_indices(self, session):
+        """Return the indices of the events shown in the scatter plots
+
+        The events are downsampled once per session (content-based,
+        using the features of the first scatter plot) and shared by
+        all scatter plots, so they all show the same events.
+        """
+        key = (session, ("scatter indices",))
+        indices = EVENT_CACHE.get(key)
+        if indices is None:
+            featx, featy = SCATTER_FEAT[0]
+            _, _, idx = dclab.downsampling.downsample_grid(
+                self.get_feature_data(session, featx),
+                self.get_feature_data(session, featy),
+                samples=SCATTER_SAMPLES,
+                ret_idx=True)
+            indices = np.flatnonzero(idx)
+            EVENT_CACHE.put(key, indices)
+        return indices
+
+    def get_trace_config(self, session):
+        """Return the fluorescence trace configuration of a session
+
+        The configuration is determined once per session (cached).
+
+        Returns
+        -------
+        config: dict
+            Dictionary with the keys "keys" (list of trace features
+            shown; only one of raw or median per channel) and "time"
+            (time axis of the traces in µs or None if there are no
+            traces)
+        """
+        key = (session, ("trace config",))
+        config = EVENT_CACHE.get(key)
+        if config is None:
+            config = {"keys": [], "time": None}
+            with session.get_dataset() as ds:
+                if "trace" in ds:
+                    fl_samples = ds.config["fluorescence"]["samples per event"]
+                    fl_rate = ds.config["fluorescence"]["sample rate"]
+                    config["time"] = np.arange(fl_samples) / fl_rate * 1e6
+                    # Only show one trace type (raw or median) per channel
+                    shown = []
+                    for tkey in dclab.dfn.FLUOR_TRACES:
+                        trid = tkey.split("_")[0]
+                        if tkey in ds["trace"] and trid not in shown:
+                            shown.append(trid)
+                            config["keys"].append(tkey)
+            EVENT_CACHE.put(key, config)
+        return config
+
+    def get_prefetch_depth(self):
+        """Return the number of events that should be prefetched
+
+        This is the number of events the user navigates through
+        while one event is loaded, plus one.
+        """
+        if self.load_time is None or self.navigation_interval is None:
+            depth = PREFETCH_DEPTH[0]
+        else:
+            depth = math.ceil(
+                self.load_time / max(self.navigation_interval, 1e-3)) + 1
+        return int(np.clip(depth, *PREFETCH_DEPTH))
+
+    def prefetch_cancel(self, keep=None):
+        """Cancel prefetching events
+
+        Parameters
+        ----------
+        keep: list of int
+            Event indices for which prefetching should not be
+            cancelled; if None, wait for all running jobs to finish.
+        """
+        # futures that load (also) events in `keep`
+        kept = [self.prefetch_futures[index] for index in keep or []
+                if index in self.prefetch_futures]
+        for index, future in list(self.prefetch_futures.items()):
+            if future in kept:
+                continue
+            if not future.cancel() and keep is None:
+                concurrent.futures.wait([future])
+            self.prefetch_futures.pop(index)
+
+    def prefetch_events(self, event_index, direction):
+        """Load the next events in navigation direction in the background
+
+        The prefetched events end up in the `get_event_data` cache.
+        """
+        window = []
+        for ii in range(1, self.get_prefetch_depth() + 1):
+            index = event_index + direction * ii
+            if 0 <= index < self.session.event_count:
+                window.append(index)
+        # cancel prefetching events we do not need anymore
+        self.prefetch_cancel(keep=window)
+        indices = [index for index in sorted(window)
+                   if index not in self.prefetch_futures
+                   and (self.session, ("event", index)) not in EVENT_CACHE]
+        # load consecutive events in blocks
+        blocks = []
+        for index in indices:
+            if (blocks and index == blocks[-1][-1] + 1
+                    and len(blocks[-1]) < PREFETCH_BLOCK_SIZE):
+                blocks[-1].append(index)
+            else:
+                blocks.append([index])
+        if direction < 0:
+            # the events closest to the current event first
+            blocks.reverse()
+        for block in blocks:
+            future = PREFETCH_POOL.submit(
+                self.get_event_block, self.session, block[0], block[-1] + 1)
+            for index in block:
+                self.prefetch_futures[index] = future
+
+    def render_requested_event(self):
+        """Show the event requested last with `request_event`
 
-    def set_event(self, session, event_index):
+        If the data of the event are not available yet, they are
+        loaded in the background and the event is shown when they
+        are loaded (unless another event has been requested since).
+        """
+        if self._requested_event is None:
+            return
+        session, index, label_features = self._requested_event
+        future = self.prefetch_futures.get(index)
+        if not session:
+            # session has been closed in the meantime
+            self._requested_event = None
+        elif ((session, ("event", index)) in EVENT_CACHE
+              or (future is not None and future.done())):
+            self._requested_event = None
+            self.set_event(session, index, label_features)
+        else:
+            if future is None:
+                future = PREFETCH_POOL.submit(
+                    self.get_event_block, session, index, index + 1)
+                self.prefetch_futures[index] = future
+            future.add_done_callback(
+                functools.partial(self._emit_event_loaded, index))
+
+    def request_event(self, session, event_index, label_features=None):
+        """Show an event asynchronously
+
+        Use this method instead of `set_event` for interactive
+        navigation. Rendering happens in the event loop and only the
+        event requested last is shown, i.e. requests that arrive
+        while an event is loaded or rendered replace each other.
+        The parameters are those of `set_event`.
+
+        The first event of a new session is shown immediately.
+        """
+        if session is not self.session:
+            self.reset()
+            self.set_event(session, event_index, label_features)
+        else:
+            self._requested_event = (session, event_index, label_features)
+            if not self._render_timer.isActive():
+                self._render_timer.start()
+
+    @property
+    def is_render_pending(self):
+        """Whether a requested event has not been shown yet"""
+        return self._requested_event is not None
+
+    @QtCore.pyqtSlot(int)
+    def on_event_loaded(self, index):
+        """Show a requested event once its data are loaded"""
+        if (self._requested_event is not None
+                and self._requested_event[1] == index):
+            self.render_requested_event()
+
+    def _emit_event_loaded(self, index, future):
+        try:
+            self.event_loaded.emit(index)
+        except RuntimeError:
+            # widget has been deleted
+            pass
+
+    def retrieve_event_data(self, index):
+        """Return event data, waiting for a running prefetch job"""
+        future = self.prefetch_futures.pop(index, None)
+        if future is not None:
+            if future.cancel():
+                # The job has not started yet. Forget about the other
+                # events of the block, so they are prefetched again.
+                for idx, fut in list(self.prefetch_futures.items()):
+                    if fut is future:
+                        self.prefetch_futures.pop(idx)
+            else:
+                try:
+                    return future.result()[index]
+                except BaseException:
+                    # try again below and let the error arise there
+                    pass
+        return self.get_event_data(self.session, index)
+
+    def set_event(self, session, event_index, label_features=None):
+        """Show an event
+
+        Parameters
+        ----------
+        session: dctag.session.DCTagSession
+            Labeling session
+        event_index: int
+            Index of the event to show
+        label_features: str or list of str
+            Score feature(s) used for coloring the scatter plot
+            points (see `update_scatter_labels`)
+        """
         if self.session is not session:
             self.reset()
             self.session = session
@@ -125,58 +624,177 @@ class WidgetVisualize(QtWidgets.QWidget):
         if self.session:
             # Programmatically, this is always the case, but for clarity,
             # we use the `if self.session` case.
+            t0 = time.perf_counter()
             self.setEnabled(True)
             self.groupBox_event.setTitle(
                 f"Event {event_index + 1} (total {session.event_count}) ")
             self.session = session
-            data = self.get_event_data(event_index)
+            data = self.retrieve_event_data(event_index)
             # Plot the channel images
             # raw image
-            self.image_channel.setImage(data["image"])
+            self.image_channel.set_image_data(data["image"],
+                                              data["image_levels"])
             # image with contour
-            image_contour = get_contour_image(data)
-            self.image_channel_contour.setImage(image_contour)
+            self.image_channel_contour.set_image_data(
+                data["image_contour"], data["image_contour_levels"])
             # cropped image
-            image_cropped = get_cropped_image(data)
-            self.update_image_cropped(image_cropped)
+            self.update_image_cropped(data["image_cropped"],
+                                      data["image_cropped_levels"])
 
             # Plot event in the scatter plots
             for plot, [featx, featy] in zip(self.scatter_plots, SCATTER_FEAT):
                 plot.set_event(data[featx], data[featy])
 
-            # Add the Fluorescence traces of the event
-            self.set_fluorescence_traces(event_index)
+            # Color the scatter plot points according to their labels
+            self.update_scatter_labels(label_features)
+
+            # Add the Fluorescence traces of the event (unless we are
+            # running out of time)
+            t1 = time.perf_counter()
+            self.render_time = ema(self.render_time, t1 - t0)
+            if (self.frame_budget is not None
+                    and self.trace_render_time is not None
+                    and (self.render_time + self.trace_render_time
+                         > self.frame_budget)):
+                self.hide_fluorescence_traces()
+            else:
+                self.set_fluorescence_traces(data)
+                self.trace_render_time = ema(self.trace_render_time,
+                                             time.perf_counter() - t1)
+
+            # Prefetch the next events in navigation direction
+            now = time.perf_counter()
+            if self._navigation_time is not None:
+                # ignore breaks the user takes
+                interval = min(now - self._navigation_time, 1)
+                if self.navigation_interval is None:
+                    self.navigation_interval = interval
+                else:
+                    self.navigation_interval = \
+                        0.7 * self.navigation_interval + 0.3 * interval
+            self._navigation_time = now
+            if self.event_index is not None and event_index < self.event_index:
+                direction = -1
+            else:
+                direction = 1
+            self.event_index = event_index
+            self.prefetch_events(event_index, direction)
+            self.event_shown.emit(event_index)
 
     @QtCore.pyqtSlot()
-    def update_image_cropped(self, image_cropped=None):
+    def update_image_cropped(self, image_cropped=None, auto_levels=None):
         """Udpate the cropped image on the right
 
-        This handles auto-contrast.
+        This handles auto-contrast. If given, `auto_levels` must be
+        the minimum and maximum of `image_cropped` (which are computed
+        in `load_event_block`).
         """
         if image_cropped is None:
             # use the current data
             image_cropped = self.image_cropped.image
+            auto_levels = self._image_cropped_auto_levels
+            if image_cropped is None:
+                return
+        if auto_levels is None:
+            auto_levels = (image_cropped.min(), image_cropped.max())
+        self._image_cropped_auto_levels = auto_levels
         if self.checkBox_auto_contrast.isChecked():
-            levels = (image_cropped.min(), image_cropped.max())
+            levels = auto_levels
         else:
             levels = (self.spinBox_contrast_min.value(),
                       self.spinBox_contrast_max.value())
-        self.image_cropped.setImage(image_cropped, autoLevels=False,
-                                    levels=levels)
+        self.image_cropped.set_image_data(image_cropped, levels)
         # make sure levels are shown in UI
         self.spinBox_contrast_min.blockSignals(True)
-        self.spinBox_contrast_min.setValue(levels[0])
+        self.spinBox_contrast_min.setValue(int(levels[0]))
         self.spinBox_contrast_min.blockSignals(False)
         self.spinBox_contrast_max.blockSignals(True)
-        self.spinBox_contrast_max.setValue(levels[1])
+        self.spinBox_contrast_max.setValue(int(levels[1]))
         self.spinBox_contrast_max.blockSignals(False)
 
+    @QtCore.pyqtSlot(object)
+    def on_scatter_brushed(self, mask):
+        """Highlight the events selected in one scatter plot in all plots"""
+        self.scatter_selection = mask if np.any(mask) else None
+        for plot in self.scatter_plots:
+            plot.set_highlight(self.scatter_selection)
+
+    @QtCore.pyqtSlot()
+    def update_density_mode(self):
+        """Show density images or scatter points in the scatter plots"""
+        enabled = self.checkBox_density.isChecked()
+        if enabled and self.session:
+            for plot, [featx, featy] in zip(self.scatter_plots, SCATTER_FEAT):
+                plot.set_density(*self.get_density_image(
+                    self.session, featx, featy))
+        for plot in self.scatter_plots:
+            plot.set_density_mode(enabled)
+
+    def update_scatter_labels(self, label_features=None):
+        """Color the scatter plot points according to their label state
+
+        Parameters
+        ----------
+        label_features: str or list of str
+            A single score feature (binary labeling; unset, False,
+            and True events are colored according to
+            `SCATTER_COLORS_BINARY`) or a list of score features
+            (multi-label mode; events are colored according to their
+            first True feature using `SCATTER_COLORS_CLASSES`). If
+            not set, all points are black.
+
+        Notes
+        -----
+        Only the points whose label state changed since the last
+        call are updated, so labeling a single event does not
+        restyle all scatter plot points.
+        """
+        indices = self.get_scatter_indices(self.session)
+        if not label_features:
+            label_features = None
+            colors = SCATTER_COLORS_BINARY[:1]
+        elif isinstance(label_features, str):
+            colors = SCATTER_COLORS_BINARY
+        else:
+            label_features = list(label_features)
+            ncls = len(SCATTER_COLORS_CLASSES) - 1
+            colors = [SCATTER_COLORS_CLASSES[0]] + [
+                SCATTER_COLORS_CLASSES[1 + ii % ncls]
+                for ii in range(len(label_features))]
+
+        if label_features is None:
+            states = np.full(indices.size, -1, dtype=np.int8)
+        else:
+            states = self.session.get_label_states(label_features, indices)
+
+        if (self.scatter_states is None
+                or label_features != self._scatter_label_features):
+            positions = None
+        else:
+            positions = np.flatnonzero(states != self.scatter_states)
+            if positions.size == 0:
+                return
+            states = states[positions]
+        # brushes are looked up from a table (unset/no class first)
+        table = np.empty(len(colors), dtype=object)
+        table[:] = [get_scatter_brush(c) for c in colors]
+        brushes = table[states.astype(np.intp) + 1]
+        for plot in self.scatter_plots:
+            plot.set_scatter_brushes(brushes, positions)
+
+        if positions is None:
+            self.scatter_states = states
+        else:
+            self.scatter_states[positions] = states
+        self._scatter_label_features = label_features
+
     def update_scatter_plots(self):
+        indices = self.get_scatter_indices(self.session)
+        self.scatter_selection = None
+        self.scatter_states = None
         for plot, [featx, featy] in zip(self.scatter_plots, SCATTER_FEAT):
-            with dclab.new_dataset(self.session.path) as ds:
-                x, y = ds.get_downsampled_scatter(xax=featx,
-                                                  yax=featy,
-                                                  downsample=10000)
+            x = self.get_feature_data(self.session, featx, indices)
+            y = self.get_feature_data(self.session, featy, indices)
             plot.set_scatter(x, y)
             if LIMITS_FEAT[featx] is not None:
                 plot.setXRange(*LIMITS_FEAT[featx])
@@ -184,70 +802,187 @@ class WidgetVisualize(QtWidgets.QWidget):
                 plot.setYRange(*LIMITS_FEAT[featy])
             plot.setLabel('bottom', dclab.dfn.get_feature_label(featx))
             plot.setLabel('left', dclab.dfn.get_feature_label(featy))
+        self.update_density_mode()
+
+    def hide_fluorescence_traces(self):
+        """Hide the fluorescence traces (e.g. to save rendering time)"""
+        if self._trace_keys_shown:
+            for key in self._trace_keys_shown:
+                self.trace_plots[key].hide()
+        # make `set_fluorescence_traces` show them again
+        self._trace_keys_shown = None
 
-    def set_fluorescence_traces(self, event_index):
-        """Set the fluorescence traces on the widget"""
-        self.legend_trace.clear()
-        with dclab.new_dataset(self.session.path) as ds:
-            if "trace" in ds:
-                self.widget_trace.show()
-                # time axis
-                fl_samples = ds.config["fluorescence"]["samples per event"]
-                fl_rate = ds.config["fluorescence"]["sample rate"]
-                fl_time = np.arange(fl_samples) / fl_rate * 1e6
-                # temporal range (min, max, fl-peak-maximum)
-                range_t = [fl_time[0], fl_time[-1], 0]
-                # fluorescence intensity
-                range_fl = [0, 0]
-
-                # Use this list to only show one trace type (raw or median)
-                shown_traces = []
-
-                for key in dclab.dfn.FLUOR_TRACES:
-                    trid = key.split("_")[0]
-                    if key in ds["trace"] and trid not in shown_traces:
-                        shown_traces.append(trid)
-                        # show the trace information
-                        tracey = ds["trace"][key][event_index]  # trace data
-                        range_fl[0] = min(range_fl[0], tracey.min())
-                        range_fl[1] = max(range_fl[1], tracey.max())
-                        self.trace_plots[key].setData(fl_time, tracey)
-                        self.trace_plots[key].show()
-                        # set legend name
-                        ln = "{} {}".format(
-                            "FL-{}".format(key[2]),
-                            'median' if str(key[4]) == 'm' else 'raw')
-                        self.legend_trace.addItem(self.trace_plots[key], ln)
-                        self.legend_trace.update()
-                    else:
-                        self.trace_plots[key].hide()
-                self.widget_trace.setXRange(*range_t[:2], padding=0)
-                if range_fl[0] != range_fl[1]:
-                    self.widget_trace.setYRange(*range_fl, padding=.01)
+    def set_fluorescence_traces(self, event_data):
+        """Set the fluorescence traces on the widget
+
+        The legend and the axis ranges are only updated when the
+        traces shown change (i.e. for a new session).
+        """
+        config = self.get_trace_config(self.session)
+        keys = config["keys"]
+        if keys != self._trace_keys_shown:
+            self._trace_keys_shown = keys
+            self.legend_trace.clear()
+            for key in self.trace_plots:
+                self.trace_plots[key].setVisible(key in keys)
+            for key in keys:
+                ln = "FL-{} {}".format(
+                    key[2], 'median' if key[4] == 'm' else 'raw')
+                self.legend_trace.addItem(self.trace_plots[key], ln)
+            if keys:
+                fl_time = config["time"]
+                self.widget_trace.setXRange(fl_time[0], fl_time[-1],
+                                            padding=0)
                 self.widget_trace.setLimits(xMin=0, xMax=fl_time[-1])
-            else:
-                self.widget_trace.hide()
+            self.widget_trace.setVisible(bool(keys))
+        if keys:
+            for key in keys:
+                self.trace_plots[key].setData(config["time"],
+                                              event_data["traces"][key])
+            range_fl = event_data["trace_range"]
+            if range_fl[0] != range_fl[1]:
+                self.widget_trace.setYRange(*range_fl, padding=.01)
+
+
+def ema(average, value, weight=0.2):
+    """Update an exponential moving average with a new value"""
+    if average is None:
+        return value
+    else:
+        return (1 - weight) * average + weight * value
+
+
+@functools.lru_cache(maxsize=64)
+def get_scatter_brush(color):
+    """Return a brush for scatter plot points
+
+    The same brush instance is returned for a color, because
+    pyqtgraph caches the rendered symbols by brush instance.
+    """
+    return pg.mkBrush(color)
+
+
+def compute_density_image(session, featx, featy, xrange=None, yrange=None,
+                          bins=None, chunk_size=None):
+    """Compute the log-scaled 2D histogram of all events in a session
+
+    Parameters
+    ----------
+    session: dctag.session.DCTagSession
+        Labeling session
+    featx, featy: str
+        Scalar features on the x and y axes
+    xrange, yrange: tuple of float
+        Histogram ranges; computed from the data if not set
+    bins: tuple of int
+        Number of x and y bins; defaults to `DENSITY_BINS`
+    chunk_size: int
+        Number of events read and binned at once; defaults to
+        `DENSITY_CHUNK_SIZE`
+
+    Returns
+    -------
+    image: 2d float32 ndarray
+        Logarithm of one plus the number of events in each bin
+        (rows are y bins, columns are x bins)
+    rect: tuple
+        Data region (x, y, width, height) covered by `image`
+
+    Notes
+    -----
+    The features are read in chunks, so the memory required does
+    not depend on the number of events. The file handles of the
+    session are only held while a chunk is read.
+    """
+    nx, ny = bins or DENSITY_BINS
+    chunk_size = chunk_size or DENSITY_CHUNK_SIZE
+    size = session.event_count
+
+    def iter_chunks():
+        for start in range(0, size, chunk_size):
+            stop = min(start + chunk_size, size)
+            with session.get_dataset() as ds:
+                x = np.asarray(ds[featx][start:stop], dtype=float)
+                y = np.asarray(ds[featy][start:stop], dtype=float)
+            yield x, y
+
+    if xrange is None or yrange is None:
+        # determine the data ranges in a first pass
+        lims = np.array([[np.inf, -np.inf], [np.inf, -np.inf]])
+        for x, y in iter_chunks():
+            for lim, data in zip(lims, [x, y]):
+                data = data[np.isfinite(data)]
+                if data.size:
+                    lim[0] = min(lim[0], data.min())
+                    lim[1] = max(lim[1], data.max())
+        for lim in lims:
+            if not np.all(np.isfinite(lim)):
+                lim[:] = 0, 1
+            elif lim[0] == lim[1]:
+                lim += -.5, .5
+        xrange = xrange or tuple(lims[0])
+        yrange = yrange or tuple(lims[1])
+
+    (x0, x1), (y0, y1) = xrange, yrange
+    counts = np.zeros(ny * nx, dtype=np.int64)
+    for x, y in iter_chunks():
+        # NaN values are excluded by the comparisons
+        valid = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        ix = ((x[valid] - x0) * (nx / (x1 - x0))).astype(np.intp)
+        iy = ((y[valid] - y0) * (ny / (y1 - y0))).astype(np.intp)
+        np.minimum(ix, nx - 1, out=ix)
+        np.minimum(iy, ny - 1, out=iy)
+        counts += np.bincount(iy * nx + ix, minlength=ny * nx)
+    image = np.log1p(counts.reshape(ny, nx), dtype=np.float32)
+    return image, (x0, y0, x1 - x0, y1 - y0)
 
 
 def get_contour_image(event_data):
-    image = event_data["image"]
-    mask = event_data["mask"]
-    cellimg = np.copy(image)
-    cellimg = cellimg.reshape(
-        cellimg.shape[0], cellimg.shape[1], 1)
-    cellimg = np.repeat(cellimg, 3, axis=2)
-    # clip and convert to int
-    cellimg = np.clip(cellimg, 0, 255)
-    cellimg = np.require(cellimg, np.uint8, 'C')
-    # Compute contour image from mask. If you are wondering
-    # whether this is kosher, please take a look at issue #76:
-    # https://github.com/ZELLMECHANIK-DRESDEN/dclab/issues/76
-    cont = mask ^ binary_erosion(mask)
-    # set red contour pixel values in original image
-    cellimg[cont, 0] = int(255 * .7)
-    cellimg[cont, 1] = 0
-    cellimg[cont, 2] = 0
-    return cellimg
+    """Return an RGB image of an event with its contour in red"""
+    return get_contour_images(event_data["image"][np.newaxis],
+                              event_data["mask"][np.newaxis])[0]
+
+
+def get_contour_images(images, masks, out=None):
+    """Return RGB images of events with their contours in red
+
+    Parameters
+    ----------
+    images: 3d ndarray
+        Grayscale event images (stacked along the first axis)
+    masks: 3d boolean ndarray
+        Event masks corresponding to `images`
+    out: 4d uint8 ndarray
+        Preallocated output array of shape `images.shape + (3,)`
+
+    Notes
+    -----
+    The contour consists of all mask pixels that have at least one
+    (4-connected) neighbor outside the mask or at the image border.
+    This is identical to `mask ^ scipy.ndimage.binary_erosion(mask)`.
+    If you are wondering whether this is kosher, please take a look
+    at issue #76: https://github.com/ZELLMECHANIK-DRESDEN/dclab/issues/76
+    """
+    masks = np.asarray(masks, dtype=bool)
+    if out is None:
+        out = np.empty(masks.shape + (3,), dtype=np.uint8)
+    if images.dtype != np.uint8:
+        images = np.clip(images, 0, 255)
+    # interior pixels are mask pixels with all four neighbors in the mask
+    interior = np.zeros_like(masks)
+    inner = interior[:, 1:-1, 1:-1]
+    np.logical_and(masks[:, 1:-1, 1:-1], masks[:, :-2, 1:-1], out=inner)
+    inner &= masks[:, 2:, 1:-1]
+    inner &= masks[:, 1:-1, :-2]
+    inner &= masks[:, 1:-1, 2:]
+    # contour = mask and not interior
+    contour = np.greater(masks, interior, out=interior)
+    # gray values with red contour pixels (copying channel by channel
+    # is much faster than broadcasting into the last axis)
+    for ch, value in enumerate([int(255 * .7), 0, 0]):
+        np.copyto(out[..., ch], images, casting="unsafe")
+        np.copyto(out[..., ch], value, where=contour)
+    return out
 
 
 def get_cropped_image(event_data):
@@ -5,6 +5,9 @@ open an .rtdc file and DCTag automatically determines which
 machine-learning features have previously been analyzed and
 what could possibly happen next.
 """
+import contextlib
+import os
+import queue
 import threading
 import time
 import pathlib
@@ -12,15 +15,39 @@ import warnings
 
 import dclab
 import h5py
+import hdf5plugin
 import numpy as np
 
 from ._version import version
+from .bitset import EventBitset
+
+
+#: Chunk size (number of events) of score datasets; Small chunks keep
+#: the overhead low when writing scores at random event indices.
+SCORE_CHUNK_SIZE = 1024
+
+#: Suffix of the temporary dataset used when migrating a score dataset
+#: to the chunked layout (see `DCTagSession.require_h5_score_dataset`)
+MIGRATE_SUFFIX = "_dctag_migrate"
+
+#: Fixed-width record of the session journal; The value is 1 for True,
+#: 0 for False, and -1 for resetting a score. The time is the UNIX time
+#: at which the score was set.
+JOURNAL_DTYPE = np.dtype([("feature", "S16"),
+                          ("index", "<i8"),
+                          ("value", "i1"),
+                          ("time", "<f8"),
+                          ])
 
 
 class DCTagSessionClosedWarning(UserWarning):
     pass
 
 
+class DCTagSessionJournalWarning(UserWarning):
+    """Raised when the session journal cannot be written"""
+
+
 class DCTagSessionError(BaseException):
     pass
 
@@ -45,7 +72,8 @@ class DCTagSessionWrongUserError(DCTagSessionError):
 
 
 class DCTagSession:
-    def __init__(self, path, user, linked_features=None, override_user=False):
+    def __init__(self, path, user, linked_features=None, override_user=False,
+                 recover=False):
         """Initialize a DCTag session
 
         Parameters
@@ -73,6 +101,12 @@ class DCTagSession:
             other scores get set to False).
         override_user: bool
             Whether to override the `user` stored in the session.
+        recover: bool
+            Whether to recover a session that was not closed properly
+            (e.g. because DCTag crashed). The scores in the journal of
+            the previous session are written to `path` and the lock
+            file is taken over. Only use this if you are sure that
+            nobody else is working on `path`.
 
         Notes
         -----
@@ -82,8 +116,20 @@ class DCTagSession:
         precaution to prevent two people from working on the same file
         at the same time.
 
+        Every score that is set is also appended to a journal file
+        (.dctag-journal) next to the lock file. The journal is written
+        in a background thread (see `DCTagSessionJournal`), so that
+        labeling does not wait for the storage. The journal is cleared
+        whenever the scores are flushed to `path`. If DCTag exits
+        unexpectedly, the journal is replayed when the session is
+        opened with `recover=True`.
+
         The methods that alter the .rtdc file in this class are
-        thread-safe (using `self.score_lock`).
+        thread-safe (using `self.score_lock` and `self.write_lock`).
+        While the scores are written to the .rtdc file in `flush`,
+        `self.score_lock` is only held for swapping the pending
+        `scores` and `history`, so labeling is never blocked by
+        slow storage.
 
         The design makes sure that the user can still write to the
         original .rtdc file, even if e.g. the original file is on a
@@ -92,44 +138,82 @@ class DCTagSession:
         #: Lock used internally to avoid writing to `history` and `scores`
         #: while saving data in `flush`
         self.score_lock = threading.Lock()
+        #: Lock used internally to serialize writing to `self.path`
+        #: (always acquire this lock before `score_lock`)
+        self.write_lock = threading.Lock()
         #: Session path
         self.path = pathlib.Path(path)
         #: Lock-file for this session
         self.path_lock = self.path.with_suffix(".dctag")
-        if self.path_lock.exists():
+        if self.path_lock.exists() and not recover:
             raise DCTagSessionLockedError(
                 f"Somebody else is currently working on {self.path} or "
-                + "DCTag exited unexpectedly in a previous run! Please ask "
-                + "Paul to implement session recovery!")
+                + "DCTag exited unexpectedly in a previous run! If you are "
+                + "sure that nobody else is working on this file, you may "
+                + "recover the previous session.")
+        #: Journal file for this session (crash recovery)
+        self.path_journal = self.path.with_suffix(".dctag-journal")
+        #: Journal of this session (written in a background thread)
+        self.journal = DCTagSessionJournal(self.path_journal)
+        #: Background thread for flushing (see `start_writer`)
+        self.writer = None
+        #: File handles of `path` shared by the session and the GUI
+        #: (see `get_dataset`)
+        self.handles = DCTagSessionHandlePool(self.path)
         #: Session user
         self.user = user.strip()
         # Whether session info has been written to the dctag-history log
         self._session_info_in_log_up_to_date = False
         # list of linked features (see self.linked_features)
         self._linked_features = []
-        # claim this file
-        self._claim_path(override_user=override_user)
         #: simple key-value dictionary of the current session history
         self.history = {}
         #: list of (feature, index, score) in the order set by the user
         self.scores = []
+        # Open `path` only once (every open is expensive on network
+        # shares) to claim it, to write the scores of a previous session
+        # that was not closed properly, and to gather information.
+        with h5py.File(self.path, "a") as h5:
+            # claim this file
+            self._claim_path(h5, override_user=override_user)
+            #: Number of events in the dataset
+            self.event_count = get_event_count(h5)
+            recover_migration(h5)
+            self.recover_journal(h5)
+            # remember which scores are available in the file
+            self._scores_on_disk = set(
+                [feat for feat in h5["events"] if is_score_feature(feat)])
         #: scoring features that are linked for labeling
         self.linked_features = linked_features
-        # determine length of the dataset
-        with dclab.new_dataset(self.path) as ds:
-            #: Number of events in the dataset
-            self.event_count = len(ds)
         #: The internal scores cache is a dict with numpy arrays to keep
         #: track of all the scores for internal use only. This is not used
         #: for writing scores to .rtdc files. The scores cache is important
         #: for being able to keep working on a dataset when the underlying
-        #: path is temporarily not available.
+        #: path is temporarily not available. To save memory, the scores
+        #: are stored as int8 arrays (-1 for unset, 0 for False, 1 for
+        #: True, see `float_to_tristate`). Scores that exist in `path`
+        #: are only loaded into the cache when they are first accessed
+        #: (see `load_scores`). The arrays are column views of the label
+        #: matrix `self.label_matrix`.
         self.scores_cache = {}
-        with h5py.File(self.path, "a") as h5:
-            # make a copy of all available scores in self.scores_cache
-            for feat in h5["events"]:
-                if feat.startswith("ml_score_") or feat.startswith("userdef"):
-                    self.scores_cache[feat] = np.copy(h5["events"][feat])
+        #: Label matrix (events x features) backing `self.scores_cache`;
+        #: The row of an event holds the scores of all cached features
+        #: (columns defined by `self.label_columns`), which makes
+        #: per-event queries a single vectorized operation.
+        self.label_matrix = np.full((self.event_count, 0), -1, dtype=np.int8)
+        #: Dictionary of column indices of features in `self.label_matrix`
+        self.label_columns = {}
+        # Number of unset, False, and True labels (rows) for each column
+        # of `self.label_matrix`; kept up-to-date by `_write_labels`
+        self._label_counts = np.zeros((0, 3), dtype=np.int64)
+        # Bitsets of unlabeled events (see `find_unlabeled`)
+        self._unlabeled_index = {}
+        # Scores read from `path` that are not yet in the scores cache
+        # (see `_read_score_columns`)
+        self._scores_read = {}
+        # Label counts of scores in `path` that are not yet in the
+        # scores cache (see `get_label_counts`)
+        self._label_counts_on_disk = {}
 
         # finally, acquire the file system lock
         self.path_lock.touch()
@@ -146,40 +230,187 @@ class DCTagSession:
     def __exit__(self, type, value, traceback):
         self.close()
 
-    def _claim_path(self, override_user=False):
-        """Attribute this file to self.user"""
-        with h5py.File(self.path, "a") as h5:
-            hw = dclab.RTDCWriter(h5, mode="append")
-            h5.require_group("logs")
-            dctag_history = "dctag-history"
-            if len(h5["logs"].get(dctag_history, ["placeholder"])) == 0:
-                # remove empty logs
-                del h5["logs"][dctag_history]
-
-            if dctag_history not in h5["logs"]:
-                hw.store_log(dctag_history, f"user: {self.user}")
+    def _claim_path(self, h5, override_user=False):
+        """Attribute this file (opened as `h5`) to self.user"""
+        hw = dclab.RTDCWriter(h5, mode="append")
+        h5.require_group("logs")
+        dctag_history = "dctag-history"
+        if len(h5["logs"].get(dctag_history, ["placeholder"])) == 0:
+            # remove empty logs
+            del h5["logs"][dctag_history]
+
+        if dctag_history not in h5["logs"]:
+            hw.store_log(dctag_history, f"user: {self.user}")
+        else:
+            # Check whether the user in the file matches us
+            h5userstr = h5["logs"][dctag_history][0]
+            if isinstance(h5userstr, bytes):
+                h5userstr = h5userstr.decode("utf-8")
+            if h5userstr.startswith("user:"):
+                h5user = h5userstr.split(":")[1].strip()
+                if h5user != self.user:
+                    if override_user:
+                        h5["logs"][dctag_history][0] = f"user: {self.user}"
+                        hw.store_log(dctag_history,
+                                     f"Session force-claimed from "
+                                     f"{h5user} by {self.user}.")
+                    else:
+                        raise DCTagSessionWrongUserError(
+                            h5user,
+                            f"Expected user '{self.user}' in "
+                            + f"'{self.path}', got '{h5user}'!")
             else:
-                # Check whether the user in the file matches us
-                h5userstr = h5["logs"][dctag_history][0]
-                if isinstance(h5userstr, bytes):
-                    h5userstr = h5userstr.decode("utf-8")
-                if h5userstr.startswith("user:"):
-                    h5user = h5userstr.split(":")[1].strip()
-                    if h5user != self.user:
-                        if override_user:
-                            h5["logs"][dctag_history][0] = f"user: {self.user}"
-                            hw.store_log(dctag_history,
-                                         f"Session force-claimed from "
-                                         f"{h5user} by {self.user}.")
-                        else:
-                            raise DCTagSessionWrongUserError(
-                                h5user,
-                                f"Expected user '{self.user}' in "
-                                + f"'{self.path}', got '{h5user}'!")
-                else:
-                    # Something went wrong (maybe lost history).
-                    # Reinstate the claim!
-                    h5["logs"]["dctag-history"][0] = f"user: {self.user}"
+                # Something went wrong (maybe lost history).
+                # Reinstate the claim!
+                h5["logs"]["dctag-history"][0] = f"user: {self.user}"
+
+    def _write_history(self, history, linked_features):
+        """Write a `history` dictionary to `self.path`"""
+        if history:
+            date = time.strftime("%Y-%m-%d %H:%M:%S")
+            # The logs are read by the GUI (hold the read lock).
+            with self.handles.get_h5_writable() as h5, self.handles.lock, \
+                    dclab.RTDCWriter(h5, mode="append") as hw:
+                if not self._session_info_in_log_up_to_date:
+                    hw.store_log(
+                        "dctag-history",
+                        ["",
+                         f"{date} New session with DCTag {version}",
+                         f"{date} Linked features: {linked_features}"
+                         ])
+                for key in sorted(history.keys()):
+                    hw.store_log("dctag-history",
+                                 f"{date} {key}: {history[key]}")
+
+    def _write_scores(self, scores, linked_features):
+        """Write a list of `scores` to `self.path`"""
+        if scores:
+            updates = coalesce_scores(scores, linked_features)
+            with self.handles.get_h5_writable() as h5:
+                # Only hold the read lock while creating or migrating
+                # datasets, so reading is not blocked by `write_sparse`.
+                with self.handles.lock:
+                    events = h5["events"]
+                    if any(feat not in events or events[feat].chunks is None
+                           for feat in updates) or any(
+                               feat not in events for feat in linked_features):
+                        # The dclab dataset of the handle pool caches the
+                        # available features and the HDF5 datasets; reopen
+                        # it after writing.
+                        self.handles.close()
+                    # make sure that all linked features are available
+                    for feat in linked_features:
+                        self.require_h5_score_dataset(h5, feat,
+                                                      migrate=False)
+                    datasets = {feat: self.require_h5_score_dataset(h5, feat)
+                                for feat in updates}
+                # populate features
+                for feat, (indices, values) in updates.items():
+                    write_sparse(datasets[feat], indices, values)
+
+    def _add_label_column(self, feature):
+        """Add a column for `feature` to `self.label_matrix`
+
+        The column is filled with -1 (unset) and added as a view
+        to `self.scores_cache`. If necessary, the label matrix
+        is enlarged (by eight columns).
+        """
+        col = len(self.label_columns)
+        if col == self.label_matrix.shape[1]:
+            matrix = np.full((self.event_count, col + 8), -1, dtype=np.int8)
+            matrix[:, :col] = self.label_matrix
+            self.label_matrix = matrix
+            # update the views in the scores cache
+            for feat, fcol in self.label_columns.items():
+                self.scores_cache[feat] = matrix[:, fcol]
+            counts = np.zeros((col + 8, 3), dtype=np.int64)
+            counts[:col] = self._label_counts[:col]
+            self._label_counts = counts
+        self.label_columns[feature] = col
+        self.scores_cache[feature] = self.label_matrix[:, col]
+        self._label_counts[col] = self.event_count, 0, 0
+
+    def _write_labels(self, feature, indices, values):
+        """Write labels to `self.scores_cache` and update the counts
+
+        This is the only place where labels in the scores cache
+        are changed after they are loaded.
+
+        Parameters
+        ----------
+        feature: str
+            Score feature (must be in `self.scores_cache`)
+        indices: int or 1d ndarray of int
+            Event indices; there must not be any duplicates if
+            `values` is an array
+        values: bool, int, or 1d ndarray
+            New values (-1 for unset, 0/False, or 1/True)
+        """
+        column = self.scores_cache[feature]
+        counts = self._label_counts[self.label_columns[feature]]
+        if np.ndim(indices) == 0:
+            counts[column[indices] + 1] -= 1
+            column[indices] = values
+            counts[column[indices] + 1] += 1
+        else:
+            if np.ndim(values) == 0:
+                indices = np.unique(indices)
+            counts -= np.bincount(column[indices] + 1, minlength=3)
+            column[indices] = values
+            counts += np.bincount(column[indices] + 1, minlength=3)
+
+    def _read_score_columns(self, features):
+        """Read scores of `features` from `self.path` for the scores cache
+
+        Call this method before acquiring `self.score_lock`, so that
+        labeling is not blocked while reading from slow storage.
+        The scores are added to `self.scores_cache` when they are
+        first required (see `require_dict_score_dataset`).
+        """
+        for feat in features:
+            if (feat in self._scores_on_disk
+                    and feat not in self.scores_cache
+                    and feat not in self._scores_read):
+                with self.handles.get_dataset() as ds:
+                    self._scores_read[feat] = float_to_tristate(
+                        ds.h5file["events"][feat])
+
+    def _require_label_columns(self, features):
+        """Return a dictionary with the label matrix columns of `features`
+
+        Features that are not in `self.path` and have not been
+        labeled in this session are ignored.
+        """
+        cols = {}
+        for feat in features:
+            if feat in self.scores_cache or feat in self._scores_on_disk:
+                self.require_dict_score_dataset(self.scores_cache, feat)
+                cols[feat] = self.label_columns[feat]
+        return cols
+
+    def _get_unlabeled_mask(self, key, indices=None):
+        """Compute the unlabeled events for a key of `_unlabeled_index`"""
+        mode, features = key
+        cols = list(self._require_label_columns(features).values())
+        if indices is None:
+            indices = slice(None)
+        labels = self.label_matrix[indices][:, cols]
+        if mode == "unset":
+            return np.all(labels < 0, axis=1)
+        else:
+            return ~np.any(labels == 1, axis=1)
+
+    def _update_unlabeled_index(self, features, indices):
+        """Update the bitsets of unlabeled events at `indices`
+
+        Call this method after the scores of `features` in
+        `self.scores_cache` were changed at `indices`.
+        """
+        features = set(features)
+        indices = np.atleast_1d(indices)
+        for key, bitset in self._unlabeled_index.items():
+            if features.intersection(key[1]):
+                bitset.update(indices, self._get_unlabeled_mask(key, indices))
 
     @property
     def linked_features(self):
@@ -189,7 +420,7 @@ class DCTagSession:
     def linked_features(self, linked_features):
         # Acquire a score_lock, because labeling might go on
         # in another thread, and we want the correct history.
-        with self.score_lock:
+        with self.write_lock, self.score_lock:
             linked_features = linked_features or []
             if self._linked_features == linked_features:
                 # nothing to do
@@ -197,7 +428,9 @@ class DCTagSession:
             else:
                 # write the scores and history now
                 self.write_history(clear_history=True)
-                self.write_scores(clear_scores=True)
+                if self.scores:
+                    self.write_scores(clear_scores=True)
+                    self.journal_clear()
                 # make sure the session info is written to the logs
                 # in the next call to self.write_history
                 self._session_info_in_log_up_to_date = False
@@ -231,54 +464,72 @@ class DCTagSession:
                     DCTagSessionClosedWarning)
 
     def autocomplete_linked_features(self):
-        """Autocomplete False for linked features"""
+        """Autocomplete False for linked features
+
+        Wherever one of the linked features is True, the unset
+        scores of all other linked features are set to False.
+        The new scores are recorded as one bulk update per feature.
+        """
+        self._read_score_columns(self.linked_features)
         with self.score_lock:
-            # Create a concatenated array with all current scores
-            fscores = np.zeros((self.event_count, len(self.linked_features)),
-                               dtype=float)
-            for ii, feat in enumerate(self.linked_features):
-                fscores[:, ii] = self.require_dict_score_dataset(
-                    self.scores_cache, feat)
+            # Get all current scores of the linked features
+            for feat in self.linked_features:
+                self.require_dict_score_dataset(self.scores_cache, feat)
+            cols = [self.label_columns[feat] for feat in self.linked_features]
+            labels = self.label_matrix[:, cols]
+            num_true = np.sum(labels == 1, axis=1)
             # Sanity check
-            if np.any(np.nansum(fscores, axis=1) > 1):
+            if np.any(num_true > 1):
                 raise ValueError(
                     f"Some of the scores {self.linked_features} in "
                     + f"{self.path} have ambiguous labels! Make sure that "
                     + "always only one of those scores is labeled as True/Yes."
                     )
             # We are safe
+            mask_true = num_true == 1
             for ii, feat in enumerate(self.linked_features):
-                mask_true = self.scores_cache[feat] == 1
-                for other_feat in self.linked_features:
-                    if other_feat != feat:
-                        mask_nan = np.isnan(self.scores_cache[other_feat])
-                        idx_new = np.where(
-                            np.logical_and(mask_true, mask_nan))[0]
-                        for idx in idx_new:
-                            self.scores.append((other_feat, idx, False))
-                            self.scores_cache[other_feat][idx] = False
+                idx_new = np.flatnonzero(mask_true & (labels[:, ii] < 0))
+                if idx_new.size:
+                    self.scores.append((feat, idx_new, False))
+                    self._write_labels(feat, idx_new, False)
+                    self.journal_append(feat, idx_new, False)
+                    self._update_unlabeled_index([feat], idx_new)
 
     def backup_scores(self, path):
         """Backup current scores in an HDF5 file
 
         This can be used as a last resort to save score data if
         the original `self.path` has gone away for some reason.
+        Only the scores in `self.scores_cache` are written (this
+        includes all scores that were labeled in this session).
         """
         with h5py.File(path, mode="w") as h5:
             with self.score_lock:
                 for feat in self.scores_cache:
-                    h5[feat] = self.scores_cache[feat]
+                    h5[feat] = tristate_to_float(self.scores_cache[feat])
                 h5.attrs["path_original"] = str(self.path)
 
     def close(self):
         """Close this session, flushing everything to `self.path`"""
+        if self.writer is not None:
+            self.writer.stop()
+            self.writer = None
         self.flush()
         with self.score_lock:
             # call this function in the score_lock context again to
             # be on the safe side.
             self.assert_session_open("close the session")
             self._closed = True
+            self._scores_read.clear()
+            self._label_counts_on_disk.clear()
+            self.journal.close()
+            self.path_journal.unlink(missing_ok=True)
             self.path_lock.unlink(missing_ok=True)
+        self.handles.close()
+
+    def count_pending_scores(self):
+        """Return the number of scores that have not been written yet"""
+        return sum([np.size(sc[1]) for sc in list(self.scores)])
 
     def flush(self):
         """Flush all changes made to disk
@@ -287,14 +538,102 @@ class DCTagSession:
         so you may call it in regular intervals using a background
         thread.
         """
-        with self.score_lock:
-            self.assert_session_open("flush the session")
+        with self.write_lock:
+            # Only hold the score_lock while swapping the pending
+            # scores and history, so other threads may continue labeling
+            # while we are writing to `self.path`.
+            with self.score_lock:
+                self.assert_session_open("flush the session")
+                scores = self.scores
+                self.scores = []
+                history = self.history
+                self.history = {}
+                linked_features = self.linked_features
+                journal_count = self.journal.count
             try:
-                self.write_scores(clear_scores=True)
-                self.write_history(clear_history=True)
+                if scores or history:
+                    # write scores and history with the same file handle
+                    with self.handles.get_h5_writable():
+                        self._write_scores(scores, linked_features)
+                        self._write_history(history, linked_features)
             except BaseException as exc:
+                # requeue everything for the next flush
+                with self.score_lock:
+                    self.scores[:0] = scores
+                    for key in history:
+                        self.history.setdefault(key, 0)
+                        self.history[key] += history[key]
                 raise DCTagSessionWriteError(
                     f"Could not write to session {self.path}!") from exc
+            else:
+                # the first `journal_count` records are in `self.path` now
+                with self.score_lock:
+                    self.journal_clear(journal_count)
+
+    def find_unlabeled(self, features, start, direction=1):
+        """Find the next or previous unlabeled event
+
+        Parameters
+        ----------
+        features: str or list of str
+            If this is a single feature, unlabeled events are events
+            for which the score is not set. If this is a list of
+            (linked) features, unlabeled events are events for which
+            none of the scores is True.
+        start: int
+            Event index at which to start searching (inclusive)
+        direction: int
+            Search forward (1) or backward (-1)
+
+        Returns
+        -------
+        index: int
+            Index of the unlabeled event; -1 if there is none
+
+        Notes
+        -----
+        This method is thread-safe. Internally, a bitset of
+        unlabeled events is created for every `features` on first
+        use, which is then updated whenever a score is changed.
+        """
+        if isinstance(features, str):
+            key = ("unset", (features,))
+        else:
+            key = ("no true", tuple(sorted(features)))
+        self._read_score_columns(key[1])
+        with self.score_lock:
+            self.assert_session_open("find unlabeled events")
+            if key not in self._unlabeled_index:
+                self._unlabeled_index[key] = EventBitset(
+                    self._get_unlabeled_mask(key))
+            bitset = self._unlabeled_index[key]
+            if direction > 0:
+                return bitset.find_next(start)
+            else:
+                return bitset.find_prev(start)
+
+    @contextlib.contextmanager
+    def get_dataset(self):
+        """Borrow the dclab dataset of `self.path` for reading
+
+        Use this method as a context manager::
+
+            with session.get_dataset() as ds:
+                image = ds["image"][index]
+
+        The dataset is kept open by the session (see
+        `DCTagSessionHandlePool`) and must not be used outside
+        of the context. This method is thread-safe.
+        """
+        with self.handles.lock:
+            # Check this with the lock acquired, so that the handle is
+            # not reopened (e.g. by a prefetching thread) after `close`.
+            if self._closed:
+                raise DCTagSessionClosedError(
+                    f"The session has been closed! Cannot read from "
+                    f"'{self.path}'.")
+            with self.handles.get_dataset() as ds:
+                yield ds
 
     def get_score(self, feature, index):
         """Return the score of a specific feature at that index
@@ -316,35 +655,269 @@ class DCTagSession:
         This method is thread-safe.
         """
         # We use the score cache for that
+        self._read_score_columns([feature])
         with self.score_lock:
             self.assert_session_open(f"get the score {feature} at {index}")
-            if feature not in self.scores_cache:
+            if (feature not in self.scores_cache
+                    and feature not in self._scores_on_disk):
                 value = np.nan
             else:
+                self.require_dict_score_dataset(self.scores_cache, feature)
                 value = self.scores_cache[feature][index]
-                if not np.isnan(value):
-                    value = bool(round(value))
+                value = np.nan if value < 0 else bool(value)
             return value
 
-    def get_scores_true(self, index):
+    def get_score_features(self):
+        """Return all score features of this session
+
+        This includes the features that are in `self.path` and
+        those that have been labeled in this session.
+        """
+        return sorted(self._scores_on_disk | set(self.scores_cache))
+
+    def get_scores_true(self, index, features=None):
         """Return the feature names that are labeld True for one event
 
         Parameters
         ----------
         index: int
             Event index (starts at 0)
+        features: list of str
+            Only consider these features; defaults to all score
+            features in the session (see `get_score_features`).
 
         Returns
         -------
         features: list of str
             Feature names
         """
-        true_features = []
-        for feature in self.scores_cache:
-            if self.get_score(feature, index) is True:
-                true_features.append(feature)
+        if features is None:
+            features = self.get_score_features()
+        self._read_score_columns(features)
+        with self.score_lock:
+            self.assert_session_open(f"get the True scores at {index}")
+            cols = self._require_label_columns(features)
+            row = self.label_matrix[index]
+            true_features = [feat for feat, col in cols.items()
+                             if row[col] == 1]
         return sorted(true_features)
 
+    def get_events_without_true(self, features, start=0, stop=None):
+        """Return a mask of events not labeled True for any of `features`
+
+        Parameters
+        ----------
+        features: list of str
+            Score features to consider
+        start, stop: int
+            Only return the mask for this range of events
+
+        Returns
+        -------
+        mask: 1d boolean ndarray
+            True for events where none of `features` is True,
+            starting at event `start`.
+
+        Notes
+        -----
+        This method is thread-safe.
+        """
+        if stop is None:
+            stop = self.event_count
+        self._read_score_columns(features)
+        with self.score_lock:
+            self.assert_session_open("get the events without True scores")
+            cols = list(self._require_label_columns(features).values())
+            block = self.label_matrix[start:stop, cols]
+            return ~np.any(block == 1, axis=1)
+
+    def get_label_counts(self, feature):
+        """Return the number of events labeled True, False, or unset
+
+        The counts are updated incrementally whenever a label
+        changes, so this does not scan the scores of all events.
+
+        Parameters
+        ----------
+        feature: str
+            Score feature
+
+        Returns
+        -------
+        counts: dict
+            Dictionary with the keys "true", "false", "unset", and
+            "labeled" (the sum of "true" and "false")
+
+        Notes
+        -----
+        This method is thread-safe. Scores of `self.path` that are
+        not in `self.scores_cache` are counted without loading them
+        into the cache. These counts are computed only once, because
+        scores cannot change without being loaded into the cache.
+        """
+        with self.score_lock:
+            self.assert_session_open(f"get the label counts of {feature}")
+            col = self.label_columns.get(feature)
+            if col is not None:
+                counts = self._label_counts[col]
+            elif feature in self._scores_on_disk:
+                counts = self._label_counts_on_disk.get(feature)
+            else:
+                counts = self.event_count, 0, 0
+        if counts is None:
+            # count the scores in `self.path` (without the score lock)
+            with self.get_dataset() as ds:
+                labels = float_to_tristate(ds.h5file["events"][feature])
+            counts = np.bincount(labels + 1, minlength=3)
+            self._label_counts_on_disk[feature] = counts
+        unset, false, true = counts
+        return {"true": int(true),
+                "false": int(false),
+                "unset": int(unset),
+                "labeled": int(true + false),
+                }
+
+    def get_label_states(self, features, indices=None):
+        """Return the label states of events (e.g. for coloring)
+
+        Parameters
+        ----------
+        features: str or list of str
+            If this is a single feature, the label states are the
+            scores (-1 for unset, 0 for False, 1 for True). If this is
+            a list of (linked) features, the label state of an event
+            is the index of the first feature in `features` that is
+            labeled True (-1 if there is none).
+        indices: 1d ndarray of int
+            Event indices; defaults to all events
+
+        Returns
+        -------
+        states: 1d int8 ndarray
+            Label states of the events
+
+        Notes
+        -----
+        This method is thread-safe.
+        """
+        if indices is None:
+            indices = np.arange(self.event_count)
+        states = np.full(len(indices), -1, dtype=np.int8)
+        self._read_score_columns(
+            [features] if isinstance(features, str) else features)
+        with self.score_lock:
+            self.assert_session_open("get label states")
+            if isinstance(features, str):
+                cols = self._require_label_columns([features])
+                if features in cols:
+                    states[:] = self.label_matrix[indices, cols[features]]
+            else:
+                cols = self._require_label_columns(features)
+                # iterate in reverse, so the first True feature wins
+                for ii in range(len(features) - 1, -1, -1):
+                    if features[ii] in cols:
+                        col = cols[features[ii]]
+                        states[self.label_matrix[indices, col] == 1] = ii
+        return states
+
+    def journal_append(self, feature, index, value):
+        """Append scores to the session journal
+
+        Parameters
+        ----------
+        feature: str
+            Name of the machine-learning feature (e.g. "ml_score_buk")
+        index: int or 1d ndarray of int
+            Event index or indices (starts at 0)
+        value: bool, np.nan, or 1d ndarray
+            Score value(s) (np.nan for resetting)
+
+        Notes
+        -----
+        This method is NOT thread-safe. It is called internally while
+        `self.score_lock` is acquired. The records are written to
+        `self.path_journal` in the background (see
+        `DCTagSessionJournal`).
+        """
+        index = np.atleast_1d(index)
+        if index.size == 0:
+            return
+        value = np.broadcast_to(np.asarray(value, dtype=float), index.shape)
+        records = np.zeros(index.size, dtype=JOURNAL_DTYPE)
+        records["feature"] = feature
+        records["index"] = index
+        records["value"] = np.where(np.isnan(value), -1, value)
+        records["time"] = time.time()
+        self.journal.append(records)
+
+    def journal_clear(self, count=None):
+        """Remove records from the session journal
+
+        Parameters
+        ----------
+        count: int
+            Remove the first `count` records ever appended to the
+            journal (i.e. the records that have already been written
+            to `self.path`, see `DCTagSessionJournal.count`); defaults
+            to removing all records
+
+        Notes
+        -----
+        This method is NOT thread-safe. Use `self.flush` instead!
+        """
+        self.journal.clear(count)
+
+    def load_scores(self, features):
+        """Load score features from `self.path` into the scores cache
+
+        By default, scores are only loaded into `self.scores_cache`
+        when they are first accessed. Use this method to load them
+        in advance (e.g. when the user selects a feature for labeling).
+        Features that are not in `self.path` are ignored.
+
+        Notes
+        -----
+        This method is thread-safe.
+        """
+        self._read_score_columns(features)
+        with self.score_lock:
+            for feat in features:
+                if feat in self._scores_on_disk:
+                    self.require_dict_score_dataset(self.scores_cache, feat)
+
+    def recover_journal(self, h5=None):
+        """Write the scores from the journal of a previous session to disk
+
+        This is called during `__init__`. All records in the journal
+        are written to `self.path` in one go.
+
+        Parameters
+        ----------
+        h5: h5py.File
+            Writable file handle of `self.path`; if not given, `self.path`
+            is opened if there is anything to recover.
+        """
+        if not self.path_journal.exists():
+            return
+        if h5 is None:
+            with h5py.File(self.path, mode="r+") as h5:
+                return self.recover_journal(h5)
+        records = read_journal(self.path_journal)
+        if records.size:
+            scores = []
+            for bfeat in np.unique(records["feature"]):
+                recf = records[records["feature"] == bfeat]
+                values = recf["value"].astype(float)
+                values[recf["value"] < 0] = np.nan
+                scores.append((bfeat.decode("utf-8"), recf["index"], values))
+            # The journal contains the linked features explicitly.
+            updates = coalesce_scores(scores)
+            for feat, (indices, values) in updates.items():
+                sc_ds = self.require_h5_score_dataset(h5, feat)
+                write_sparse(sc_ds, indices, values)
+            self.history["journal records recovered"] = records.size
+        self.path_journal.unlink()
+
     def reset_score(self, feature, index, reset_linked=True):
         """Set the score at `index` to `np.nan`
 
@@ -358,12 +931,14 @@ class DCTagSession:
             Also reset all linked features if `feature` in
             `self.linked_features`.
         """
+        check_score_feature(feature)
         if reset_linked and feature in self.linked_features:
             # Recurse one level and reset all features
             for feat in self.linked_features:
                 self.reset_score(feat, index, reset_linked=False)
         else:
             # Do the actual resetting
+            self._read_score_columns([feature])
             with self.score_lock:
                 self.assert_session_open(
                     f"reset the score {feature} at {index}", strict=True)
@@ -378,8 +953,48 @@ class DCTagSession:
                 self.history.setdefault(key, 0)
                 self.history[key] += 1
 
+                self.journal_append(feature, index, np.nan)
+
                 self.require_dict_score_dataset(self.scores_cache, feature)
-                self.scores_cache[feature][index] = np.nan
+                self._write_labels(feature, index, -1)
+                self._update_unlabeled_index([feature], [index])
+
+    def reset_scores(self, feature, indices, reset_linked=True):
+        """Set the scores of multiple events to `np.nan`
+
+        This is equivalent to calling `reset_score` for every index
+        in `indices`, but much faster.
+
+        Parameters
+        ----------
+        feature: str
+            Name of the machine-learning feature (e.g. "ml_score_buk")
+        indices: 1d ndarray of int
+            Event indices (starts at 0)
+        reset_linked: bool
+            Also reset all linked features if `feature` in
+            `self.linked_features`.
+        """
+        check_score_feature(feature)
+        indices = np.array(indices, dtype=np.int64).ravel()
+        if reset_linked and feature in self.linked_features:
+            # Recurse one level and reset all features
+            for feat in self.linked_features:
+                self.reset_scores(feat, indices, reset_linked=False)
+        else:
+            self._read_score_columns([feature])
+            with self.score_lock:
+                self.assert_session_open(f"reset the scores {feature}",
+                                         strict=True)
+                self.scores.append(
+                    (feature, indices, np.full(indices.size, np.nan)))
+                self.journal_append(feature, indices, np.nan)
+                key = f"{feature} count reset"
+                self.history.setdefault(key, 0)
+                self.history[key] += indices.size
+                self.require_dict_score_dataset(self.scores_cache, feature)
+                self._write_labels(feature, indices, -1)
+                self._update_unlabeled_index([feature], indices)
 
     def set_score(self, feature, index, value):
         """Set the feature score of an event in the current dataset
@@ -398,18 +1013,21 @@ class DCTagSession:
         -----
         This method is thread-safe.
         """
-        if (not (feature.startswith("userdef")
-                 or (feature.startswith("ml_score_") and
-                     len(feature) == len("ml_score_???")))):
-            raise ValueError(
-                "Expected 'ml_score_xxx' or 'userdef*' feature, "
-                + f"got '{feature}'!")
+        check_score_feature(feature)
+        self._read_score_columns([feature] + self.linked_features)
         with self.score_lock:
             self.assert_session_open(f"set the score {feature} at {index}",
                                      strict=True)
             # scores list
             self.scores.append((feature, index, value))
 
+            # journal (including the implications for linked features)
+            self.journal_append(feature, index, value)
+            if value is True and feature in self.linked_features:
+                for feat in self.linked_features:
+                    if feat != feature:
+                        self.journal_append(feat, index, False)
+
             # history list
             # (Note that this count value may be larger than the actual
             # updated number of events of the ml_score, because `feat_list`
@@ -422,12 +1040,102 @@ class DCTagSession:
                 self.require_dict_score_dataset(self.scores_cache, feat)
             self.require_dict_score_dataset(self.scores_cache, feature)
 
-            self.scores_cache[feature][index] = value
+            self._write_labels(feature, index, value)
             self.populate_linked_features(
                 feature=feature,
                 index=index,
                 value=value,
                 linked_feature_dict=self.scores_cache)
+            self._update_unlabeled_index([feature] + self.linked_features,
+                                         [index])
+
+    def set_scores(self, feature, indices, values):
+        """Set the feature scores of multiple events at once
+
+        This is equivalent to calling `set_score` for every pair
+        of `indices` and `values` (in that order), but much faster.
+
+        Parameters
+        ----------
+        feature: str
+            Name of the machine-learning feature (e.g. "ml_score_buk")
+        indices: 1d ndarray of int
+            Event indices (starts at 0)
+        values: bool or 1d ndarray of bool
+            Boolean values indicating whether the events
+            belong to the `feature` class
+
+        Notes
+        -----
+        This method is thread-safe.
+        """
+        check_score_feature(feature)
+        indices = np.array(indices, dtype=np.int64).ravel()
+        values = np.array(np.broadcast_to(values, indices.shape), dtype=bool)
+        self._read_score_columns([feature] + self.linked_features)
+        with self.score_lock:
+            self.assert_session_open(f"set the scores {feature}",
+                                     strict=True)
+            # scores list
+            self.scores.append((feature, indices, values))
+
+            # journal (including the implications for linked features)
+            self.journal_append(feature, indices, values)
+            indices_true = indices[values]
+            linked_true = feature in self.linked_features and indices_true.size
+            if linked_true:
+                for feat in self.linked_features:
+                    if feat != feature:
+                        self.journal_append(feat, indices_true, False)
+
+            # history list
+            num_true = int(np.sum(values))
+            for value, count in [(True, num_true),
+                                 (False, values.size - num_true)]:
+                if count:
+                    key = f"{feature} count {value}"
+                    self.history.setdefault(key, 0)
+                    self.history[key] += count
+
+            for feat in self.linked_features:
+                self.require_dict_score_dataset(self.scores_cache, feat)
+            self.require_dict_score_dataset(self.scores_cache, feature)
+
+            # For duplicate indices, the last value counts.
+            last = indices.size - 1 - np.unique(indices[::-1],
+                                                return_index=True)[1]
+            self._write_labels(feature, indices[last], values[last])
+            # Any True value sets the other linked features to False.
+            if linked_true:
+                for feat in self.linked_features:
+                    if feat != feature:
+                        self._write_labels(feat, indices_true, 0)
+            self._update_unlabeled_index([feature] + self.linked_features,
+                                         indices)
+
+    def start_writer(self, callback=None, **kwargs):
+        """Flush this session regularly in a background thread
+
+        Parameters
+        ----------
+        callback: callable
+            Method that is called with the exception (or None on
+            success) after each flush (from the writer thread)
+        **kwargs:
+            Keyword arguments defining the flush policy, passed to
+            :class:`DCTagSessionWriter`
+
+        Returns
+        -------
+        writer: DCTagSessionWriter
+            The writer thread (also available as `self.writer`);
+            it is stopped when the session is closed.
+        """
+        if self.writer is None:
+            self.writer = DCTagSessionWriter(self, callback=callback,
+                                             **kwargs)
+            self.writer.start()
+        return self.writer
 
     def write_history(self, clear_history=False):
         """Write accomplishments to the history log in `self.path`
@@ -445,22 +1153,10 @@ class DCTagSession:
         -----
         This method is NOT thread-safe. Use `self.flush` instead!
         """
-        if self.history:
-            date = time.strftime("%Y-%m-%d %H:%M:%S")
-            with dclab.RTDCWriter(self.path, mode="append") as hw:
-                if not self._session_info_in_log_up_to_date:
-                    hw.store_log(
-                        "dctag-history",
-                        ["",
-                         f"{date} New session with DCTag {version}",
-                         f"{date} Linked features: {self.linked_features}"
-                         ])
-                for key in sorted(self.history.keys()):
-                    hw.store_log("dctag-history",
-                                 f"{date} {key}: {self.history[key]}")
-            if clear_history:
-                # clear history
-                self.history.clear()
+        self._write_history(self.history, self.linked_features)
+        if clear_history:
+            # clear history
+            self.history.clear()
 
     def write_scores(self, clear_scores=False):
         """Write the machine-learning scores to `self.path`
@@ -475,38 +1171,65 @@ class DCTagSession:
         -----
         This method is NOT thread-safe. Use `self.flush` instead!
         """
-        if self.scores:
-            with h5py.File(self.path, mode="r+") as h5:
-                # make sure that all linked features are available
-                for feat in self.linked_features:
-                    self.require_h5_score_dataset(h5, feat)
-                # populate features
-                for feat, idx, val in self.scores:
-                    sc_ds = self.require_h5_score_dataset(h5, feat)
-                    sc_ds[idx] = val
-                    # Write False to the other linked features
-                    self.populate_linked_features(
-                        feature=feat,
-                        index=idx,
-                        value=val,
-                        linked_feature_dict=h5["events"])
-
-            if clear_scores:
-                self.scores.clear()
-
-    def require_h5_score_dataset(self, h5, feature):
-        """Return dataset in the `h5["events"]` group for `feature`"""
-        if feature not in h5["events"]:
+        self._write_scores(self.scores, self.linked_features)
+        if clear_scores:
+            self.scores.clear()
+
+    def require_h5_score_dataset(self, h5, feature, migrate=True):
+        """Return dataset in the `h5["events"]` group for `feature`
+
+        Score datasets are chunked and compressed. New datasets are
+        NaN-filled via the HDF5 fill value (no data are written).
+        If `migrate` is True, contiguous datasets (e.g. created with
+        a previous version of DCTag) are converted to that layout.
+        Only migrate datasets that are written to, because HDF5 does
+        not reclaim the space of the deleted contiguous dataset (the
+        file grows by the size of the dataset).
+
+        The data are copied to a temporary dataset first, which then
+        replaces the original dataset. If DCTag crashes in between,
+        the migration is cleaned up when the session is opened again
+        (see `recover_migration`).
+        """
+        events = h5["events"]
+        name_tmp = f"{feature}{MIGRATE_SUFFIX}"
+        if feature not in events:
             # create a nan-filled dataset for this feature
-            data = np.zeros(self.event_count, dtype=float) * np.nan
-            h5["events"].create_dataset(feature, data=data)
-        return h5["events"][feature]
+            create_h5_score_dataset(events, feature, size=self.event_count)
+        elif migrate and events[feature].chunks is None:
+            # migrate contiguous dataset
+            if name_tmp in events:
+                # a previous migration was interrupted before deletion
+                del events[name_tmp]
+            ds_tmp = create_h5_score_dataset(events, name_tmp,
+                                             data=events[feature][:])
+            ds_tmp.attrs.update(dict(events[feature].attrs))
+            del events[feature]
+            events.move(name_tmp, feature)
+        return events[feature]
 
     def require_dict_score_dataset(self, ndict, feature):
-        """Return dataset in `ndict` for `feature`"""
+        """Return dataset in `ndict` for `feature`
+
+        If `ndict` is `self.scores_cache`, a new column in
+        `self.label_matrix` is used, and if `feature` is available
+        in `self.path`, the scores are loaded from there (or taken
+        from the scores read by `_read_score_columns`).
+        """
         # internal score cache
         if feature not in ndict:
-            ndict[feature] = np.zeros(self.event_count, dtype=float) * np.nan
+            if ndict is self.scores_cache:
+                if (feature in self._scores_on_disk
+                        and feature not in self._scores_read):
+                    # not read in advance
+                    self._read_score_columns([feature])
+                self._add_label_column(feature)
+                if feature in self._scores_read:
+                    ndict[feature][:] = self._scores_read.pop(feature)
+                    self._label_counts[self.label_columns[feature]] = \
+                        np.bincount(ndict[feature] + 1, minlength=3)
+            else:
+                ndict[feature] = np.full(self.event_count, -1, dtype=np.int8)
         return ndict[feature]
 
     def populate_linked_features(self, feature, index, value,
@@ -521,8 +1244,651 @@ class DCTagSession:
         if value is True and feature in self.linked_features:
             for feat in self.linked_features:
                 if feat != feature:
-                    ln_sc_ds = linked_feature_dict[feat]
-                    ln_sc_ds[index] = False
+                    if linked_feature_dict is self.scores_cache:
+                        self._write_labels(feat, index, False)
+                    else:
+                        linked_feature_dict[feat][index] = False
+
+
+class DCTagSessionHandlePool:
+    def __init__(self, path):
+        """Persistent file handle of a session's .rtdc file
+
+        Opening a file on a network share is expensive (many metadata
+        round trips). This class keeps a dclab dataset of `path` open,
+        so that the widgets (and the session itself) do not have to
+        open `path` for every access.
+
+        Parameters
+        ----------
+        path: pathlib.Path
+            Path to the .rtdc file
+
+        Notes
+        -----
+        HDF5 does not allow opening a file in write mode while it is
+        open in read-only mode in the same process. Thus, the dataset
+        is opened in read/write mode and its HDF5 file is also used
+        for writing (see `get_h5_writable`).
+
+        Reading is serialized by `self.lock`, which makes this class
+        thread-safe. A writer does not hold `self.lock` while it has
+        borrowed the HDF5 file, so that reading is not blocked by a
+        slow write (h5py serializes the individual read and write
+        operations). Writers must acquire `self.lock` for changes
+        that readers could observe in an inconsistent state (e.g.
+        creating or replacing datasets).
+
+        Before the dataset is borrowed, the file status of `path`
+        is compared to the status when the dataset was opened. If the
+        file changed or if the network share was remounted, the dataset
+        is reopened. If an OSError occurs while the dataset is borrowed,
+        it is reopened as well.
+        """
+        #: Path to the .rtdc file
+        self.path = pathlib.Path(path)
+        #: Lock guarding the file handle and reading (reentrant, so that
+        #: the dataset may be borrowed in a nested fashion)
+        self.lock = threading.RLock()
+        #: Number of times a dataset was opened (for debugging)
+        self.open_count = 0
+        # dclab dataset used for reading and writing
+        self._dataset = None
+        # file status of `path` when `self._dataset` was opened
+        self._dataset_stat = None
+        # number of active `get_h5_writable` contexts
+        self._writers = 0
+        # whether to close `self._dataset` when the last writer is done
+        self._close_pending = False
+
+    def _get_stat(self):
+        """Return a tuple identifying the current state of `self.path`"""
+        st = os.stat(self.path)
+        return st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns
+
+    def _require_dataset(self):
+        """Return the dataset, (re)opening it if necessary
+
+        Must be called with `self.lock` acquired.
+        """
+        if self._dataset is not None and not self._writers:
+            # The file status changes while writing, so we only
+            # check it when nobody is writing.
+            try:
+                stat = self._get_stat()
+            except OSError:
+                stat = None
+            if (stat != self._dataset_stat
+                    or not self._dataset.h5file.id.valid):
+                self.close()
+        if self._dataset is None:
+            self._dataset = dclab.new_dataset(self.path,
+                                              h5kwargs={"mode": "r+"})
+            self._dataset_stat = self._get_stat()
+            self.open_count += 1
+        return self._dataset
+
+    def close(self):
+        """Close the dataset (it is reopened on demand)
+
+        If the dataset is currently borrowed for writing, it is
+        closed when the writer is done.
+        """
+        with self.lock:
+            if self._writers:
+                self._close_pending = True
+            elif self._dataset is not None:
+                try:
+                    self._dataset.close()
+                except BaseException:
+                    # The handle might be stale (e.g. share unmounted).
+                    pass
+                self._dataset = None
+                self._dataset_stat = None
+
+    @contextlib.contextmanager
+    def get_dataset(self):
+        """Borrow the dclab dataset of `self.path` for reading
+
+        The dataset must not be used outside of the context.
+        """
+        with self.lock:
+            dataset = self._require_dataset()
+            try:
+                yield dataset
+            except OSError:
+                # reopen the handle the next time
+                self.close()
+                raise
+
+    @contextlib.contextmanager
+    def get_h5_writable(self):
+        """Borrow the h5py file handle of `self.path` for writing
+
+        `self.lock` is not held while the handle is borrowed (see
+        the notes in the class docstring). When the outermost
+        context exits, the file is flushed.
+        """
+        with self.lock:
+            h5 = self._require_dataset().h5file
+            self._writers += 1
+        try:
+            yield h5
+            with self.lock:
+                if self._writers == 1:
+                    # make sure everything is written to `path`
+                    h5.flush()
+                    self._dataset_stat = self._get_stat()
+        except OSError:
+            # reopen the handle the next time
+            self.close()
+            raise
+        finally:
+            with self.lock:
+                self._writers -= 1
+                if not self._writers and self._close_pending:
+                    self._close_pending = False
+                    self.close()
+
+
+class DCTagSessionJournal:
+    def __init__(self, path):
+        """Journal of the scores set in a session (crash recovery)
+
+        The journal is a file of fixed-width records (see
+        `JOURNAL_DTYPE`). To keep the latency of labeling independent
+        of the storage of `path` (e.g. a network share), the records
+        are written by a background thread. `append` and `clear`
+        only put the records and requests into a queue.
+
+        Parameters
+        ----------
+        path: pathlib.Path
+            Path to the journal file
+
+        Notes
+        -----
+        The methods of this class are NOT thread-safe. They are
+        called by the session while `score_lock` is acquired.
+        If the journal cannot be written, a DCTagSessionJournalWarning
+        is issued (from the background thread) and writing is
+        retried with the next record.
+        """
+        #: Path to the journal file
+        self.path = pathlib.Path(path)
+        #: Number of records appended to the journal since it was
+        #: created (including records that were cleared)
+        self.count = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        # journal file handle (only used by the background thread)
+        self._fd = None
+        # number of records that were appended by the background thread
+        self._written = 0
+
+    def _close_file(self):
+        if self._fd is not None:
+            try:
+                self._fd.close()
+            except OSError:
+                pass
+            self._fd = None
+
+    def _open_file(self):
+        if self._fd is None:
+            self._fd = self.path.open("ab")
+            # Make sure we do not continue writing after an
+            # incomplete record.
+            size = self._fd.tell()
+            self._fd.truncate(size - size % JOURNAL_DTYPE.itemsize)
+            self._fd.seek(0, 2)
+        return self._fd
+
+    def _clear(self, count):
+        fd = self._open_file()
+        size = fd.tell()
+        # keep the records that were appended after the first `count`
+        keep = 0 if count is None else self._written - count
+        keep_size = min(keep * JOURNAL_DTYPE.itemsize, size)
+        if keep_size == size:
+            return
+        remainder = b""
+        if keep_size > 0:
+            with self.path.open("rb") as fdr:
+                fdr.seek(size - keep_size)
+                remainder = fdr.read(keep_size)
+        fd.truncate(0)
+        fd.write(remainder)
+        fd.flush()
+
+    def _run(self):
+        while True:
+            action, arg = self._queue.get()
+            try:
+                if action == "close":
+                    self._close_file()
+                    break
+                elif action == "append":
+                    self._written += arg.size
+                    fd = self._open_file()
+                    fd.write(arg.tobytes())
+                    fd.flush()
+                elif action == "clear":
+                    self._clear(arg)
+            except OSError:
+                self._close_file()
+                warnings.warn(
+                    f"Could not write to the session journal {self.path}!",
+                    DCTagSessionJournalWarning)
+            finally:
+                self._queue.task_done()
+
+    def _put(self, action, arg=None):
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name=f"DCTagSessionJournal-{self.path.name}",
+                daemon=True)
+            self._thread.start()
+        self._queue.put((action, arg))
+
+    def append(self, records):
+        """Append records (structured array of `JOURNAL_DTYPE`)"""
+        self.count += records.size
+        self._put("append", records)
+
+    def clear(self, count=None):
+        """Remove the first `count` records (defaults to all records)"""
+        if self._thread is not None:
+            self._put("clear", count)
+
+    def close(self):
+        """Write all pending records and close the journal file
+
+        The journal file is not removed.
+        """
+        if self._thread is not None:
+            self._put("close")
+            self._thread.join()
+            self._thread = None
+
+    def sync(self):
+        """Wait until all pending records are written"""
+        if self._thread is not None:
+            self._queue.join()
+
+
+class DCTagSessionWriter(threading.Thread):
+    def __init__(self, session, callback=None, max_pending=500,
+                 max_interval=60, min_interval=2, latency_factor=10,
+                 poll_interval=0.5):
+        """Background thread that flushes a session with adaptive timing
+
+        The session is flushed when there are pending scores and
+
+        - `max_interval` seconds have passed since the last flush or
+        - there are at least `max_pending` pending scores and the
+          current minimum interval (see `get_interval`) has passed
+          since the last flush.
+
+        Parameters
+        ----------
+        session: DCTagSession
+            The session to flush
+        callback: callable
+            Method that is called with the exception (or None on
+            success) after each flush (from this thread)
+        max_pending: int
+            Number of pending scores that triggers a flush
+        max_interval: float
+            Maximum time between two flushes [s]
+        min_interval: float
+            Minimum time between two flushes [s]
+        latency_factor: float
+            The minimum time between two flushes is at least this
+            factor times the duration of the last flush, so that slow
+            storage is not busy with writing all the time.
+        poll_interval: float
+            Interval for checking the flush criteria [s]
+        """
+        super(DCTagSessionWriter, self).__init__(
+            name=f"DCTagSessionWriter-{session.path.name}", daemon=True)
+        self.session = session
+        self.callback = callback
+        self.max_pending = max_pending
+        self.max_interval = max_interval
+        self.min_interval = min_interval
+        self.latency_factor = latency_factor
+        self.poll_interval = poll_interval
+        #: Duration of the last flush [s]
+        self.latency = 0
+        #: Time of the last flush (`time.monotonic`)
+        self.last_flush = time.monotonic()
+        #: Number of consecutive failed flushes
+        self.failures = 0
+        self._shutdown = threading.Event()
+
+    def flush(self):
+        """Flush the session, measure the latency and call the callback"""
+        t0 = time.monotonic()
+        try:
+            self.session.flush()
+        except BaseException as exc:
+            self.failures += 1
+            error = exc
+        else:
+            self.failures = 0
+            error = None
+        self.last_flush = time.monotonic()
+        self.latency = self.last_flush - t0
+        if self.callback is not None:
+            self.callback(error)
+
+    def get_interval(self):
+        """Return the current minimum interval between two flushes
+
+        The interval grows with the measured write latency and is
+        doubled for every failed flush (up to `max_interval`).
+        """
+        interval = max(self.min_interval, self.latency_factor * self.latency)
+        if self.failures:
+            interval *= 2 ** self.failures
+        return min(interval, self.max_interval)
+
+    def run(self):
+        while not self._shutdown.wait(self.poll_interval):
+            if self.should_flush():
+                self.flush()
+
+    def should_flush(self):
+        """Whether the session should be flushed now"""
+        pending = self.session.count_pending_scores()
+        if not pending or not self.session:
+            return False
+        elapsed = time.monotonic() - self.last_flush
+        if elapsed >= self.max_interval:
+            return True
+        return pending >= self.max_pending and elapsed >= self.get_interval()
+
+    def stop(self):
+        """Stop the thread (a flush in progress is completed)"""
+        self._shutdown.set()
+        if self.is_alive() and threading.current_thread() is not self:
+            self.join()
+
+
+def coalesce_scores(scores, linked_features=None):
+    """Collapse a list of scores into one update per feature
+
+    Parameters
+    ----------
+    scores: list of tuple
+        List of (feature, index, value) in the order set by the user
+        (see `DCTagSession.scores`); `index` and `value` may also be
+        arrays of the same length.
+    linked_features: list of str
+        Linked features (see `DCTagSession`); A True value for
+        one of these features implies False for all the others.
+
+    Returns
+    -------
+    updates: dict
+        Dictionary with features as keys and tuples of (indices, values)
+        as values. The indices are unique and sorted, the float values
+        (1, 0, or nan) are the ones that were set last for each index.
+    """
+    linked_features = linked_features or []
+    features = sorted(set([sc[0] for sc in scores]) | set(linked_features))
+    feat_ids = {feat: ii for ii, feat in enumerate(features)}
+
+    # Convert the scores to flat arrays (feature id, index, value)
+    fids = []
+    idxs = []
+    vals = []
+    # Accumulate scalar entries in lists (much faster than creating
+    # one array for every entry)
+    scalars = ([], [], [])
+    for feat, index, value in scores:
+        if np.ndim(index) == 0:
+            scalars[0].append(feat_ids[feat])
+            scalars[1].append(index)
+            scalars[2].append(value)
+        else:
+            if scalars[0]:
+                fids.append(np.array(scalars[0], dtype=np.int64))
+                idxs.append(np.array(scalars[1], dtype=np.int64))
+                vals.append(np.array(scalars[2], dtype=float))
+                scalars = ([], [], [])
+            index = np.asarray(index, dtype=np.int64)
+            fids.append(np.full(index.size, feat_ids[feat], dtype=np.int64))
+            idxs.append(index)
+            vals.append(np.broadcast_to(np.asarray(value, dtype=float),
+                                        index.shape))
+    if scalars[0]:
+        fids.append(np.array(scalars[0], dtype=np.int64))
+        idxs.append(np.array(scalars[1], dtype=np.int64))
+        vals.append(np.array(scalars[2], dtype=float))
+
+    if not fids:
+        return {}
+
+    fid = np.concatenate(fids)
+    idx = np.concatenate(idxs)
+    val = np.concatenate(vals)
+    # The sequence number defines the order in which scores were set
+    seq = np.arange(fid.size)
+
+    # Setting a linked feature to True sets all other linked features
+    # to False (at the same position in the sequence).
+    linked_ids = [feat_ids[feat] for feat in linked_features]
+    mask_true = np.logical_and(np.isin(fid, linked_ids), val == 1)
+    if np.any(mask_true):
+        ext_fid = [fid]
+        ext_idx = [idx]
+        ext_val = [val]
+        ext_seq = [seq]
+        for lid in linked_ids:
+            mask_other = np.logical_and(mask_true, fid != lid)
+            size = np.sum(mask_other)
+            ext_fid.append(np.full(size, lid, dtype=np.int64))
+            ext_idx.append(idx[mask_other])
+            ext_val.append(np.zeros(size, dtype=float))
+            ext_seq.append(seq[mask_other])
+        fid = np.concatenate(ext_fid)
+        idx = np.concatenate(ext_idx)
+        val = np.concatenate(ext_val)
+        seq = np.concatenate(ext_seq)
+
+    # Sort by feature, then index, then sequence and only keep the last
+    # entry for every (feature, index) pair (last write wins).
+    order = np.lexsort((seq, idx, fid))
+    fid = fid[order]
+    idx = idx[order]
+    val = val[order]
+    mask_last = np.ones(fid.size, dtype=bool)
+    mask_last[:-1] = np.logical_or(fid[1:] != fid[:-1], idx[1:] != idx[:-1])
+    fid = fid[mask_last]
+    idx = idx[mask_last]
+    val = val[mask_last]
+
+    updates = {}
+    bounds = np.searchsorted(fid, np.arange(len(features) + 1))
+    for ii, feat in enumerate(features):
+        start, stop = bounds[ii], bounds[ii + 1]
+        if stop > start:
+            updates[feat] = (idx[start:stop], val[start:stop])
+    return updates
+
+
+def write_sparse(dataset, indices, values, chunk_size=None):
+    """Write values at sorted, unique indices to an HDF5 dataset
+
+    Instead of writing every value individually, the indices are
+    grouped by the HDF5 chunks they fall into. Runs of adjacent
+    chunks that contain indices are written as contiguous hyperslabs
+    (read-modify-write if there are gaps), so only the chunks that
+    are touched are read and written. Isolated indices are written
+    in one go with fancy indexing.
+
+    Parameters
+    ----------
+    dataset: h5py.Dataset
+        One-dimensional dataset to write to
+    indices: 1d ndarray of int
+        Sorted, unique indices
+    values: 1d ndarray
+        Values to write at `indices`
+    chunk_size: int
+        Size of the blocks into which the indices are grouped;
+        defaults to the chunk size of `dataset` (or `SCORE_CHUNK_SIZE`
+        for contiguous datasets)
+    """
+    if indices.size == 0:
+        return
+    if chunk_size is None:
+        chunk_size = dataset.chunks[0] if dataset.chunks else SCORE_CHUNK_SIZE
+    chunk_ids = indices // chunk_size
+    # start a new block wherever a chunk without indices lies in between
+    breaks = np.flatnonzero(np.diff(chunk_ids) > 1) + 1
+    singles_idx = []
+    singles_val = []
+    for bidx, bval in zip(np.split(indices, breaks),
+                          np.split(values, breaks)):
+        if bidx.size == 1:
+            singles_idx.append(bidx[0])
+            singles_val.append(bval[0])
+            continue
+        start = bidx[0]
+        stop = bidx[-1] + 1
+        if stop - start == bidx.size:
+            # contiguous block
+            dataset[start:stop] = bval
+        else:
+            block = dataset[start:stop]
+            block[bidx - start] = bval
+            dataset[start:stop] = block
+    if len(singles_idx) == 1:
+        dataset[singles_idx[0]] = singles_val[0]
+    elif singles_idx:
+        dataset[np.array(singles_idx)] = np.array(singles_val)
+
+
+def read_journal(path):
+    """Return the records of a session journal as a structured array
+
+    An incomplete record at the end of the journal (e.g. if DCTag
+    crashed while writing it) is ignored.
+    """
+    data = pathlib.Path(path).read_bytes()
+    size = len(data) - len(data) % JOURNAL_DTYPE.itemsize
+    return np.frombuffer(data[:size], dtype=JOURNAL_DTYPE)
+
+
+def check_score_feature(feature):
+    """Raise a ValueError if `feature` cannot be labeled with DCTag
+
+    The names of 'userdef*' features are limited by the size of
+    the feature field in the session journal (`JOURNAL_DTYPE`).
+    """
+    if (not (feature.startswith("userdef")
+             or (feature.startswith("ml_score_") and
+                 len(feature) == len("ml_score_???")))):
+        raise ValueError(
+            "Expected 'ml_score_xxx' or 'userdef*' feature, "
+            + f"got '{feature}'!")
+    max_size = JOURNAL_DTYPE["feature"].itemsize
+    if len(feature.encode("utf-8")) > max_size:
+        raise ValueError(
+            f"The feature name '{feature}' is too long, only {max_size} "
+            + "characters are supported!")
+
+
+def create_h5_score_dataset(group, feature, size=None, data=None):
+    """Create a chunked and compressed score dataset
+
+    Parameters
+    ----------
+    group: h5py.Group
+        Group in which to create the dataset (usually `h5["events"]`)
+    feature: str
+        Name of the score feature
+    size: int
+        Number of events (only required if `data` is not given)
+    data: 1d ndarray
+        Initial data for the dataset; if not set, the dataset is
+        filled with NaN values.
+    """
+    if data is not None:
+        size = len(data)
+    return group.create_dataset(
+        feature,
+        shape=(size,),
+        dtype=float,
+        data=data,
+        fillvalue=np.nan,
+        chunks=(max(1, min(size, SCORE_CHUNK_SIZE)),),
+        **hdf5plugin.Zstd(clevel=5))
+
+
+def float_to_tristate(data, chunk_size=1_000_000):
+    """Convert float scores to the int8 representation of the scores cache
+
+    NaN values are converted to -1 (unset), all other values are
+    rounded to 0 (False) or 1 (True). `data` may also be an HDF5
+    dataset, which is then read in chunks of `chunk_size`.
+    """
+    tristate = np.empty(len(data), dtype=np.int8)
+    for start in range(0, len(data), chunk_size):
+        chunk = np.asarray(data[start:start + chunk_size], dtype=float)
+        tristate[start:start + chunk.size] = np.where(
+            np.isnan(chunk), -1, np.round(chunk) > 0)
+    return tristate
+
+
+def tristate_to_float(tristate):
+    """Convert int8 scores from the scores cache to float (NaN for unset)"""
+    data = np.asarray(tristate, dtype=float)
+    data[tristate < 0] = np.nan
+    return data
+
+
+def get_event_count(h5):
+    """Return the number of events in an open .rtdc file
+
+    The event count is taken from the "experiment:event count"
+    attribute or, if that is not set, from the length of the
+    first feature in the "events" group.
+    """
+    count = h5.attrs.get("experiment:event count")
+    if count is None:
+        for feat in sorted(h5.get("events", {})):
+            if isinstance(h5["events"][feat], h5py.Dataset):
+                count = len(h5["events"][feat])
+                break
+        else:
+            raise ValueError(f"Could not determine event count of {h5}!")
+    return int(count)
+
+
+def recover_migration(h5):
+    """Clean up score dataset migrations interrupted by a crash
+
+    If the original dataset still exists, the temporary dataset
+    is removed. Otherwise, the temporary dataset (which contains
+    all data) is renamed to the original dataset.
+    """
+    events = h5["events"]
+    for name in list(events):
+        if name.endswith(MIGRATE_SUFFIX):
+            feature = name[:-len(MIGRATE_SUFFIX)]
+            if feature in events:
+                del events[name]
+            else:
+                events.move(name, feature)
+
+
+def is_score_feature(feature):
+    """Return True if `feature` is an "ml_score_*" or "userdef*" feature"""
+    return feature.startswith("ml_score_") or feature.startswith("userdef")
 
 
 def is_dctag_session(path):
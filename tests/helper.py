@@ -1,6 +1,9 @@
 import pathlib
 import shutil
 import tempfile
+import time
+
+from PyQt5 import QtCore, QtWidgets
 
 
 data_path = pathlib.Path(__file__).parent / "data"
@@ -17,3 +20,23 @@ def get_clean_data_path():
 
 def get_raw_string(some_string):
     return f"{some_string}".encode('unicode_escape').decode()
+
+
+def process_events_until(condition, timeout=5):
+    """Process Qt events until `condition()` returns True
+
+    Unlike `qtbot.waitUntil`, this does not run a nested event loop
+    (which would process deferred deletes of widgets from other tests).
+    """
+    tstart = time.monotonic()
+    while not condition():
+        if time.monotonic() - tstart > timeout:
+            raise TimeoutError("Condition not met in time!")
+        QtWidgets.QApplication.processEvents(
+            QtCore.QEventLoop.ProcessEventsFlag.AllEvents, 50)
+
+
+def wait_for_event_shown(tab):
+    """Wait until the current event of a labeling tab is rendered"""
+    process_events_until(
+        lambda: tab.widget_vis.event_index == tab.event_index)
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from dctag.bitset import EventBitset
+
+
+def brute_next(mask, start):
+    idx = np.flatnonzero(mask[max(start, 0):])
+    return int(idx[0]) + max(start, 0) if idx.size else -1
+
+
+def brute_prev(mask, start):
+    if start < 0:
+        return -1
+    idx = np.flatnonzero(mask[:start + 1])
+    return int(idx[-1]) if idx.size else -1
+
+
+@pytest.mark.parametrize("size", [1, 63, 64, 65, 1000, 100_000])
+@pytest.mark.parametrize("density", [0, 0.0001, 0.01, 0.5, 1])
+def test_find_next_prev(size, density):
+    rng = np.random.default_rng(size)
+    mask = rng.random(size) < density
+    bs = EventBitset(mask)
+    assert bs.count() == np.sum(mask)
+    starts = list(rng.integers(0, size, 50)) + [-1, 0, size - 1, size]
+    for start in starts:
+        assert bs.find_next(start) == brute_next(mask, start)
+        assert bs.find_prev(start) == brute_prev(mask, min(start, size - 1))
+
+
+def test_getitem():
+    mask = np.zeros(130, dtype=bool)
+    mask[[0, 64, 129]] = True
+    bs = EventBitset(mask)
+    for ii in range(130):
+        assert bs[ii] == mask[ii]
+
+
+def test_update():
+    rng = np.random.default_rng(42)
+    mask = rng.random(5000) < 0.5
+    bs = EventBitset(mask)
+    for _ in range(20):
+        indices = rng.choice(5000, 30, replace=False)
+        values = rng.random(30) < 0.2
+        bs.update(indices, values)
+        mask[indices] = values
+        assert np.all(EventBitset(mask).words == bs.words)
+    bs.update([], True)
+    bs.update(4999, False)
+    assert not bs[4999]
+    assert bs.find_next(4999) == -1
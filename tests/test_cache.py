@@ -0,0 +1,79 @@
+import gc
+
+import numpy as np
+
+from dctag import cache
+
+
+class Session:
+    """Stand-in for a DCTagSession"""
+
+
+def test_cache_budget_lru():
+    sc = cache.SessionCache(max_bytes=3000)
+    session = Session()
+    for ii in range(3):
+        sc.put((session, ii), np.zeros(100))  # 800 bytes
+    assert sc.nbytes == 2400
+    # access 0, so 1 is the least recently used entry
+    assert sc.get((session, 0)) is not None
+    sc.put((session, 3), np.zeros(100))
+    assert (session, 1) not in sc
+    assert (session, 0) in sc
+    assert sc.nbytes == 2400
+    assert sc.get((session, 1)) is None
+    info = sc.info()
+    assert info["hits"] == 1
+    assert info["misses"] == 1
+    assert info["entries"] == 3
+    # too large for the cache
+    sc.put((session, 4), np.zeros(1000))
+    assert (session, 4) not in sc
+    # replacing an entry
+    sc.put((session, 0), {"image": np.zeros(10), "mask": np.zeros(10)})
+    assert sc.nbytes == 1760
+
+
+def test_cache_resize():
+    sc = cache.SessionCache(max_bytes=3000)
+    session = Session()
+    for ii in range(3):
+        sc.put((session, ii), np.zeros(100))  # 800 bytes
+    sc.resize(2000)
+    assert sc.max_bytes == 2000
+    assert sc.nbytes == 1600
+    assert (session, 0) not in sc
+    assert (session, 2) in sc
+
+
+def test_cache_sessions():
+    sc = cache.SessionCache(max_bytes=10000)
+    session1 = Session()
+    session2 = Session()
+    sc.put((session1, "a"), np.zeros(10))
+    sc.put((session2, "a"), np.ones(10))
+    assert sc.get((session1, "a"))[0] == 0
+    assert sc.get((session2, "a"))[0] == 1
+    sc.clear(session1)
+    assert (session1, "a") not in sc
+    assert (session2, "a") in sc
+    # entries are removed when the session is garbage-collected
+    del session2
+    gc.collect()
+    assert len(sc) == 0
+    assert sc.nbytes == 0
+
+
+def test_get_nbytes_views():
+    image = np.zeros((10, 20), dtype=np.uint8)
+    # a view is charged with the array that owns the memory, once
+    assert cache.get_nbytes(image[2:4, 5:10]) == 200
+    assert cache.get_nbytes({"image": image,
+                             "image_cropped": image[2:4, 5:10],
+                             "mask": np.zeros(10, dtype=bool)}) == 210
+    assert cache.get_nbytes([image, image.T]) == 200
+
+
+def test_get_default_cache_size():
+    size = cache.get_default_cache_size()
+    assert 256 * 1024**2 <= size <= 8 * 1024**3
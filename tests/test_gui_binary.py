@@ -1,11 +1,15 @@
 import pathlib
+import time
 
+import numpy as np
 from PyQt5 import QtCore, QtWidgets
 import pytest
 
 from dctag import session
+from dctag.gui import widget_vis
 from dctag.gui.main import DCTag
-from .helper import get_clean_data_path
+from .helper import (get_clean_data_path, process_events_until,
+                     wait_for_event_shown)
 
 
 data_dir = pathlib.Path(__file__).parent / "data"
@@ -162,9 +166,11 @@ def test_event_push_buttons(qtbot, mw):
     # now label a little
     qtbot.mouseClick(mw.tab_binary.pushButton_fast_next, QtCore.Qt.LeftButton)
     assert mw.tab_binary.event_index == 4
+    wait_for_event_shown(mw.tab_binary)
     qtbot.mouseClick(mw.tab_binary.pushButton_yes, QtCore.Qt.LeftButton)
     assert mw.tab_binary.event_index == 5
     assert mw.tab_binary.label_score_prev.text() == "Yes"
+    wait_for_event_shown(mw.tab_binary)
     qtbot.mouseClick(mw.tab_binary.pushButton_no, QtCore.Qt.LeftButton)
     assert mw.tab_binary.event_index == 6
     assert mw.tab_binary.label_score_prev.text() == "No"
@@ -173,7 +179,9 @@ def test_event_push_buttons(qtbot, mw):
     qtbot.mouseClick(mw.tab_binary.pushButton_next, QtCore.Qt.LeftButton)
     qtbot.mouseClick(mw.tab_binary.pushButton_next, QtCore.Qt.LeftButton)
     assert mw.tab_binary.event_index == 8
+    wait_for_event_shown(mw.tab_binary)
     qtbot.mouseClick(mw.tab_binary.pushButton_no, QtCore.Qt.LeftButton)
+    wait_for_event_shown(mw.tab_binary)
     qtbot.mouseClick(mw.tab_binary.pushButton_no, QtCore.Qt.LeftButton)
     assert mw.tab_binary.event_index == 10
     qtbot.mouseClick(mw.tab_binary.pushButton_fast_prev, QtCore.Qt.LeftButton)
@@ -182,7 +190,9 @@ def test_event_push_buttons(qtbot, mw):
     # go to the end and then test fast_next
     mw.tab_binary.goto_event(16)
     assert mw.tab_binary.event_index == 16
+    wait_for_event_shown(mw.tab_binary)
     qtbot.mouseClick(mw.tab_binary.pushButton_no, QtCore.Qt.LeftButton)
+    wait_for_event_shown(mw.tab_binary)
     qtbot.mouseClick(mw.tab_binary.pushButton_no, QtCore.Qt.LeftButton)
     qtbot.mouseClick(mw.tab_binary.pushButton_prev, QtCore.Qt.LeftButton)
     qtbot.mouseClick(mw.tab_binary.pushButton_prev, QtCore.Qt.LeftButton)
@@ -276,3 +286,259 @@ def test_update_spinBox(event_index, expected, qtbot, mw):
     mw.tab_binary.goto_event(event_index)
     # check if spinBox is updated correspondingly
     assert mw.tab_binary.spinBox_jump_to.value() == expected + 1
+
+
+def goto_event_and_wait(tab, index):
+    """Navigate to an event and wait until it is shown"""
+    tab.goto_event(index)
+    process_events_until(lambda: tab.widget_vis.event_index == index)
+
+
+def test_prefetch_events(qtbot, mw):
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "dctag-tester"):
+        pass
+    mw.on_action_open(path)
+    mw.tabWidget.setCurrentIndex(1)
+    qtbot.mouseClick(mw.tab_binary.pushButton_start, QtCore.Qt.LeftButton)
+    vis = mw.tab_binary.widget_vis
+
+    goto_event_and_wait(mw.tab_binary, 5)
+    goto_event_and_wait(mw.tab_binary, 6)
+    assert 2 <= vis.get_prefetch_depth() <= 16
+    # events are prefetched in navigation direction
+    depth = len(vis.prefetch_futures)
+    assert sorted(vis.prefetch_futures) == list(range(7, 7 + depth))
+    data = vis.prefetch_futures[7].result()[7]
+    assert "image_contour" in data
+    # the cropped image is a view of the image
+    assert np.shares_memory(data["image_cropped"], data["image"])
+    # the prefetched data are used
+    goto_event_and_wait(mw.tab_binary, 7)
+    assert vis.image_channel.image is data["image"]
+
+    # change direction
+    goto_event_and_wait(mw.tab_binary, 6)
+    assert vis.prefetch_futures
+    for index in vis.prefetch_futures:
+        assert index < 6
+    # event 5 has already been loaded
+    assert 5 not in vis.prefetch_futures
+    assert (mw.session, ("event", 5)) in widget_vis.EVENT_CACHE
+
+    # prefetching stops at the end of the dataset
+    goto_event_and_wait(mw.tab_binary, 17)
+    assert not vis.prefetch_futures
+
+    mw.on_action_close()
+    assert not vis.prefetch_futures
+
+
+def test_scatter_plots_shared_events(qtbot, mw):
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "dctag-tester"):
+        pass
+    mw.on_action_open(path)
+    mw.tabWidget.setCurrentIndex(1)
+    vis = mw.tab_binary.widget_vis
+    process_events_until(lambda: vis.session is mw.session)
+    indices = vis.get_scatter_indices(mw.session)
+    assert len(indices) == 18
+    area_um = vis.get_feature_data(mw.session, "area_um")
+    bright_avg = vis.get_feature_data(mw.session, "bright_avg")
+    for plot, (featx, featy) in zip(vis.scatter_plots,
+                                    widget_vis.SCATTER_FEAT):
+        x, y = plot.scatter_data
+        assert np.all(x == vis.get_feature_data(mw.session, featx)[indices])
+        assert np.all(y == vis.get_feature_data(mw.session, featy)[indices])
+
+    # brushing in one plot highlights the events in all plots
+    plot = vis.scatter_plots[1]  # area_um vs. bright_avg
+    rect = QtCore.QRectF(0, 0, np.median(area_um), 1000)
+    plot.on_brushed(rect)
+    expected = area_um[indices] <= np.median(area_um)
+    assert np.all(vis.scatter_selection == expected)
+    for plot in vis.scatter_plots:
+        hx, hy = plot.highlight.getData()
+        assert len(hx) == np.sum(expected)
+    hx, hy = vis.scatter_plots[3].highlight.getData()  # time vs. bright_avg
+    assert np.all(hy == bright_avg[indices][expected])
+    # empty selection
+    vis.scatter_plots[0].on_brushed(QtCore.QRectF(-10, -10, 1, 1))
+    assert vis.scatter_selection is None
+    assert len(vis.scatter_plots[2].highlight.getData()[0]) == 0
+
+
+def test_scatter_plots_label_colors(qtbot, mw):
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "dctag-tester") as dts:
+        dts.set_score("ml_score_r1f", 0, True)
+        dts.set_score("ml_score_r1f", 1, False)
+    mw.on_action_open(path)
+    mw.tabWidget.setCurrentIndex(1)
+    idx = mw.tab_binary.comboBox_score.findData("ml_score_r1f")
+    mw.tab_binary.comboBox_score.setCurrentIndex(idx)
+    qtbot.mouseClick(mw.tab_binary.pushButton_start, QtCore.Qt.LeftButton)
+    vis = mw.tab_binary.widget_vis
+    process_events_until(lambda: vis.scatter_states is not None)
+    indices = vis.get_scatter_indices(mw.session)
+    assert np.all(indices == np.arange(18))
+    colors = [widget_vis.get_scatter_brush(c)
+              for c in widget_vis.SCATTER_COLORS_BINARY]
+    brushes = vis.scatter_plots[0].scatter.data["brush"]
+    assert brushes[0] is colors[2]
+    assert brushes[1] is colors[1]
+    assert brushes[2] is colors[0]
+
+    # labeling one event only updates the brush of that point
+    scatter = vis.scatter_plots[2].scatter
+    scatter.data["sourceRect"]["w"] = 1  # pretend all symbols are cached
+    goto_event_and_wait(mw.tab_binary, 2)
+    qtbot.mouseClick(mw.tab_binary.pushButton_yes, QtCore.Qt.LeftButton)
+    process_events_until(lambda: vis.event_index == 3)
+    assert vis.scatter_states[2] == 1
+    assert scatter.data["brush"][2] is colors[2]
+    assert np.all(scatter.data["sourceRect"]["w"][3:] == 1)
+    assert np.all(scatter.data["sourceRect"]["w"][:2] == 1)
+
+
+def test_scatter_plots_density_mode(qtbot, mw):
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "dctag-tester"):
+        pass
+    mw.on_action_open(path)
+    mw.tabWidget.setCurrentIndex(1)
+    vis = mw.tab_binary.widget_vis
+    process_events_until(lambda: vis.session is mw.session)
+    plot = vis.scatter_plots[0]
+    assert not plot.density.isVisible()
+    vis.checkBox_density.setChecked(True)
+    assert plot.density.isVisible()
+    assert not plot.scatter.isVisible()
+    # all events are in the density image
+    image = plot.density.image
+    assert image.shape == widget_vis.DENSITY_BINS[::-1]
+    assert np.isclose(np.sum(np.expm1(image)), 18, atol=1e-3)
+    # the image is cached
+    key = (mw.session, ("density",) + tuple(widget_vis.SCATTER_FEAT[0]))
+    assert key in widget_vis.EVENT_CACHE
+    vis.checkBox_density.setChecked(False)
+    assert not plot.density.isVisible()
+    assert plot.scatter.isVisible()
+
+
+def test_goto_event_latest_wins(qtbot, mw):
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "dctag-tester"):
+        pass
+    mw.on_action_open(path)
+    mw.tabWidget.setCurrentIndex(1)
+    qtbot.mouseClick(mw.tab_binary.pushButton_start, QtCore.Qt.LeftButton)
+    vis = mw.tab_binary.widget_vis
+    goto_event_and_wait(mw.tab_binary, 0)
+
+    shown = []
+    set_event = vis.set_event
+
+    def set_event_spy(session, event_index, *args, **kwargs):
+        shown.append(event_index)
+        return set_event(session, event_index, *args, **kwargs)
+
+    vis.set_event = set_event_spy
+    # navigation is immediate, rendering is not
+    for index in range(1, 11):
+        mw.tab_binary.goto_event(index)
+    assert mw.tab_binary.event_index == 10
+    assert mw.tab_binary.spinBox_jump_to.value() == 11
+    assert vis.event_index == 0
+    # only the latest event is rendered
+    process_events_until(lambda: vis.event_index == 10)
+    assert shown == [10]
+
+
+def test_label_event_render_pending(qtbot, mw):
+    """Labeling while a render is pending labels the event shown"""
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "dctag-tester"):
+        pass
+    mw.on_action_open(path)
+    mw.tabWidget.setCurrentIndex(1)
+    idx = mw.tab_binary.comboBox_score.findData("ml_score_r1f")
+    mw.tab_binary.comboBox_score.setCurrentIndex(idx)
+    qtbot.mouseClick(mw.tab_binary.pushButton_start, QtCore.Qt.LeftButton)
+    vis = mw.tab_binary.widget_vis
+    goto_event_and_wait(mw.tab_binary, 2)
+    # the user presses a key before event 5 is rendered
+    mw.tab_binary.goto_event(5)
+    assert vis.is_render_pending
+    mw.tab_binary.pushButton_yes.click()
+    assert mw.session.get_score("ml_score_r1f", 2) is True
+    assert np.isnan(mw.session.get_score("ml_score_r1f", 5))
+    # labeling continues after the labeled event
+    assert mw.tab_binary.event_index == 3
+    process_events_until(lambda: vis.event_index == 3)
+    assert not vis.is_render_pending
+    mw.tab_binary.pushButton_no.click()
+    assert mw.session.get_score("ml_score_r1f", 3) is False
+    assert mw.tab_binary.event_index == 4
+    mw.on_action_close()
+
+
+def test_playback(qtbot, mw):
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "dctag-tester"):
+        pass
+    mw.on_action_open(path)
+    mw.tabWidget.setCurrentIndex(1)
+    idx = mw.tab_binary.comboBox_score.findData("ml_score_r1f")
+    mw.tab_binary.comboBox_score.setCurrentIndex(idx)
+    qtbot.mouseClick(mw.tab_binary.pushButton_start, QtCore.Qt.LeftButton)
+    vis = mw.tab_binary.widget_vis
+    player = mw.tab_binary.widget_playback
+    player.spinBox_rate.setValue(50)
+    player.toolButton_play.click()
+    assert player.is_playing
+    assert vis.frame_budget == 1 / 50
+    process_events_until(lambda: vis.event_index is not None
+                         and vis.event_index >= 4)
+    assert player.fps is not None
+    assert player.label_fps.text().endswith("fps")
+    # labeling during playback labels the event shown and continues
+    qtbot.mouseClick(mw.tab_binary.pushButton_yes, QtCore.Qt.LeftButton)
+    labeled = mw.session.get_events_without_true(["ml_score_r1f"])
+    assert np.sum(~labeled) == 1
+    assert player.is_playing
+    # playback stops at the last event
+    process_events_until(lambda: not player.is_playing)
+    assert mw.tab_binary.event_index == 17
+    assert vis.frame_budget is None
+
+
+def test_playback_does_not_skip_events(qtbot, mw):
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "dctag-tester"):
+        pass
+    mw.on_action_open(path)
+    mw.tabWidget.setCurrentIndex(1)
+    qtbot.mouseClick(mw.tab_binary.pushButton_start, QtCore.Qt.LeftButton)
+    vis = mw.tab_binary.widget_vis
+    player = mw.tab_binary.widget_playback
+    goto_event_and_wait(mw.tab_binary, 0)
+
+    shown = []
+    set_event = vis.set_event
+
+    def set_event_slow(session, event_index, *args, **kwargs):
+        # the visualization cannot keep up with the playback rate
+        time.sleep(.05)
+        shown.append(event_index)
+        return set_event(session, event_index, *args, **kwargs)
+
+    vis.set_event = set_event_slow
+    player.spinBox_rate.setValue(60)
+    player.toolButton_play.click()
+    process_events_until(lambda: not player.is_playing)
+    # every event is shown, none is skipped
+    assert np.all(np.diff(shown) <= 1)
+    assert shown[-1] == 17
+    assert mw.tab_binary.event_index == 17
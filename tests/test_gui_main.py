@@ -12,7 +12,8 @@ import dctag
 from dctag import session
 from dctag.gui.main import DCTag
 
-from .helper import get_clean_data_path
+from .helper import (get_clean_data_path, process_events_until,
+                     wait_for_event_shown)
 
 
 data_dir = pathlib.Path(__file__).parent / "data"
@@ -47,9 +48,13 @@ def test_action_backup(with_delete, qtbot, mw):
     # go through the tabs
     mw.tabWidget.setCurrentIndex(1)
     qtbot.mouseClick(mw.tab_binary.pushButton_start, QtCore.Qt.LeftButton)
-    qtbot.mouseClick(mw.tab_binary.pushButton_yes, QtCore.Qt.LeftButton)
-    qtbot.mouseClick(mw.tab_binary.pushButton_no, QtCore.Qt.LeftButton)
-    qtbot.mouseClick(mw.tab_binary.pushButton_yes, QtCore.Qt.LeftButton)
+    # events are rendered asynchronously
+    for button in [mw.tab_binary.pushButton_yes,
+                   mw.tab_binary.pushButton_no,
+                   mw.tab_binary.pushButton_yes]:
+        wait_for_event_shown(mw.tab_binary)
+        qtbot.mouseClick(button, QtCore.Qt.LeftButton)
+    process_events_until(lambda: mw.tab_binary.widget_vis.event_index == 3)
 
     if with_delete:
         path.unlink()
@@ -158,3 +163,50 @@ def test_init_print_version(qtbot):
 
     assert mock_exit.call_args.args[0] == 0
     assert mock_stdout.getvalue().strip() == dctag.__version__
+
+
+def test_session_open_recover(mw):
+    path = get_clean_data_path()
+    dts = session.DCTagSession(path, "dctag-tester")
+    dts.set_score("ml_score_r1f", 2, True)
+    # simulate a crash
+    dts.journal.close()
+    del dts
+
+    with mock.patch.object(QtWidgets.QMessageBox, "question",
+                           return_value=QtWidgets.QMessageBox.Yes):
+        mw.on_action_open(path)
+
+    assert mw.session
+    assert mw.session.get_score("ml_score_r1f", 2) is True
+    mw.on_action_close()
+    with h5py.File(path, "r") as h5:
+        assert h5["events/ml_score_r1f"][2] == 1
+
+
+def test_session_flushed_statusbar(mw):
+    mw.session_flushed.emit(OSError("share is gone"))
+    QtWidgets.QApplication.processEvents(QtCore.QEventLoop.AllEvents, 300)
+    assert "Saving failed with OSError: share is gone" \
+        in mw.statusBar().currentMessage()
+    mw.session_flushed.emit(None)
+    QtWidgets.QApplication.processEvents(QtCore.QEventLoop.AllEvents, 300)
+    assert "Session flushed." in mw.statusBar().currentMessage()
+
+
+def test_action_flush_statusbar(mw):
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "dctag-tester"):
+        pass
+    mw.on_action_open(path)
+    mw.session.set_score("ml_score_r1f", 0, True)
+    with mock.patch.object(mw.session, "flush",
+                           side_effect=OSError("share is gone")):
+        mw.on_action_flush()
+    assert "Saving failed with OSError: share is gone" \
+        in mw.statusBar().currentMessage()
+    mw.on_action_flush()
+    assert "Session flushed." in mw.statusBar().currentMessage()
+    mw.on_action_close()
+    with h5py.File(path, "r") as h5:
+        assert h5["events/ml_score_r1f"][0] == 1
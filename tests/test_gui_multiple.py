@@ -5,7 +5,7 @@ from PyQt5 import QtCore, QtWidgets
 import pytest
 
 from dctag import session
-from .helper import get_clean_data_path
+from .helper import get_clean_data_path, wait_for_event_shown
 
 
 data_dir = pathlib.Path(__file__).parent / "data"
@@ -188,10 +188,12 @@ def test_event_push_buttons(qtbot, mw):
     qtbot.mouseClick(mw.tab_multiple.pushButton_fast_next,
                      QtCore.Qt.LeftButton)
     assert mw.tab_multiple.event_index == 4
+    wait_for_event_shown(mw.tab_multiple)
     qtbot.mouseClick(mw.tab_multiple.label_buttons[0].pushButton,
                      QtCore.Qt.LeftButton)
     assert mw.tab_multiple.event_index == 5
     assert mw.tab_multiple.label_score_prev.text() == "R1F"
+    wait_for_event_shown(mw.tab_multiple)
     qtbot.mouseClick(mw.tab_multiple.label_buttons[1].pushButton,
                      QtCore.Qt.LeftButton)
     assert mw.tab_multiple.event_index == 6
@@ -201,8 +203,10 @@ def test_event_push_buttons(qtbot, mw):
     qtbot.mouseClick(mw.tab_multiple.pushButton_next, QtCore.Qt.LeftButton)
     qtbot.mouseClick(mw.tab_multiple.pushButton_next, QtCore.Qt.LeftButton)
     assert mw.tab_multiple.event_index == 8
+    wait_for_event_shown(mw.tab_multiple)
     qtbot.mouseClick(mw.tab_multiple.label_buttons[1].pushButton,
                      QtCore.Qt.LeftButton)
+    wait_for_event_shown(mw.tab_multiple)
     qtbot.mouseClick(mw.tab_multiple.label_buttons[1].pushButton,
                      QtCore.Qt.LeftButton)
     assert mw.tab_multiple.event_index == 10
@@ -213,8 +217,10 @@ def test_event_push_buttons(qtbot, mw):
     # go to the end and then test fast_next
     mw.tab_multiple.goto_event(16)
     assert mw.tab_multiple.event_index == 16
+    wait_for_event_shown(mw.tab_multiple)
     qtbot.mouseClick(mw.tab_multiple.label_buttons[1].pushButton,
                      QtCore.Qt.LeftButton)
+    wait_for_event_shown(mw.tab_multiple)
     qtbot.mouseClick(mw.tab_multiple.label_buttons[1].pushButton,
                      QtCore.Qt.LeftButton)
     qtbot.mouseClick(mw.tab_multiple.pushButton_prev, QtCore.Qt.LeftButton)
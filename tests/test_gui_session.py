@@ -58,5 +58,38 @@ def test_view_session(qtbot, mw):
     mw.on_action_open(path)
     assert mw.tab_session.plainTextEdit_logs.toPlainText().count(
         "ml_score_r1f")
+    assert mw.tab_session.label_label_counts.text() == \
+        "RBC singlet focused: 2 yes, 2 no, 14 unset"
     mw.on_action_close()
     assert mw.tab_session.plainTextEdit_logs.toPlainText() == "No session."
+
+
+def test_view_session_does_not_load_scores(qtbot, mw, monkeypatch):
+    """Showing the label counts does not load scores into the cache"""
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "dctag-tester") as dts:
+        dts.set_score("ml_score_r1f", 0, True)
+        dts.set_score("ml_score_r2f", 1, True)
+        dts.set_score("userdef1", 2, False)
+    read_features = []
+    float_to_tristate = session.float_to_tristate
+
+    def float_to_tristate_counted(data, *args, **kwargs):
+        read_features.append(data.name)
+        return float_to_tristate(data, *args, **kwargs)
+
+    monkeypatch.setattr(session, "float_to_tristate",
+                        float_to_tristate_counted)
+    mw.on_action_open(path)
+    mw.tabWidget.setCurrentIndex(0)
+    assert mw.tab_session.label_label_counts.text() == "\n".join([
+        "RBC singlet focused: 1 yes, 0 no, 17 unset",
+        "ML score R2F: 1 yes, 0 no, 17 unset",
+        "User-defined 1: 0 yes, 1 no, 17 unset"])
+    assert not mw.session.scores_cache
+    # the scores in the file are only counted once per session
+    mw.tab_session.update_session(mw.session)
+    assert sorted(read_features) == ["/events/ml_score_r1f",
+                                     "/events/ml_score_r2f",
+                                     "/events/userdef1"]
+    mw.on_action_close()
@@ -0,0 +1,173 @@
+import dclab
+import numpy as np
+import pytest
+from scipy.ndimage import binary_erosion
+
+from dctag import cache, session
+from dctag.gui import widget_vis
+from dctag.gui.widget_img import SimpleImageView
+
+from .helper import get_clean_data_path
+
+
+@pytest.mark.parametrize("dtype", [np.uint8, np.int16, float])
+def test_get_contour_images(dtype):
+    rng = np.random.default_rng(42)
+    images = rng.integers(-10, 300, size=(5, 20, 30)).astype(dtype)
+    masks = rng.random((5, 20, 30)) > 0.3
+    # include full and empty masks (border pixels are contour pixels)
+    masks[0] = True
+    masks[1] = False
+    out = np.zeros((5, 20, 30, 3), dtype=np.uint8)
+    contour_images = widget_vis.get_contour_images(images, masks, out=out)
+    assert contour_images is out
+    for ii in range(5):
+        contour = masks[ii] ^ binary_erosion(masks[ii])
+        expected = np.repeat(np.clip(images[ii], 0, 255)[..., np.newaxis],
+                             3, axis=2).astype(np.uint8)
+        expected[contour] = (178, 0, 0)
+        assert np.all(contour_images[ii] == expected)
+        # single-event function
+        data = {"image": images[ii], "mask": masks[ii]}
+        assert np.all(widget_vis.get_contour_image(data) == expected)
+
+
+def test_set_image_data(qtbot):
+    view = SimpleImageView()
+    qtbot.addWidget(view)
+    image = np.arange(80 * 250, dtype=np.uint8).reshape(80, 250)
+    view.set_image_data(image, (10, 20))
+    assert view.image is image
+    assert np.all(view.getImageItem().getLevels() == (10, 20))
+    # the image item is reused
+    item = view.getImageItem()
+    image2 = image[:, ::-1]
+    view.set_image_data(image2, (0, 255))
+    assert view.getImageItem() is item
+    assert view.image is image2
+    assert np.all(view.getImageItem().getLevels() == (0, 255))
+    # RGB image
+    image3 = np.zeros((80, 250, 3), dtype=np.uint8)
+    view.set_image_data(image3, (0, 178))
+    assert view.image is image3
+
+
+@pytest.mark.parametrize("chunk_size", [4, 7, 1000])
+def test_compute_density_image(chunk_size):
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "dctag-tester") as dts:
+        with dts.get_dataset() as ds:
+            area_um = np.array(ds["area_um"][:], dtype=float)
+            deform = np.array(ds["deform"][:], dtype=float)
+        image, rect = widget_vis.compute_density_image(
+            dts, "area_um", "deform", bins=(10, 5), chunk_size=chunk_size)
+        assert image.shape == (5, 10)
+        assert rect == (area_um.min(), deform.min(),
+                        area_um.max() - area_um.min(),
+                        deform.max() - deform.min())
+        hist, _, _ = np.histogram2d(deform, area_um, bins=(5, 10))
+        assert np.allclose(image, np.log1p(hist))
+        # fixed ranges exclude events outside
+        image, rect = widget_vis.compute_density_image(
+            dts, "area_um", "deform", xrange=(0, 50), yrange=(0, .1),
+            bins=(10, 5), chunk_size=chunk_size)
+        assert rect == (0, 0, 50, .1)
+        inside = (area_um <= 50) & (deform <= .1)
+        assert np.isclose(np.sum(np.expm1(image)), np.sum(inside))
+
+
+def test_set_fluorescence_traces(qtbot):
+    path = get_clean_data_path()
+    rng = np.random.default_rng(42)
+    traces = {key: rng.integers(0, 100, size=(18, 50), dtype=np.int16)
+              for key in ["fl1_raw", "fl1_median", "fl3_median"]}
+    with dclab.RTDCWriter(path, mode="append") as hw:
+        hw.store_metadata({"fluorescence": {"samples per event": 50,
+                                            "sample rate": 1e6}})
+        hw.store_feature("trace", traces)
+
+    vis = widget_vis.WidgetVisualize()
+    qtbot.addWidget(vis)
+    with session.DCTagSession(path, "dctag-tester") as dts:
+        config = vis.get_trace_config(dts)
+        # only one trace type per channel
+        assert config["keys"] == ["fl1_median", "fl3_median"]
+        assert np.allclose(config["time"], np.arange(50))
+        vis.set_event(dts, 3)
+        # traces are loaded with the event data
+        data = vis.get_event_data(dts, 3)
+        assert np.all(data["traces"]["fl3_median"] == traces["fl3_median"][3])
+        legend_items = list(vis.legend_trace.items)
+        assert len(legend_items) == 2
+        x, y = vis.trace_plots["fl1_median"].getOriginalDataset()
+        assert np.all(y == traces["fl1_median"][3])
+        assert not vis.trace_plots["fl1_raw"].isVisible()
+        # the legend is not rebuilt for the next event
+        vis.set_event(dts, 4)
+        assert vis.legend_trace.items == legend_items
+        x, y = vis.trace_plots["fl3_median"].getOriginalDataset()
+        assert np.all(y == traces["fl3_median"][4])
+        # traces are skipped if there is not enough time
+        vis.frame_budget = 1e-9
+        vis.set_event(dts, 5)
+        assert not vis.trace_plots["fl1_median"].isVisible()
+        vis.frame_budget = None
+        vis.set_event(dts, 6)
+        assert vis.trace_plots["fl1_median"].isVisible()
+        x, y = vis.trace_plots["fl1_median"].getOriginalDataset()
+        assert np.all(y == traces["fl1_median"][6])
+        vis.reset()
+
+
+def test_get_feature_data_blocks(qtbot, monkeypatch):
+    monkeypatch.setattr(widget_vis, "FEATURE_BLOCK_SIZE", 5)
+    path = get_clean_data_path()
+    vis = widget_vis.WidgetVisualize()
+    qtbot.addWidget(vis)
+    with session.DCTagSession(path, "dctag-tester") as dts:
+        with dts.get_dataset() as ds:
+            deform = ds["deform"][:]
+            chunks = ds["deform"].h5ds.chunks
+        # the block size is a multiple of the chunk size
+        assert vis.get_feature_block_size(dts, "deform") == chunks[0]
+        monkeypatch.setattr(vis, "get_feature_block_size",
+                            lambda session, feature: 5)
+        # only the blocks covering the indices are read
+        assert np.all(vis.get_feature_data(dts, "deform", slice(6, 9))
+                      == deform[6:9])
+        assert (dts, ("feature", "deform", 1)) in widget_vis.FEATURE_CACHE
+        assert (dts, ("feature", "deform", 0)) not in widget_vis.FEATURE_CACHE
+        assert vis.get_feature_data(dts, "deform", 12) == deform[12]
+        assert vis.get_feature_data(dts, "deform", -1) == deform[-1]
+        indices = np.array([17, 0, 3, 11, 3, 6])
+        assert np.all(vis.get_feature_data(dts, "deform", indices)
+                      == deform[indices])
+        assert np.all(vis.get_feature_data(dts, "deform") == deform)
+        assert vis.get_feature_data(dts, "deform", []).size == 0
+    vis.session = dts
+    vis.reset()
+    assert (dts, ("feature", "deform", 1)) not in widget_vis.FEATURE_CACHE
+
+
+def test_get_event_block_independent_events(qtbot):
+    """Cached events do not keep the arrays of the whole block alive"""
+    path = get_clean_data_path()
+    vis = widget_vis.WidgetVisualize()
+    qtbot.addWidget(vis)
+    with session.DCTagSession(path, "dctag-tester") as dts:
+        block = vis.get_event_block(dts, 0, 4)
+        for key in ["image", "mask", "image_contour"]:
+            assert block[0][key].base is None
+            assert not np.shares_memory(block[0][key], block[1][key])
+        for trace in block[0]["traces"].values():
+            assert trace.base is None
+        # the cropped image is a view of the image (counted once)
+        assert np.shares_memory(block[0]["image_cropped"], block[0]["image"])
+        arrays = [block[0][key] for key in ["image", "mask", "image_contour"]]
+        arrays += list(block[0]["traces"].values())
+        nbytes_arrays = sum(arr.nbytes for arr in arrays)
+        assert block[0]["image_cropped"].nbytes > 1000
+        nbytes = cache.get_nbytes(block[0])
+        assert nbytes_arrays < nbytes < nbytes_arrays + 1000
+    vis.session = dts
+    vis.reset()
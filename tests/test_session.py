@@ -1,3 +1,9 @@
+import os
+import shutil
+import threading
+import time
+from unittest import mock
+
 import pytest
 
 import dclab
@@ -18,6 +24,82 @@ def test_basic():
     assert not lock_path.exists()
 
 
+def test_basic_open_once():
+    """The file should only be opened once when starting a session"""
+    path = get_clean_data_path()
+    with h5py.File(path, "a") as h5:
+        h5["events/ml_score_abc"] = np.zeros(18)
+    with mock.patch.object(session.h5py, "File",
+                           wraps=h5py.File) as mock_file, \
+            mock.patch.object(session.dclab, "new_dataset") as mock_ds:
+        dts = session.DCTagSession(path, "Peter")
+        assert mock_file.call_count == 1
+        assert not mock_ds.called
+    assert dts.event_count == 18
+    assert dts.get_score_features() == ["ml_score_abc"]
+    dts.close()
+
+
+def test_get_event_count():
+    path = get_clean_data_path()
+    with h5py.File(path, "a") as h5:
+        assert session.get_event_count(h5) == 18
+        del h5.attrs["experiment:event count"]
+        assert session.get_event_count(h5) == 18
+
+
+def test_coalesce_scores_basic():
+    scores = [("ml_score_abc", 5, True),
+              ("ml_score_abc", 2, False),
+              ("ml_score_abd", 1, True),
+              ("ml_score_abc", 5, np.nan),
+              ("ml_score_abc", 2, True),
+              ]
+    updates = session.coalesce_scores(scores)
+    assert sorted(updates.keys()) == ["ml_score_abc", "ml_score_abd"]
+    idx, val = updates["ml_score_abc"]
+    assert np.all(idx == [2, 5])
+    assert val[0] == 1
+    assert np.isnan(val[1])
+    idx, val = updates["ml_score_abd"]
+    assert np.all(idx == [1])
+    assert np.all(val == [1])
+
+
+def test_coalesce_scores_arrays():
+    scores = [("ml_score_abc", 3, True),
+              ("ml_score_abc", np.array([1, 3, 4]), np.array([1., 0, 0])),
+              ("ml_score_abc", 4, np.nan),
+              ("ml_score_abc", np.array([7, 6]), False),
+              ]
+    idx, val = session.coalesce_scores(scores)["ml_score_abc"]
+    assert np.all(idx == [1, 3, 4, 6, 7])
+    assert np.allclose(val, [1, 0, np.nan, 0, 0], equal_nan=True)
+
+
+def test_coalesce_scores_linked():
+    linked = ["ml_score_001", "ml_score_002", "ml_score_003"]
+    scores = [("ml_score_001", 0, True),
+              ("ml_score_002", 0, True),
+              ("ml_score_003", 1, True),
+              ("ml_score_003", 1, False),
+              ("ml_score_ot1", 2, True),
+              ]
+    updates = session.coalesce_scores(scores, linked)
+    idx, val = updates["ml_score_001"]
+    assert np.all(idx == [0, 1])
+    assert np.all(val == [0, 0])
+    idx, val = updates["ml_score_002"]
+    assert np.all(idx == [0, 1])
+    assert np.all(val == [1, 0])
+    idx, val = updates["ml_score_003"]
+    assert np.all(idx == [0, 1])
+    assert np.all(val == [0, 0])
+    idx, val = updates["ml_score_ot1"]
+    assert np.all(idx == [2])
+    assert np.all(val == [1])
+
+
 def test_is_dctag_session():
     path = get_clean_data_path()
     assert not session.is_dctag_session(path)
@@ -39,6 +121,149 @@ def test_flush_with_missing_file_error():
                 dts.flush()
 
 
+def test_float_to_tristate():
+    data = np.array([np.nan, 0, 1, 0.2, 0.7, np.nan])
+    tristate = session.float_to_tristate(data, chunk_size=4)
+    assert tristate.dtype == np.int8
+    assert np.all(tristate == [-1, 0, 1, 0, 1, -1])
+    data2 = session.tristate_to_float(tristate)
+    assert np.allclose(data2, [np.nan, 0, 1, 0, 1, np.nan], equal_nan=True)
+
+
+def test_flush_error_requeue():
+    path = get_clean_data_path()
+    path_moved = path.with_name("moved.rtdc")
+    dts = session.DCTagSession(path, "Peter")
+    dts.set_score("ml_score_abc", 0, True)
+    dts.set_score("ml_score_abc", 1, False)
+    path.rename(path_moved)
+    with pytest.raises(session.DCTagSessionWriteError):
+        dts.flush()
+    # nothing should be lost
+    dts.set_score("ml_score_abc", 2, True)
+    assert dts.scores == [("ml_score_abc", 0, True),
+                          ("ml_score_abc", 1, False),
+                          ("ml_score_abc", 2, True)]
+    assert dts.history["ml_score_abc count True"] == 2
+    assert dts.history["ml_score_abc count False"] == 1
+    # the share is back
+    path_moved.rename(path)
+    dts.close()
+
+    with dclab.new_dataset(path) as ds:
+        assert np.all(ds["ml_score_abc"][:3] == [1, 0, 1])
+        dctaglog = "\n".join(ds.logs["dctag-history"])
+        assert "ml_score_abc count True: 2" in dctaglog
+
+
+def test_flush_does_not_block_labeling():
+    path = get_clean_data_path()
+    writing = threading.Event()
+    proceed = threading.Event()
+
+    with session.DCTagSession(path, "Peter") as dts:
+        write_scores_orig = dts._write_scores
+
+        def write_scores_slow(*args, **kwargs):
+            writing.set()
+            assert proceed.wait(timeout=10)
+            write_scores_orig(*args, **kwargs)
+
+        dts._write_scores = write_scores_slow
+        dts.set_score("ml_score_abc", 0, True)
+        thread = threading.Thread(target=dts.flush)
+        thread.start()
+        assert writing.wait(timeout=10)
+        # flush is in progress, but we can still label
+        dts.set_score("ml_score_abc", 1, True)
+        assert dts.get_score("ml_score_abc", 0) is True
+        assert dts.get_score("ml_score_abc", 1) is True
+        assert dts.scores == [("ml_score_abc", 1, True)]
+        proceed.set()
+        thread.join()
+        # the journal only contains the score set during the flush
+        dts.journal.sync()
+        records = session.read_journal(dts.path_journal)
+        assert records.size == 1
+        assert records[0]["index"] == 1
+
+    with dclab.new_dataset(path) as ds:
+        assert np.all(ds["ml_score_abc"][:2] == [1, 1])
+
+
+def test_flush_does_not_block_reading(monkeypatch):
+    """Reading from the session file is possible during a slow flush"""
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "Peter") as dts:
+        dts.set_score("ml_score_abc", 0, True)
+
+    with session.DCTagSession(path, "Peter") as dts:
+        writing = threading.Event()
+        proceed = threading.Event()
+        write_sparse = session.write_sparse
+
+        def write_sparse_slow(*args, **kwargs):
+            writing.set()
+            assert proceed.wait(timeout=10)
+            return write_sparse(*args, **kwargs)
+
+        monkeypatch.setattr(session, "write_sparse", write_sparse_slow)
+        dts.set_score("ml_score_abd", 0, True)
+        thread = threading.Thread(target=dts.flush)
+        thread.start()
+        assert writing.wait(timeout=10)
+        # don't wait forever if reading is blocked
+        timer = threading.Timer(5, proceed.set)
+        timer.start()
+        t0 = time.monotonic()
+        # loading scores from the file
+        assert dts.get_score("ml_score_abc", 0) is True
+        # reading event data
+        with dts.get_dataset() as ds:
+            assert len(ds["deform"][:]) == 18
+        assert time.monotonic() - t0 < 2
+        proceed.set()
+        thread.join()
+        timer.cancel()
+
+    with dclab.new_dataset(path) as ds:
+        assert ds["ml_score_abc"][0] == 1
+        assert ds["ml_score_abd"][0] == 1
+
+
+def test_load_scores_does_not_block_labeling(monkeypatch):
+    """Scores are read from the file without holding the score lock"""
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "Peter") as dts:
+        dts.set_score("ml_score_abc", 0, True)
+
+    with session.DCTagSession(path, "Peter") as dts:
+        reading = threading.Event()
+        proceed = threading.Event()
+        float_to_tristate = session.float_to_tristate
+
+        def float_to_tristate_slow(*args, **kwargs):
+            reading.set()
+            assert proceed.wait(timeout=10)
+            return float_to_tristate(*args, **kwargs)
+
+        monkeypatch.setattr(session, "float_to_tristate",
+                            float_to_tristate_slow)
+        result = []
+        thread = threading.Thread(
+            target=lambda: result.append(dts.get_score("ml_score_abc", 0)))
+        thread.start()
+        assert reading.wait(timeout=10)
+        # we can still label while the scores are being read
+        assert dts.score_lock.acquire(timeout=2)
+        dts.score_lock.release()
+        dts.set_score("ml_score_abd", 1, True)
+        proceed.set()
+        thread.join()
+        assert result == [True]
+        assert dts.get_score("ml_score_abd", 1) is True
+
+
 def test_get_score_basic():
     path = get_clean_data_path()
     with session.DCTagSession(path, "Peter") as dts:
@@ -61,6 +286,48 @@ def test_get_score_basic():
         assert np.isnan(dts.get_score("ml_score_ukn", 3))
 
 
+def test_get_score_cache_int8():
+    path = get_clean_data_path()
+    with dclab.RTDCWriter(path) as hw:
+        hw.store_feature("ml_score_prd", np.linspace(0, 1, 18))
+    with session.DCTagSession(path, "Peter") as dts:
+        dts.set_score("ml_score_abc", 0, True)
+        assert dts.get_score("ml_score_prd", 0) is False
+        assert dts.get_score("ml_score_prd", 17) is True
+        assert dts.scores_cache["ml_score_abc"].dtype == np.int8
+        assert dts.scores_cache["ml_score_prd"].dtype == np.int8
+        assert np.isnan(dts.get_score("ml_score_abc", 1))
+
+
+def test_get_score_lazy_loading():
+    path = get_clean_data_path()
+    with dclab.RTDCWriter(path) as hw:
+        hw.store_feature("ml_score_prd", np.linspace(0, 1, 18))
+        hw.store_feature("userdef1", np.linspace(1, 0, 18))
+    with session.DCTagSession(path, "Peter") as dts:
+        assert dts.get_score_features() == ["ml_score_prd", "userdef1"]
+        assert not dts.scores_cache
+        dts.load_scores(["ml_score_prd", "ml_score_ukn"])
+        assert list(dts.scores_cache.keys()) == ["ml_score_prd"]
+        assert dts.get_scores_true(0) == ["userdef1"]
+        assert dts.get_scores_true(0, features=["ml_score_prd"]) == []
+        assert sorted(dts.scores_cache.keys()) == ["ml_score_prd",
+                                                   "userdef1"]
+        # setting scores of features on disk must not discard the others
+        dts.set_score("ml_score_prd", 1, True)
+        dts.set_score("ml_score_abc", 1, True)
+        assert dts.get_score_features() == [
+            "ml_score_abc", "ml_score_prd", "userdef1"]
+
+    with session.DCTagSession(path, "Peter") as dts:
+        dts.set_score("userdef1", 2, False)
+        assert dts.get_score("userdef1", 0) is True
+        assert dts.get_score("userdef1", 2) is False
+        assert dts.get_score("ml_score_prd", 1) is True
+        assert dts.get_score("ml_score_prd", 2) is False
+        assert dts.get_score("ml_score_prd", 17) is True
+
+
 def test_get_score_linked():
     path = get_clean_data_path()
     with session.DCTagSession(
@@ -337,6 +604,186 @@ def test_set_score_with_linked_features():
         assert np.isnan(ds["ml_score_ot2"][4])
 
 
+def test_set_score_many_write_sparse():
+    path = get_clean_data_path()
+    rng = np.random.default_rng(42)
+    indices = rng.integers(0, 18, size=200)
+    values = rng.integers(0, 2, size=200).astype(bool)
+    expected = np.full(18, np.nan)
+    with session.DCTagSession(path, "Peter") as dts:
+        for idx, val in zip(indices, values):
+            dts.set_score("ml_score_abc", int(idx), bool(val))
+            expected[idx] = val
+        dts.reset_score("ml_score_abc", 17)
+        expected[17] = np.nan
+
+    with dclab.new_dataset(path) as ds:
+        assert np.allclose(ds["ml_score_abc"][:], expected, equal_nan=True)
+
+
+def test_write_sparse():
+    path = get_clean_data_path().with_name("sparse.h5")
+    indices = np.array([0, 1, 2, 10, 5000, 10000, 10005, 20000])
+    values = np.arange(indices.size, dtype=float)
+    with h5py.File(path, "w") as h5:
+        ds = h5.create_dataset("data", data=np.full(30000, np.nan))
+        session.write_sparse(ds, indices, values, chunk_size=100)
+        data = ds[:]
+    expected = np.full(30000, np.nan)
+    expected[indices] = values
+    assert np.allclose(data, expected, equal_nan=True)
+
+
+def test_write_sparse_only_touched_chunks():
+    """Sparse scores do not fill the chunks in between"""
+    path = get_clean_data_path().with_name("sparse.h5")
+    indices = np.arange(250) * 4000 + 7
+    values = np.ones(indices.size)
+    with h5py.File(path, "w") as h5:
+        ds = session.create_h5_score_dataset(h5, "data", size=1_000_000)
+        session.write_sparse(ds, indices, values)
+        assert ds.id.get_num_chunks() == 250
+        data = ds[:]
+    expected = np.full(1_000_000, np.nan)
+    expected[indices] = values
+    assert np.array_equal(data, expected, equal_nan=True)
+
+
+def test_set_score_h5_dataset_chunked():
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "Peter") as dts:
+        dts.set_score("ml_score_abc", 0, True)
+    with h5py.File(path, "r") as h5:
+        ds = h5["events/ml_score_abc"]
+        assert ds.chunks == (18,)
+        assert ds.compression is not None
+        assert ds[0] == 1
+        assert np.all(np.isnan(ds[1:]))
+
+
+def test_set_score_h5_dataset_migrate_contiguous():
+    path = get_clean_data_path()
+    data = np.full(18, np.nan)
+    data[3] = 0
+    with h5py.File(path, "a") as h5:
+        h5["events"].create_dataset("ml_score_abc", data=data)
+        h5["events/ml_score_abc"].attrs["hans"] = "peter"
+        assert h5["events/ml_score_abc"].chunks is None
+    with session.DCTagSession(path, "Peter") as dts:
+        dts.set_score("ml_score_abc", 0, True)
+    with h5py.File(path, "r") as h5:
+        ds = h5["events/ml_score_abc"]
+        assert ds.chunks is not None
+        assert ds.attrs["hans"] == "peter"
+        assert ds[0] == 1
+        assert ds[3] == 0
+        assert np.isnan(ds[1])
+
+
+def test_set_score_h5_dataset_migrate_only_written():
+    """Linked features that are not written are not migrated"""
+    path = get_clean_data_path()
+    with h5py.File(path, "a") as h5:
+        for feat in ["ml_score_abc", "ml_score_abd"]:
+            h5["events"].create_dataset(feat, data=np.full(18, np.nan))
+    with session.DCTagSession(path, "Peter") as dts:
+        dts.linked_features = ["ml_score_abc", "ml_score_abd"]
+        dts.set_score("ml_score_abc", 0, False)
+    with h5py.File(path, "r") as h5:
+        assert h5["events/ml_score_abc"].chunks is not None
+        assert h5["events/ml_score_abd"].chunks is None
+
+
+@pytest.mark.parametrize("deleted", [True, False])
+def test_set_score_h5_dataset_migrate_interrupted(deleted):
+    """A migration interrupted by a crash does not lose any scores"""
+    path = get_clean_data_path()
+    data = np.full(18, np.nan)
+    data[3] = 0
+    with h5py.File(path, "a") as h5:
+        events = h5["events"]
+        if deleted:
+            # crash after the original dataset was deleted
+            session.create_h5_score_dataset(
+                events, "ml_score_abc_dctag_migrate", data=data)
+        else:
+            # crash before the original dataset was deleted
+            events.create_dataset("ml_score_abc", data=data)
+            session.create_h5_score_dataset(
+                events, "ml_score_abc_dctag_migrate", size=18)
+    with session.DCTagSession(path, "Peter") as dts:
+        assert dts.get_score_features() == ["ml_score_abc"]
+        assert dts.get_score("ml_score_abc", 3) is False
+        dts.set_score("ml_score_abc", 0, True)
+    with h5py.File(path, "r") as h5:
+        assert "ml_score_abc_dctag_migrate" not in h5["events"]
+        ds = h5["events/ml_score_abc"]
+        assert ds.chunks is not None
+        assert ds[0] == 1
+        assert ds[3] == 0
+        assert np.isnan(ds[1])
+
+
+def test_set_scores_basic():
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "Peter") as dts:
+        dts.set_score("ml_score_abc", 0, True)
+        dts.set_scores("ml_score_abc", [1, 2, 3, 2], [True, False, True, True])
+        dts.set_scores("ml_score_abd", np.arange(5, 10), False)
+        dts.reset_scores("ml_score_abd", [5, 6])
+        assert dts.count_pending_scores() == 12
+        assert dts.get_score("ml_score_abc", 0) is True
+        assert dts.get_score("ml_score_abc", 2) is True
+        assert np.isnan(dts.get_score("ml_score_abd", 5))
+        assert dts.get_score("ml_score_abd", 7) is False
+        assert dts.history["ml_score_abc count True"] == 4
+        assert dts.history["ml_score_abc count False"] == 1
+        assert dts.history["ml_score_abd count False"] == 5
+        assert dts.history["ml_score_abd count reset"] == 2
+        with pytest.raises(ValueError, match="Expected 'ml_score_xxx' or"):
+            dts.set_scores("volume", [0], True)
+
+    with dclab.new_dataset(path) as ds:
+        assert np.all(ds["ml_score_abc"][:4] == 1)
+        assert np.all(np.isnan(ds["ml_score_abc"][4:]))
+        assert np.all(np.isnan(ds["ml_score_abd"][:7]))
+        assert np.all(ds["ml_score_abd"][7:10] == 0)
+        assert np.all(np.isnan(ds["ml_score_abd"][10:]))
+
+
+def test_set_scores_with_linked_features():
+    path = get_clean_data_path()
+    linked = ["ml_score_001", "ml_score_002"]
+    expected = [(0, True, False),
+                (1, False, np.nan),
+                (2, np.nan, np.nan),
+                (3, False, False),
+                (4, False, True),
+                ]
+    with session.DCTagSession(path, "Peter", linked_features=linked) as dts:
+        dts.set_scores("ml_score_001", [0, 1, 2], [True, False, True])
+        # True followed by False still implies False for the others
+        dts.set_scores("ml_score_002", [3, 3], [True, False])
+        dts.set_scores("ml_score_002", [4], True)
+        dts.reset_scores("ml_score_001", [2])
+        for idx, exp1, exp2 in expected:
+            for feat, exp in [("ml_score_001", exp1), ("ml_score_002", exp2)]:
+                val = dts.get_score(feat, idx)
+                if exp is np.nan:
+                    assert np.isnan(val)
+                else:
+                    assert val is exp
+
+    with session.DCTagSession(path, "Peter") as dts:
+        for idx, exp1, exp2 in expected:
+            for feat, exp in [("ml_score_001", exp1), ("ml_score_002", exp2)]:
+                val = dts.get_score(feat, idx)
+                if exp is np.nan:
+                    assert np.isnan(val)
+                else:
+                    assert val is exp
+
+
 def test_set_score_wrong_feature_error():
     path = get_clean_data_path()
     with session.DCTagSession(path, "Peter") as dts:
@@ -346,6 +793,25 @@ def test_set_score_wrong_feature_error():
             dts.set_score("ml_flore_abc", 0, True)
 
 
+def test_set_score_feature_name_too_long_error():
+    """Feature names must fit into the session journal"""
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "Peter") as dts:
+        dts.set_score("userdef_16_chars", 0, True)
+        with pytest.raises(ValueError, match="is too long"):
+            dts.set_score("userdef_very_long_name", 0, True)
+        with pytest.raises(ValueError, match="is too long"):
+            dts.set_scores("userdef_very_long_name", [0, 1], True)
+        with pytest.raises(ValueError, match="is too long"):
+            dts.reset_score("userdef_very_long_name", 0)
+        assert "userdef_very_long_name" not in dts.scores_cache
+        assert len(dts.scores) == 1
+        # the journal only contains the valid feature name
+        dts.journal.sync()
+        records = session.read_journal(dts.path_journal)
+        assert np.all(records["feature"] == b"userdef_16_chars")
+
+
 def test_session_autocomplete_linked_features():
     path = get_clean_data_path()
     with session.DCTagSession(path, "Peter") as dts:
@@ -406,6 +872,32 @@ def test_session_autocomplete_linked_features_error():
             dts.autocomplete_linked_features()
 
 
+def test_session_autocomplete_linked_features_bulk():
+    """Autocompleted scores are recorded as one update per feature"""
+    path = get_clean_data_path()
+    linked = ["ml_score_001", "ml_score_002", "ml_score_003"]
+    with session.DCTagSession(path, "Peter") as dts:
+        dts.set_scores("ml_score_001", np.arange(0, 10, 2), True)
+        dts.set_scores("ml_score_002", [1, 3], True)
+        dts.set_score("ml_score_003", 0, False)
+        dts.flush()
+        dts.linked_features = linked
+        dts.autocomplete_linked_features()
+        assert len(dts.scores) == 3
+        for (feat, indices, value), expected in zip(dts.scores, [
+                [1, 3], [0, 2, 4, 6, 8], [1, 2, 3, 4, 6, 8]]):
+            assert value is False
+            assert np.all(indices == expected)
+        # nothing left to autocomplete
+        dts.autocomplete_linked_features()
+        assert len(dts.scores) == 3
+
+    with dclab.new_dataset(path) as ds:
+        np.testing.assert_array_equal(
+            ds["ml_score_003"][:10],
+            [0, 0, 0, 0, 0, np.nan, 0, np.nan, 0, np.nan])
+
+
 def test_session_backup_scores():
     path = get_clean_data_path()
     linked = ["ml_score_001", "ml_score_002"]
@@ -538,6 +1030,120 @@ def test_session_error_locked():
     assert lock_path.exists()
 
 
+def test_session_recover_journal():
+    path = get_clean_data_path()
+    linked = ["ml_score_001", "ml_score_002"]
+    dts = session.DCTagSession(path, "Peter", linked_features=linked)
+    dts.set_score("ml_score_001", 0, True)
+    dts.set_score("ml_score_ot1", 1, True)
+    dts.set_score("ml_score_ot1", 2, False)
+    dts.set_score("ml_score_002", 3, True)
+    dts.reset_score("ml_score_ot1", 1)
+    # simulate a crash
+    dts.journal.close()
+    del dts
+    assert path.with_suffix(".dctag-journal").exists()
+
+    with pytest.raises(session.DCTagSessionLockedError,
+                       match="recover the previous session"):
+        session.DCTagSession(path, "Peter")
+
+    with session.DCTagSession(path, "Peter", recover=True) as dts:
+        assert dts.get_score("ml_score_001", 0) is True
+        assert dts.get_score("ml_score_002", 0) is False
+        assert np.isnan(dts.get_score("ml_score_ot1", 1))
+        assert dts.get_score("ml_score_ot1", 2) is False
+        assert dts.get_score("ml_score_001", 3) is False
+        assert dts.get_score("ml_score_002", 3) is True
+        assert not dts.path_journal.exists()
+        assert dts.history["journal records recovered"] == 7
+
+    assert not path.with_suffix(".dctag-journal").exists()
+    with dclab.new_dataset(path) as ds:
+        assert ds["ml_score_001"][0] == 1
+        assert ds["ml_score_002"][3] == 1
+        assert "journal records recovered: 7" in "\n".join(
+            ds.logs["dctag-history"])
+
+
+def test_session_recover_journal_incomplete_record():
+    path = get_clean_data_path()
+    dts = session.DCTagSession(path, "Peter")
+    dts.set_score("ml_score_abc", 0, True)
+    dts.set_score("ml_score_abc", 1, False)
+    dts.journal.close()
+    # simulate an incomplete record
+    with dts.path_journal.open("ab") as fd:
+        fd.write(b"ml_score_abc")
+    del dts
+
+    with session.DCTagSession(path, "Peter", recover=True) as dts:
+        assert dts.get_score("ml_score_abc", 0) is True
+        assert dts.get_score("ml_score_abc", 1) is False
+
+
+def test_session_flush_clears_journal():
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "Peter") as dts:
+        dts.set_score("ml_score_abc", 0, True)
+        dts.journal.sync()
+        records = session.read_journal(dts.path_journal)
+        assert records.size == 1
+        assert records[0]["feature"] == b"ml_score_abc"
+        assert records[0]["index"] == 0
+        assert records[0]["value"] == 1
+        dts.flush()
+        dts.journal.sync()
+        assert session.read_journal(dts.path_journal).size == 0
+        dts.reset_score("ml_score_abc", 0)
+        dts.journal.sync()
+        assert session.read_journal(dts.path_journal)[0]["value"] == -1
+    assert not dts.path_journal.exists()
+
+
+def test_session_journal_does_not_block_labeling(monkeypatch):
+    """Slow journal storage does not delay setting scores"""
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "Peter") as dts:
+        proceed = threading.Event()
+        open_file = dts.journal._open_file
+
+        def open_file_slow():
+            assert proceed.wait(timeout=10)
+            return open_file()
+
+        monkeypatch.setattr(dts.journal, "_open_file", open_file_slow)
+        for ii in range(5):
+            dts.set_score("ml_score_abc", ii, True)
+        # the records are still queued
+        assert not dts.path_journal.exists()
+        assert dts.journal.count == 5
+        proceed.set()
+        dts.journal.sync()
+        assert session.read_journal(dts.path_journal).size == 5
+
+
+def test_session_journal_write_error():
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "Peter") as dts:
+        dts.set_score("ml_score_abc", 0, True)
+        dts.journal.sync()
+        dts.journal._fd.close()
+        fd = mock.MagicMock()
+        fd.write.side_effect = OSError("share is gone")
+        dts.journal._fd = fd
+        with pytest.warns(session.DCTagSessionJournalWarning,
+                          match="Could not write to the session journal"):
+            dts.set_score("ml_score_abc", 1, True)
+            dts.journal.sync()
+        # the broken file handle is closed and the journal is reopened
+        fd.close.assert_called_once()
+        dts.set_score("ml_score_abc", 2, True)
+        dts.journal.sync()
+        records = session.read_journal(dts.path_journal)
+        assert np.all(records["index"] == [0, 2])
+
+
 def test_session_error_wronguser():
     path = get_clean_data_path()
     with session.DCTagSession(path, "Peter"):
@@ -566,6 +1172,120 @@ def test_session_error_wronguser_override():
             assert False, "session-claim string missing in log"
 
 
+def test_session_handles_reuse():
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "Peter") as dts:
+        with dts.get_dataset() as ds:
+            deform = ds["deform"][:]
+            # nested borrowing
+            with dts.get_dataset() as ds2:
+                assert ds2 is ds
+        with dts.get_dataset() as ds:
+            assert np.all(ds["deform"][:] == deform)
+        assert dts.handles.open_count == 1
+        # creating a score dataset reopens the handle
+        dts.set_score("ml_score_abc", 0, True)
+        dts.flush()
+        with dts.get_dataset() as ds:
+            assert ds["ml_score_abc"][0] == 1
+        assert dts.handles.open_count == 2
+        # writing to an existing dataset does not
+        dts.set_score("ml_score_abc", 1, True)
+        dts.flush()
+        with dts.get_dataset() as ds:
+            assert ds.h5file["events/ml_score_abc"][1] == 1
+        assert dts.handles.open_count == 2
+        # nothing to write
+        dts.flush()
+        with dts.get_dataset() as ds:
+            pass
+        assert dts.handles.open_count == 2
+        # errors discard the handle
+        with pytest.raises(OSError):
+            with dts.get_dataset() as ds:
+                raise OSError("Share is gone")
+        with dts.get_dataset() as ds:
+            pass
+        assert dts.handles.open_count == 3
+    # the dataset is not reopened after the session is closed
+    with pytest.raises(session.DCTagSessionClosedError):
+        with dts.get_dataset():
+            pass
+
+
+def test_session_handles_reopen_replaced_file():
+    """Handles are reopened when the file changes (e.g. remounted share)"""
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "Peter") as dts:
+        with dts.get_dataset() as ds:
+            assert "ml_score_abc" not in ds
+        # replace the file with a modified copy
+        path_copy = path.with_name("copy.rtdc")
+        shutil.copy2(path, path_copy)
+        with h5py.File(path_copy, "a") as h5:
+            h5["events/ml_score_abc"] = np.ones(18)
+        os.replace(path_copy, path)
+        with dts.get_dataset() as ds:
+            assert "ml_score_abc" in ds
+        assert dts.handles.open_count == 2
+
+
+def test_session_writer_flush():
+    path = get_clean_data_path()
+    flushed = threading.Event()
+    errors = []
+
+    def callback(error):
+        errors.append(error)
+        flushed.set()
+
+    with session.DCTagSession(path, "Peter") as dts:
+        writer = dts.start_writer(callback=callback,
+                                  max_pending=2,
+                                  min_interval=0,
+                                  poll_interval=0.01)
+        assert dts.start_writer() is writer
+        dts.set_score("ml_score_abc", 0, True)
+        dts.set_score("ml_score_abc", 1, False)
+        assert flushed.wait(timeout=10)
+        assert errors == [None]
+        assert not dts.scores
+        with dclab.new_dataset(path) as ds:
+            assert np.all(ds["ml_score_abc"][:2] == [1, 0])
+    assert not writer.is_alive()
+    assert dts.writer is None
+
+
+def test_session_writer_policy():
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "Peter") as dts:
+        writer = session.DCTagSessionWriter(dts,
+                                            max_pending=2,
+                                            max_interval=60,
+                                            min_interval=1,
+                                            latency_factor=10)
+        assert not writer.should_flush()
+        dts.set_score("ml_score_abc", 0, True)
+        dts.set_score("ml_score_abc", 1, True)
+        writer.last_flush -= 1.5
+        assert writer.should_flush()
+        # slow storage
+        writer.latency = 0.5
+        assert writer.get_interval() == 5
+        assert not writer.should_flush()
+        # failed flushes
+        writer.failures = 2
+        assert writer.get_interval() == 20
+        writer.failures = 10
+        assert writer.get_interval() == 60
+        # maximum interval
+        writer.last_flush -= 60
+        assert writer.should_flush()
+        writer.flush()
+        assert writer.failures == 0
+        assert not writer.should_flush()
+
+
 def test_session_get_scores_true_basic():
     path = get_clean_data_path()
     with session.DCTagSession(path, "Peter") as dts:
@@ -596,6 +1316,84 @@ def test_session_get_scores_true_basic_userdef():
         assert dts.get_scores_true(4) == []
 
 
+def test_session_find_unlabeled():
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "Peter") as dts:
+        dts.set_score("ml_score_abc", 0, True)
+        dts.set_score("ml_score_abc", 1, False)
+        # single feature: unset scores
+        assert dts.find_unlabeled("ml_score_abc", 0) == 2
+        assert dts.find_unlabeled("ml_score_abc", 1, direction=-1) == -1
+        # linked features: no True score
+        linked = ["ml_score_abc", "ml_score_abd"]
+        assert dts.find_unlabeled(linked, 0) == 1
+        # the bitsets are updated incrementally
+        dts.reset_score("ml_score_abc", 1)
+        dts.set_score("ml_score_abd", 1, True)
+        assert dts.find_unlabeled("ml_score_abc", 0) == 1
+        assert dts.find_unlabeled(linked, 0) == 2
+        dts.set_scores("ml_score_abc", np.arange(2, 17), False)
+        assert dts.find_unlabeled("ml_score_abc", 2) == 17
+        assert dts.find_unlabeled("ml_score_abc", 16, direction=-1) == 1
+        dts.set_scores("ml_score_abd", np.arange(2, 18), True)
+        assert dts.find_unlabeled(linked, 0) == -1
+        dts.reset_scores("ml_score_abd", [5, 7])
+        assert dts.find_unlabeled(linked, 0) == 5
+        assert dts.find_unlabeled(linked, 17, direction=-1) == 7
+
+
+def test_session_get_events_without_true():
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "Peter") as dts:
+        dts.set_score("ml_score_abc", 0, True)
+        dts.set_score("ml_score_abc", 1, False)
+        dts.set_score("ml_score_abd", 2, True)
+        dts.set_score("ml_score_abe", 3, True)
+        mask = dts.get_events_without_true(["ml_score_abc", "ml_score_abd"])
+        assert mask.size == 18
+        assert np.all(mask == [False, True, False] + [True] * 15)
+        mask = dts.get_events_without_true(["ml_score_abc", "ml_score_ukn"],
+                                           start=0, stop=4)
+        assert np.all(mask == [False, True, True, True])
+        assert np.all(dts.get_events_without_true([], start=16))
+
+
+def test_session_get_label_states():
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "Peter") as dts:
+        dts.set_score("ml_score_abc", 0, True)
+        dts.set_score("ml_score_abc", 1, False)
+        dts.set_score("ml_score_abd", 0, True)
+        dts.set_score("ml_score_abd", 2, True)
+        states = dts.get_label_states("ml_score_abc")
+        assert states.size == 18
+        assert np.all(states == [1, 0] + [-1] * 16)
+        states = dts.get_label_states("ml_score_abc", np.array([1, 5]))
+        assert np.all(states == [0, -1])
+        assert np.all(dts.get_label_states("ml_score_ukn") == -1)
+        # the first True feature determines the class
+        states = dts.get_label_states(
+            ["ml_score_ukn", "ml_score_abc", "ml_score_abd"],
+            np.arange(4))
+        assert np.all(states == [1, -1, 2, -1])
+
+
+def test_session_get_scores_true_many_features():
+    """The label matrix is enlarged in steps of eight features"""
+    path = get_clean_data_path()
+    features = [f"ml_score_{ii:03d}" for ii in range(20)]
+    with session.DCTagSession(path, "Peter") as dts:
+        for ii, feat in enumerate(features):
+            dts.set_score(feat, ii % 18, True)
+            dts.set_score(feat, 17, ii % 2 == 0)
+        assert dts.label_matrix.shape == (18, 24)
+        assert dts.get_scores_true(0) == ["ml_score_000", "ml_score_018"]
+        assert dts.get_scores_true(17) == features[0:18:2] + ["ml_score_018"]
+        for ii, feat in enumerate(features):
+            assert dts.get_score(feat, 17) is (ii % 2 == 0)
+            assert np.shares_memory(dts.scores_cache[feat], dts.label_matrix)
+
+
 def test_session_get_scores_true_linked():
     path = get_clean_data_path()
     with session.DCTagSession(path, "Peter") as dts:
@@ -667,3 +1465,39 @@ def test_session_warning_closed_flush():
     with pytest.warns(session.DCTagSessionClosedWarning,
                       match="flush the session"):
         dts.flush()
+
+
+def test_session_get_label_counts():
+    path = get_clean_data_path()
+    with session.DCTagSession(path, "Peter") as dts:
+        dts.set_score("ml_score_abc", 0, True)
+        dts.set_score("ml_score_abc", 1, False)
+        dts.set_score("ml_score_abc", 1, True)
+        dts.set_scores("ml_score_abd", [2, 3, 4, 3], [True, False, True, True])
+        dts.set_scores("ml_score_abd", np.arange(5, 10), False)
+        dts.reset_scores("ml_score_abd", [5, 6, 6])
+        dts.reset_score("ml_score_abc", 0)
+        dts.linked_features = ["ml_score_abc", "ml_score_abd",
+                               "ml_score_abe"]
+        dts.autocomplete_linked_features()
+        dts.set_score("ml_score_abe", 11, True)
+        for feat in dts.linked_features:
+            unset, false, true = np.bincount(
+                dts.scores_cache[feat] + 1, minlength=3)
+            assert dts.get_label_counts(feat) == {"true": true,
+                                                  "false": false,
+                                                  "unset": unset,
+                                                  "labeled": true + false}
+        assert dts.get_label_counts("ml_score_abc") == {
+            "true": 1, "false": 4, "unset": 13, "labeled": 5}
+        assert dts.get_label_counts("ml_score_ukn") == {
+            "true": 0, "false": 0, "unset": 18, "labeled": 0}
+    # counts of scores in the file (without loading them)
+    with session.DCTagSession(path, "Peter") as dts:
+        assert dts.get_label_counts("ml_score_abc") == {
+            "true": 1, "false": 4, "unset": 13, "labeled": 5}
+        assert not dts.scores_cache
+        # counts of scores loaded from the file
+        dts.load_scores(["ml_score_abc"])
+        assert dts.get_label_counts("ml_score_abc") == {
+            "true": 1, "false": 4, "unset": 13, "labeled": 5}